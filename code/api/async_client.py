@@ -0,0 +1,312 @@
+import asyncio
+import ssl
+import time
+import threading
+from contextlib import asynccontextmanager
+
+from flask import current_app
+
+from api.client import SumoLogicClient
+from api.errors import (
+    SumoLogicSSLError,
+    SumoLogicConnectionError,
+    SumoLogicTimeoutError,
+    CriticalSumoLogicResponseError,
+)
+from api.messages import aiter_messages
+from api.instrumentation import timed
+from api.scheduler import get_scheduler
+
+try:
+    import httpx
+    import certifi
+except ImportError:
+    httpx = None
+
+RETRY_METHODS = frozenset({"GET", "DELETE"})
+RETRY_STATUSES = frozenset({429, 502, 503, 504})
+# raised while a response body is read, when it is not read in time
+READ_TIMEOUTS = (TimeoutError,) if httpx is None else (TimeoutError, httpx.TimeoutException)
+
+_ssl_context = None
+_ssl_context_lock = threading.Lock()
+
+
+class _ThreadedResponse:
+    """
+    Streamed response of the pooled requests session read in worker threads,
+    used in place of an httpx response when httpx is not installed.
+    Reading the body past the timeout of the request raises TimeoutError.
+    """
+
+    def __init__(self, response):
+        self._response = response
+        self.status_code = response.status_code
+        self.is_success = response.ok
+
+    async def aread(self):
+        return await self._read(lambda: self._response.content)
+
+    async def aiter_bytes(self, chunk_size):
+        chunks = self._response.iter_content(chunk_size)
+        while (chunk := await self._read(next, chunks, None)) is not None:
+            yield chunk
+
+    @staticmethod
+    async def _read(func, *args):
+        from requests.exceptions import ConnectionError
+
+        try:
+            return await asyncio.to_thread(func, *args)
+        except ConnectionError:
+            # raised by requests when the body is not read in time
+            raise TimeoutError()
+
+    async def aclose(self):
+        self._response.close()
+
+
+class AsyncSumoLogicClient(SumoLogicClient):
+    """
+    SumoLogicClient for async views: search jobs are polled with asyncio.sleep
+    and Sumo Logic is called without blocking the event loop, through httpx when it
+    is installed and through the pooled session in worker threads otherwise.
+    Queries, caches and results are handled by the sync client.
+    Use it as an async context manager, so its connections are closed with the request's event loop.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._http = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+    async def aclose(self):
+        if self._http is not None:
+            await self._http.aclose()
+
+    async def health(self):
+        return await self._request(path="healthEvents", params={"limit": 1})
+
+    async def get_messages(self, observable):
+        search_jobs = self._sighting_searches([observable])
+        return (await self._sighting_results(search_jobs, await self._get_data(*search_jobs)))[observable]
+
+    async def get_crowd_strike_data(self, observable):
+        return (await self.get_crowd_strike_data_bulk([observable]))[observable]
+
+    async def get_crowd_strike_data_bulk(self, observables):
+        cached, search_jobs = self._crowd_strike_lookups(observables)
+        results = await self._get_data(*search_jobs)
+        return self._crowd_strike_results(cached, search_jobs, results)
+
+    async def get_messages_and_crowd_strike_data(self, observable):
+        sighting_jobs = self._sighting_searches([observable])
+        cached, crowd_strike_jobs = self._crowd_strike_lookups([observable])
+
+        results = iter(await self._get_data(*sighting_jobs, *crowd_strike_jobs))
+        messages = await self._sighting_results(sighting_jobs, [next(results) for _ in sighting_jobs])
+        crowd_strike_data = self._crowd_strike_results(cached, crowd_strike_jobs, list(results))
+        return messages[observable], crowd_strike_data[observable]
+
+    async def get_messages_and_crowd_strike_data_batch(self, observables):
+        batches, batch_jobs, delta_jobs, cached, crowd_strike_jobs = self._batch_searches(observables)
+
+        results = iter(await self._get_data(*batch_jobs, *delta_jobs, *crowd_strike_jobs))
+        batch_results = [next(results) for _ in batch_jobs]
+        messages = await self._sighting_results(delta_jobs, [next(results) for _ in delta_jobs])
+        crowd_strike_data = self._crowd_strike_results(cached, crowd_strike_jobs, list(results))
+
+        for batch, search_job, batch_messages in zip(batches, batch_jobs, batch_results):
+            messages.update(await self._demultiplex_messages(batch, search_job, batch_messages))
+        return [(messages[observable], crowd_strike_data[observable]) for observable in observables]
+
+    async def _demultiplex_messages(self, observables, search_job, messages):
+        assigned, incomplete = self._assign_messages(observables, search_job, messages)
+        if incomplete:
+            search_jobs = [self._messages_search(observable) for observable in incomplete]
+            assigned.update(await self._sighting_results(search_jobs, await self._get_data(*search_jobs)))
+        return assigned
+
+    async def _sighting_results(self, search_jobs, results):
+        messages, resync = self._merge_sighting_results(search_jobs, results)
+        if resync:
+            search_jobs = [self._messages_search(observable) for observable in resync]
+            messages.update(await self._sighting_results(search_jobs, await self._get_data(*search_jobs)))
+        return messages
+
+    async def _get_data(self, *search_jobs):
+        if not current_app.config["COALESCE_SEARCHES"]:
+            return await self._execute(search_jobs)
+
+        leading, following = self._join_flights(search_jobs)
+        try:
+            results = dict(zip([job for job, _ in leading], await self._execute([job for job, _ in leading])))
+        except BaseException as error:
+            self._land_flights(leading, error=error)
+            raise
+        self._land_flights(leading, results)
+
+        for search_job, flight in following:
+            # the job leading the flight may be polled by another worker thread
+            if await asyncio.to_thread(flight.wait, self._flight_timeout()) and not self._leader_abandoned(flight):
+                results[search_job] = self._follow(search_job, flight)
+            else:
+                (results[search_job],) = await self._execute([search_job])
+        return [results[search_job] for search_job in search_jobs]
+
+    async def _execute(self, search_jobs):
+        scheduler = get_scheduler(*self._tenant)
+        try:
+            await self._run_jobs(search_jobs, scheduler)
+        except BaseException:
+            self._reap_jobs(search_jobs)
+            raise
+        finally:
+            self._release_tickets(search_jobs, scheduler)
+        return self._collect_results(search_jobs)
+
+    async def _run_jobs(self, search_jobs, scheduler):
+        steps = self._job_steps(search_jobs, scheduler)
+        resume, value = steps.send, None
+        while True:
+            try:
+                method, args = resume(value)
+            except StopIteration:
+                return
+            try:
+                resume, value = steps.send, await getattr(self, method)(*args)
+            except Exception as error:
+                resume, value = steps.throw, error
+
+    async def _poll(self, search_job):
+        waited = time.time() - search_job.last_check_time if search_job.last_check_time else 0
+        self._record_status(search_job, await self._check_status(search_job.id), waited)
+
+    async def _poll_all(self, search_jobs):
+        await asyncio.gather(*[self._poll(search_job) for search_job in search_jobs])
+
+    @staticmethod
+    async def _sleep(seconds):
+        with timed("sleep"):
+            await asyncio.sleep(seconds)
+
+    async def _create_search(self, search_query, search_time_range, current_time=None):
+        payload = self._search_payload(search_query, search_time_range, current_time)
+        with timed("create"):
+            search_result = await self._request(path="search/jobs", method="POST", body=payload)
+        return search_result.get("id")
+
+    async def _check_status(self, search_id):
+        with timed("status"):
+            return await self._request(path=f"search/jobs/{search_id}")
+
+    async def _get_messages(self, search_id, limit=None, observables=None, projection=None):
+        params = {"offset": 0, "limit": limit or self._entities_limit}
+        chunk_size = current_app.config["MESSAGES_CHUNK_SIZE"]
+        with timed("messages"):
+            async with self._send(f"search/jobs/{search_id}/messages", params=params) as response:
+                return [
+                    self._trim_message(message, observables, projection)
+                    async for message in aiter_messages(response.aiter_bytes(chunk_size))
+                ]
+
+    async def _delete_job(self, search_id):
+        with timed("delete"):
+            if current_app.config["SEARCH_JOB_REAPER"]:
+                self._reap_job(search_id)
+            else:
+                await self._request(path=f"search/jobs/{search_id}", method="DELETE")
+
+    async def _request(self, path, method="GET", body=None, params=None):
+        async with self._send(path, method, body, params) as response:
+            return current_app.json.loads(await response.aread())
+
+    @asynccontextmanager
+    async def _send(self, path, method="GET", body=None, params=None):
+        """
+        Send a request and yield its streamed response once it is known to be successful.
+        """
+        url = "/".join([self._url, path.lstrip("/")])
+        start = time.perf_counter()
+        try:
+            if httpx is None:
+                response = _ThreadedResponse(
+                    await asyncio.to_thread(self._send_request, method, url, body, params, stream=True)
+                )
+            else:
+                response = await self._send_http(method, url, body, params)
+            try:
+                if not response.is_success:
+                    text = (await response.aread()).decode(errors="replace")
+                    raise CriticalSumoLogicResponseError(response.status_code, text, url)
+                yield response
+            except READ_TIMEOUTS:
+                raise SumoLogicTimeoutError(self._url)
+            finally:
+                await response.aclose()
+        finally:
+            self._observe_request(method, path, start)
+
+    async def _send_http(self, method, url, body=None, params=None):
+        """
+        Send a request with httpx. Like the pooled session, only idempotent calls
+        are retried on throttling and gateway errors.
+        """
+        if self._http is None:
+            self._http = httpx.AsyncClient(
+                auth=self._auth,
+                headers=self._headers,
+                cookies=self._cookies,
+                timeout=None,
+                limits=httpx.Limits(max_connections=current_app.config["SUMO_POOL_SIZE"]),
+                transport=httpx.AsyncHTTPTransport(
+                    verify=get_ssl_context(), retries=current_app.config["SUMO_MAX_RETRIES"]
+                ),
+            )
+
+        retries = current_app.config["SUMO_MAX_RETRIES"] if method in RETRY_METHODS else 0
+        for attempt in range(retries + 1):
+            try:
+                request = self._http.build_request(
+                    method, url, json=body, params=params, timeout=self._request_timeout()
+                )
+                response = await self._http.send(request, stream=True)
+            except httpx.TimeoutException:
+                raise SumoLogicTimeoutError(self._url)
+            except httpx.ConnectError as error:
+                cause = _ssl_cause(error)
+                if cause is not None:
+                    raise SumoLogicSSLError(cause)
+                raise SumoLogicConnectionError(self._url)
+            except (httpx.TransportError, httpx.InvalidURL):
+                raise SumoLogicConnectionError(self._url)
+
+            if response.status_code not in RETRY_STATUSES or attempt == retries:
+                return response
+            await response.aclose()
+            await asyncio.sleep(current_app.config["SUMO_RETRY_BACKOFF_FACTOR"] * 2**attempt)
+
+
+def get_ssl_context():
+    """
+    Get the SSL context of the current worker process, shared by the httpx clients
+    of all requests, as loading the CA bundle takes longer than most Sumo Logic calls.
+    """
+    global _ssl_context
+    with _ssl_context_lock:
+        if _ssl_context is None:
+            _ssl_context = ssl.create_default_context(cafile=certifi.where())
+        return _ssl_context
+
+
+def _ssl_cause(error):
+    while error is not None:
+        if isinstance(error, ssl.SSLError):
+            return error
+        error = error.__cause__ or error.__context__
+    return None
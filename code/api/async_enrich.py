@@ -0,0 +1,93 @@
+from functools import partial
+
+from flask import Blueprint, g, current_app
+
+from api.errors import TRFormattedError
+from api.utils import (
+    get_tenant,
+    get_deadline,
+    jsonify_result,
+    jsonify_lines,
+    wants_stream,
+    gather_concurrently,
+)
+from api.enrich import get_observables, map_observable, map_verdicts, stream_observe, refer_observables
+from api.async_client import AsyncSumoLogicClient
+from api.scheduler import PRIORITY_DELIBERATE
+
+async_enrich_api = Blueprint("async_enrich", __name__)
+
+# refer makes no Sumo Logic calls, so it is shared with the sync views
+async_enrich_api.add_url_rule("/refer/observables", view_func=refer_observables, methods=["POST"])
+
+
+async def observe(tenant, client, observable):
+    messages, crowd_strike_data = await client.get_messages_and_crowd_strike_data(observable["value"])
+    return map_observable(tenant, observable, messages, crowd_strike_data)
+
+
+async def observe_all(tenant, client, observables):
+    """
+    Get the sightings, judgements and verdicts of every observable in order.
+    All search jobs of the request are polled from its event loop,
+    bounded only by the search job scheduler of the tenant.
+    """
+    if current_app.config["BATCH_SIGHTING_SEARCH"]:
+        data = await client.get_messages_and_crowd_strike_data_batch(
+            [observable["value"] for observable in observables]
+        )
+        return [
+            map_observable(tenant, observable, messages, crowd_strike_data)
+            for observable, (messages, crowd_strike_data) in zip(observables, data)
+        ]
+    return await gather_concurrently(partial(observe, tenant, client), observables)
+
+
+def replay(results, error=None):
+    """
+    Yield results gathered up front, then raise the error that stopped gathering the rest.
+    """
+    yield from results
+    if error is not None:
+        raise error
+
+
+@async_enrich_api.route("/observe/observables", methods=["POST"])
+async def observe_observables():
+    tenant = get_tenant()
+    observables = get_observables()
+
+    async with AsyncSumoLogicClient(tenant, get_deadline()) as client:
+        if wants_stream():
+            try:
+                results = replay(await observe_all(tenant, client, observables))
+            except TRFormattedError as error:
+                results = replay([], error)
+            return jsonify_lines(stream_observe(observables, results))
+
+        results = await observe_all(tenant, client, observables)
+
+    g.sightings = []
+    g.judgements = []
+    g.verdicts = []
+
+    for sightings, judgements, verdicts in results:
+        g.sightings.extend(sightings)
+        g.judgements.extend(judgements)
+        g.verdicts.extend(verdicts)
+
+    return jsonify_result()
+
+
+@async_enrich_api.route("/deliberate/observables", methods=["POST"])
+async def deliberate_observables():
+    tenant = get_tenant()
+    observables = get_observables()
+
+    async with AsyncSumoLogicClient(tenant, get_deadline(), PRIORITY_DELIBERATE) as client:
+        crowd_strike_data_bulk = await client.get_crowd_strike_data_bulk(
+            [observable["value"] for observable in observables]
+        )
+    g.verdicts = map_verdicts(observables, crowd_strike_data_bulk)
+
+    return jsonify_result()
@@ -0,0 +1,157 @@
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+from flask import current_app
+
+try:
+    import uwsgi
+except ImportError:
+    uwsgi = None
+
+MISSING = object()
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+class LRUCache:
+    """
+    Thread-safe LRU cache with a bounded size.
+    Every entry expires at its own time, or after the default TTL if none is given.
+    """
+
+    def __init__(self, maxsize, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.time():
+                del self._entries[key]
+                return default
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, expires_at=None):
+        if expires_at is None and self.ttl is not None:
+            expires_at = time.time() + self.ttl
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class MemoryBackend:
+    """
+    Cache backend private to the current worker process.
+    """
+
+    def __init__(self, maxsize):
+        self._cache = LRUCache(maxsize)
+
+    def get(self, key):
+        return self._cache.get(key, MISSING)
+
+    def set(self, key, value, ttl):
+        self._cache.set(key, value, expires_at=time.time() + ttl)
+
+
+class UWSGIBackend:
+    """
+    Cache backend shared by all uwsgi workers through the uwsgi caching framework.
+    Values are stored as JSON. Values larger than a block of the uwsgi cache
+    cannot be stored there and are kept in a cache private to the worker instead.
+    """
+
+    def __init__(self, cache_name, block_size, maxsize):
+        self.cache_name = cache_name
+        self.block_size = block_size
+        self._local = MemoryBackend(maxsize)
+
+    def get(self, key):
+        value = uwsgi.cache_get(key, self.cache_name)
+        return self._local.get(key) if value is None else json.loads(value)
+
+    def set(self, key, value, ttl):
+        encoded = json.dumps(value).encode()
+        if len(encoded) > self.block_size or not uwsgi.cache_update(key, encoded, int(ttl), self.cache_name):
+            uwsgi.cache_del(key, self.cache_name)
+            self._local.set(key, value, ttl)
+
+
+class Cache:
+    """
+    Named cache over a pluggable backend, counting hits and misses.
+    None is a valid value, so negative results can be cached too;
+    a miss is signalled with MISSING.
+    """
+
+    def __init__(self, name, backend, ttl):
+        self.name = name
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def key(self, *parts):
+        digest = hashlib.sha256("\x1f".join(str(part) for part in parts).encode()).hexdigest()
+        return f"{self.name}:{digest}"
+
+    def get(self, *parts):
+        value = self.backend.get(self.key(*parts))
+        with self._lock:
+            if value is MISSING:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def set(self, value, *parts):
+        self.backend.set(self.key(*parts), value, self.ttl)
+
+
+def get_cache(name, maxsize, ttl, shared=True):
+    """
+    Get the named cache of the current worker process.
+    CACHE_BACKEND chooses between the in-process "memory" backend
+    and the "uwsgi" backend shared across workers, which falls back
+    to memory when the app does not run under uwsgi.
+    Caches of values that mostly do not fit a uwsgi cache block are never shared.
+    """
+    with _caches_lock:
+        if name not in _caches:
+            if shared and current_app.config["CACHE_BACKEND"] == "uwsgi" and uwsgi is not None:
+                backend = UWSGIBackend(
+                    current_app.config["UWSGI_CACHE_NAME"], current_app.config["UWSGI_CACHE_BLOCK_SIZE"], maxsize
+                )
+            else:
+                backend = MemoryBackend(maxsize)
+            _caches[name] = Cache(name, backend, ttl)
+        return _caches[name]
+
+
+def cache_stats():
+    with _caches_lock:
+        return {name: {"hits": cache.hits, "misses": cache.misses} for name, cache in _caches.items()}
@@ -1,14 +1,14 @@
+import re
 import time
-import json
 from http import HTTPStatus
+from http.cookiejar import CookieJar
 
-import requests
-from requests.exceptions import SSLError, ConnectionError, MissingSchema, InvalidSchema, InvalidURL
 from flask import current_app
 
 from api.errors import (
     SumoLogicSSLError,
     SumoLogicConnectionError,
+    SumoLogicTimeoutError,
     CriticalSumoLogicResponseError,
     SearchJobWrongStateError,
     SearchJobNotStartedError,
@@ -16,6 +16,69 @@ from api.errors import (
     MoreMessagesAvailableWarning,
 )
 from api.utils import add_error
+from api.session import get_session
+from api.polling import PollSchedule
+from api.cache import get_cache, MISSING
+from api.reaper import get_reaper
+from api.singleflight import SingleFlight
+from api.messages import iter_messages
+from api.mapping import SIGHTING_MESSAGE_FIELDS
+from api.projection import FieldProjection, SOURCE_CATEGORY_FIELD, RAW_EXCERPT_FIELD
+from api.instrumentation import timed, observe, count
+from api.scheduler import Ticket, get_scheduler, PRIORITY_OBSERVE
+
+_searches_in_flight = SingleFlight()
+
+# characters that never delimit the tokens of Sumo Logic keyword search
+TOKEN_CHAR = r"[^\W_]"
+
+SEARCH_JOB_ID = re.compile(r"(?<=search/jobs/)[^/]+")
+
+
+def keyword_match(text, keyword):
+    """
+    Whether a casefolded text contains the keyword the way Sumo Logic keyword search
+    would find it: True where it stands between delimiters, None where it only stands
+    next to an underscore, which may or may not delimit tokens, and False otherwise,
+    so that 1.2.3.4 is not found in 11.2.3.45.
+    """
+    keyword = re.escape(keyword.casefold())
+    if re.search(rf"(?<!\w){keyword}(?!\w)", text):
+        return True
+    if re.search(rf"(?<!{TOKEN_CHAR}){keyword}(?!{TOKEN_CHAR})", text):
+        return None
+    return False
+
+
+class SearchJob:
+    """
+    State of a single Sumo Logic search job while it is being polled.
+    """
+
+    def __init__(self, observable, search_type, search_query, search_time_range):
+        self.observable = observable
+        self.search_type = search_type
+        self.search_query = search_query
+        self.search_time_range = search_time_range
+        self.observables = [observable]
+        self.cached = None
+        self.to_time = None
+        self.messages_limit = None
+        self.warn_on_more_messages = True
+        self.demultiplex = False
+        self.id = None
+        self.status = None
+        self.finished = False
+        self.fetched_early = False
+        self.abandoned = False
+        self.ticket = None
+        self.messages = []
+        self.deleted = False
+        self.start_time = None
+        self.poll_schedule = None
+        self.last_check_time = None
+        self.next_check_time = None
+        self.warnings = []
 
 
 class SumoLogicClient:
@@ -24,112 +87,861 @@ class SumoLogicClient:
     CANCELLED = "CANCELLED"
     NOT_STARTED = "NOT STARTED"
     SEARCH_JOB_MAX_TIME = 50
+    # shortest wait for a response, for the calls still made past the deadline, such as deletions
+    MIN_REQUEST_TIMEOUT = 1
+    CROWD_STRIKE_LOOKUP_DELIMITER = ","
 
-    def __init__(self, credentials):
-        self._credentials = credentials
+    def __init__(self, tenant, deadline=None, priority=PRIORITY_OBSERVE):
+        self._tenant_context = tenant
+        self._deadline = deadline
+        self._priority = priority
         self._headers = {"User-Agent": current_app.config["USER_AGENT"]}
-        self._entities_limit = current_app.config["CTR_ENTITIES_LIMIT"]
+        self._entities_limit = tenant.entities_limit
         self._entities_limit_default = current_app.config["CTR_ENTITIES_LIMIT_DEFAULT"]
+        self._projection = FieldProjection.from_config(current_app.config)
+        # Sumo Logic ties a search job to the cookies set when it is created
+        self._cookies = CookieJar()
 
     @property
     def _url(self):
-        url = current_app.config["SUMO_API_ENDPOINT"]
-        return url.format(host=self._credentials.get("host"))
+        return self._tenant_context.api_url
+
+    @property
+    def _session(self):
+        return get_session(
+            self._tenant_context.host,
+            current_app.config["SUMO_POOL_SIZE"],
+            current_app.config["SUMO_MAX_RETRIES"],
+            current_app.config["SUMO_RETRY_BACKOFF_FACTOR"],
+        )
+
+    @property
+    def _tenant(self):
+        return self._tenant_context.key
 
     @property
     def _auth(self):
-        return self._credentials.get("access_id"), self._credentials.get("access_key")
+        return self._tenant_context.access_id, self._tenant_context.access_key
 
     def health(self):
         return self._request(path="healthEvents", params={"limit": 1})
 
-    def _request(self, path, method="GET", body=None, params=None, data_extractor=lambda r: r.json()):
+    def _request(
+        self,
+        path,
+        method="GET",
+        body=None,
+        params=None,
+        data_extractor=lambda r: current_app.json.loads(r.content),
+        stream=False,
+    ):
+        from requests.exceptions import ConnectionError
+
         url = "/".join([self._url, path.lstrip("/")])
+        start = time.perf_counter()
 
         try:
-            response = requests.request(method, url, json=body, params=params, auth=self._auth, headers=self._headers)
+            with self._send_request(method, url, body, params, stream) as response:
+                if response.ok:
+                    try:
+                        return data_extractor(response)
+                    except ConnectionError:
+                        # raised by requests when a streamed body is not read in time
+                        raise SumoLogicTimeoutError(self._url)
+
+                raise CriticalSumoLogicResponseError(response.status_code, response.text, url)
+        finally:
+            self._observe_request(method, path, start)
+
+    def _send_request(self, method, url, body=None, params=None, stream=False):
+        from requests.exceptions import SSLError, ConnectionError, Timeout, MissingSchema, InvalidSchema, InvalidURL
+
+        try:
+            response = self._session.request(
+                method,
+                url,
+                json=body,
+                params=params,
+                auth=self._auth,
+                headers=self._headers,
+                cookies=self._cookies,
+                stream=stream,
+                timeout=self._request_timeout(),
+            )
         except SSLError as error:
             raise SumoLogicSSLError(error)
+        except Timeout:
+            raise SumoLogicTimeoutError(self._url)
         except (ConnectionError, MissingSchema, InvalidSchema, InvalidURL):
             raise SumoLogicConnectionError(self._url)
         except UnicodeEncodeError:
             raise CriticalSumoLogicResponseError(HTTPStatus.UNAUTHORIZED)
+        for cookie in response.cookies:
+            self._cookies.set_cookie(cookie)
+        return response
 
-        if response.ok:
-            return data_extractor(response)
-
-        raise CriticalSumoLogicResponseError(response.status_code, response.text, url)
+    @staticmethod
+    def _observe_request(method, path, start):
+        endpoint = SEARCH_JOB_ID.sub("{id}", path.lstrip("/"))
+        observe("relay_sumo_request_seconds", time.perf_counter() - start, path=f"{method} {endpoint}")
 
     def get_messages(self, observable):
-        search_type = "Sumo Logic"
-        search_query = f'"{observable}" | limit 101'
+        search_jobs = self._sighting_searches([observable])
+        return self._sighting_results(search_jobs, self._get_data(*search_jobs))[observable]
+
+    def get_crowd_strike_data(self, observable):
+        return self.get_crowd_strike_data_bulk([observable])[observable]
+
+    def get_crowd_strike_data_bulk(self, observables):
+        """
+        Resolve the CrowdStrike intel for all observables with one lookup job per batch.
+        Returns a mapping of observable to the intel, or None when there is none.
+        """
+        cached, search_jobs = self._crowd_strike_lookups(observables)
+        results = self._get_data(*search_jobs)
+        return self._crowd_strike_results(cached, search_jobs, results)
+
+    def get_messages_and_crowd_strike_data(self, observable):
+        """
+        Run the sighting search and the CrowdStrike lookup side by side,
+        so the latency is that of the slower job rather than of both.
+        """
+        sighting_jobs = self._sighting_searches([observable])
+        cached, crowd_strike_jobs = self._crowd_strike_lookups([observable])
+
+        results = iter(self._get_data(*sighting_jobs, *crowd_strike_jobs))
+        messages = self._sighting_results(sighting_jobs, [next(results) for _ in sighting_jobs])
+        crowd_strike_data = self._crowd_strike_results(cached, crowd_strike_jobs, list(results))
+        return messages[observable], crowd_strike_data[observable]
+
+    def get_messages_and_crowd_strike_data_batch(self, observables):
+        """
+        Search sightings for all observables with one OR-ed search job per batch
+        and assign every returned message back to the observables it contains.
+        The bulk CrowdStrike lookups are polled in the same status loop.
+        Returns (messages, crowd_strike_data) pairs in the order of observables.
+        """
+        batches, batch_jobs, delta_jobs, cached, crowd_strike_jobs = self._batch_searches(observables)
+
+        results = iter(self._get_data(*batch_jobs, *delta_jobs, *crowd_strike_jobs))
+        batch_results = [next(results) for _ in batch_jobs]
+        messages = self._sighting_results(delta_jobs, [next(results) for _ in delta_jobs])
+        crowd_strike_data = self._crowd_strike_results(cached, crowd_strike_jobs, list(results))
+
+        for batch, search_job, batch_messages in zip(batches, batch_jobs, batch_results):
+            messages.update(self._demultiplex_messages(batch, search_job, batch_messages))
+        return [(messages[observable], crowd_strike_data[observable]) for observable in observables]
+
+    def _batch_searches(self, observables):
+        """
+        Build the search jobs of a batch: one OR-ed search per batch of uncached observables,
+        one search since the last one per cached observable and the CrowdStrike lookups.
+        Returns the batches, their jobs, the jobs of cached observables,
+        the cached intel and the lookup jobs.
+        """
+        unique_observables = list(dict.fromkeys(observables))
+        cached_sightings = self._cached_sightings(unique_observables)
+        delta_jobs = [
+            self._messages_search(observable, cached_sightings[observable]) for observable in cached_sightings
+        ]
+        uncached = [observable for observable in unique_observables if observable not in cached_sightings]
+
+        batch_size = current_app.config["SIGHTING_SEARCH_BATCH_SIZE"]
+        batches = [uncached[start:][:batch_size] for start in range(0, len(uncached), batch_size)]
+        batch_jobs = [self._messages_batch_search(batch) for batch in batches]
+        cached, crowd_strike_jobs = self._crowd_strike_lookups(unique_observables)
+        return batches, batch_jobs, delta_jobs, cached, crowd_strike_jobs
+
+    def _messages_batch_search(self, observables):
+        keywords = " OR ".join(f'"{observable}"' for observable in observables)
+        messages_limit = (self._entities_limit_default + 1) * len(observables)
+        search_job = SearchJob(
+            ", ".join(observables),
+            search_type="Sumo Logic",
+            search_query=f"({keywords}) | limit {messages_limit}{self._fields_clause(raw_excerpt=False)}",
+            search_time_range=current_app.config["THIRTY_DAYS_IN_SECONDS"] * 10**3,
+        )
+        search_job.observables = observables
+        search_job.messages_limit = messages_limit
+        search_job.warn_on_more_messages = False
+        search_job.demultiplex = True
+        return search_job
+
+    def _demultiplex_messages(self, observables, search_job, messages):
+        """
+        Assign the messages of a batch search to the observables found in their _raw,
+        keeping the per-observable limit and MoreMessagesAvailableWarning rules.
+        Observables that may have been crowded out of a saturated batch
+        are searched again one by one.
+        """
+        assigned, incomplete = self._assign_messages(observables, search_job, messages)
+        if incomplete:
+            search_jobs = [self._messages_search(observable) for observable in incomplete]
+            assigned.update(self._sighting_results(search_jobs, self._get_data(*search_jobs)))
+        return assigned
+
+    def _assign_messages(self, observables, search_job, messages):
+        """
+        Split the messages of a batch search between its observables.
+        Returns the messages of every observable and the observables to search again:
+        those that may have been crowded out and those found in a message ambiguously.
+        """
+        assigned = {observable: [] for observable in observables}
+        unclear = set()
+        for message in messages:
+            for observable in message["observables"]:
+                assigned[observable].append(message)
+            unclear.update(message["unclear"])
+
+        saturated = search_job.status["messageCount"] >= search_job.messages_limit
+        incomplete = [
+            observable
+            for observable in observables
+            if observable in unclear or (saturated and len(assigned[observable]) <= self._entities_limit_default)
+        ]
+
+        for observable in observables:
+            if observable in incomplete:
+                continue
+            if len(assigned[observable]) > self._entities_limit_default:
+                add_error(MoreMessagesAvailableWarning(observable))
+            if search_job.finished:
+                self._cache_sightings(observable, assigned[observable], search_job.to_time)
+            assigned[observable] = assigned[observable][: self._entities_limit]
+        return assigned, incomplete
+
+    @property
+    def _sighting_cache(self):
+        return get_cache(
+            "sightings",
+            current_app.config["SIGHTING_CACHE_SIZE"],
+            current_app.config["SIGHTING_CACHE_TTL"],
+            shared=False,
+        )
+
+    def _cached_sightings(self, observables):
+        cached = {}
+        for observable in observables:
+            entry = self._sighting_cache.get(*self._tenant, observable)
+            if entry is not MISSING:
+                cached[observable] = entry
+        return cached
+
+    def _cache_sightings(self, observable, messages, to_time):
+        entry = {"messages": messages[: self._entities_limit_default + 1], "to": to_time}
+        self._sighting_cache.set(entry, *self._tenant, observable)
+
+    def _sighting_searches(self, observables):
+        """
+        Build one sighting search per observable. Observables searched recently
+        are only searched since their last search, with a small overlap.
+        """
+        cached = self._cached_sightings(observables)
+        return [self._messages_search(observable, cached.get(observable)) for observable in observables]
+
+    def _sighting_results(self, search_jobs, results):
+        """
+        Merge the messages found by sighting searches with the cached ones
+        and cache the result. Returns a mapping of observable to its messages.
+        """
+        messages, resync = self._merge_sighting_results(search_jobs, results)
+        if resync:
+            search_jobs = [self._messages_search(observable) for observable in resync]
+            messages.update(self._sighting_results(search_jobs, self._get_data(*search_jobs)))
+        return messages
+
+    def _merge_sighting_results(self, search_jobs, results):
+        """
+        Returns the messages of every observable and the observables
+        whose cached sightings cannot be merged and must be searched again.
+        """
+        messages = {}
+        resync = []
+        for search_job, job_messages in zip(search_jobs, results):
+            observable = search_job.observable
+            if search_job.cached is not None:
+                job_messages = self._merge_sightings(search_job.cached, job_messages, search_job.to_time)
+                if job_messages is None:
+                    resync.append(observable)
+                    continue
+                if len(job_messages) > self._entities_limit_default:
+                    add_error(MoreMessagesAvailableWarning(observable))
+            if search_job.finished:
+                self._cache_sightings(observable, job_messages, search_job.to_time)
+            messages[observable] = job_messages[: self._entities_limit]
+        return messages, resync
+
+    def _merge_sightings(self, cached, messages, to_time):
+        """
+        Put the new messages before the cached ones, dropping duplicates from the overlap
+        and messages that aged out of the 30 days window. Returns None when the cached search
+        hit the limit and aged out below it, since older messages it never returned could now
+        be among the latest ones.
+        """
+        limit = self._entities_limit_default + 1
+        window_start = to_time - current_app.config["THIRTY_DAYS_IN_SECONDS"] * 10**3
+
+        merged = {}
+        for message in [*messages, *cached["messages"]]:
+            merged.setdefault(message["map"].get("_messageid"), message)
+        merged = sorted(
+            (message for message in merged.values() if int(message["map"]["_messagetime"]) >= window_start),
+            key=lambda message: int(message["map"]["_messagetime"]),
+            reverse=True,
+        )
+
+        if len(cached["messages"]) >= limit and len(merged) < limit:
+            return None
+        return merged[:limit]
+
+    def _fields_clause(self, raw_excerpt=True):
+        return self._projection.clause(raw_excerpt) if self._projection is not None else ""
+
+    def _messages_search(self, observable, cached=None):
         search_time_range = current_app.config["THIRTY_DAYS_IN_SECONDS"] * 10**3
-        first_check_request_delay = 0
-        check_request_delay = 3
-        messages = self._get_data(
-            observable, search_type, search_query, search_time_range, first_check_request_delay, check_request_delay
+        if cached is not None:
+            since_last_search = int(time.time()) * 10**3 - cached["to"]
+            overlap = current_app.config["SIGHTING_CACHE_OVERLAP"] * 10**3
+            search_time_range = min(since_last_search + overlap, search_time_range)
+
+        search_job = SearchJob(
+            observable,
+            search_type="Sumo Logic",
+            search_query=f'"{observable}" | limit 101{self._fields_clause()}',
+            search_time_range=search_time_range,
+        )
+        search_job.cached = cached
+        search_job.messages_limit = self._entities_limit_default + 1
+        search_job.warn_on_more_messages = cached is None
+        return search_job
+
+    @staticmethod
+    def _crowd_strike_search(observable):
+        return SearchJob(
+            observable,
+            search_type="Crowd Strike",
+            search_query=(
+                f'| limit 1 | "{observable}" as observable | lookup ' "raw from sumo://threat/cs on threat=observable"
+            ),
+            search_time_range=current_app.config["FIFTEEN_MINS_IN_SECONDS"] * 10**3,
+        )
+
+    def _crowd_strike_bulk_searches(self, observables):
+        """
+        Build lookup jobs resolving many observables each: the values are joined
+        into one field and split back into rows with parse regex multi.
+        Values containing the delimiter or quotes are looked up on their own.
+        """
+        delimiter = self.CROWD_STRIKE_LOOKUP_DELIMITER
+        observables = list(dict.fromkeys(observables))
+        bulk = [observable for observable in observables if not {delimiter, '"', "\\"} & set(observable)]
+        single = [observable for observable in observables if observable not in bulk]
+
+        batch_size = current_app.config["CROWD_STRIKE_LOOKUP_BATCH_SIZE"]
+        search_jobs = []
+        for start in range(0, len(bulk), batch_size):
+            batch = bulk[start:][:batch_size]
+            if len(batch) == 1:
+                single.append(batch[0])
+                continue
+            search_job = SearchJob(
+                ", ".join(batch),
+                search_type="Crowd Strike",
+                search_query=(
+                    f'| limit 1 | "{delimiter.join(batch)}" as observables '
+                    f'| parse regex field=observables "(?<observable>[^{delimiter}]+)" multi '
+                    "| lookup raw from sumo://threat/cs on threat=observable"
+                ),
+                search_time_range=current_app.config["FIFTEEN_MINS_IN_SECONDS"] * 10**3,
+            )
+            search_job.observables = batch
+            search_job.messages_limit = len(batch)
+            search_job.warn_on_more_messages = False
+            search_jobs.append(search_job)
+
+        return [*search_jobs, *[self._crowd_strike_search(observable) for observable in single]]
+
+    @property
+    def _crowd_strike_cache(self):
+        return get_cache(
+            "crowd_strike", current_app.config["CROWD_STRIKE_CACHE_SIZE"], current_app.config["CROWD_STRIKE_CACHE_TTL"]
         )
+
+    def _crowd_strike_lookups(self, observables):
+        """
+        Split observables into the intel cached for this tenant
+        and the lookup jobs needed for the rest.
+        """
+        cached = {}
+        for observable in dict.fromkeys(observables):
+            crowd_strike_data = self._crowd_strike_cache.get(*self._tenant, observable)
+            if crowd_strike_data is not MISSING:
+                cached[observable] = crowd_strike_data
+        missing = [observable for observable in observables if observable not in cached]
+        return cached, self._crowd_strike_bulk_searches(missing)
+
+    def _crowd_strike_results(self, cached, search_jobs, results):
+        """
+        Merge the lookup results with the cached intel. Results of jobs that finished in time
+        are cached, including the observables without intel.
+        """
+        crowd_strike_data = dict(cached)
+        for search_job, messages in zip(search_jobs, results):
+            found = dict.fromkeys(search_job.observables)
+            for message in messages:
+                observable = message["map"].get("observable")
+                if observable in found and message["map"].get("raw"):
+                    found[observable] = current_app.json.loads(message["map"]["raw"])
+            if search_job.finished:
+                for observable, data in found.items():
+                    self._crowd_strike_cache.set(data, *self._tenant, observable)
+            crowd_strike_data.update(found)
+        return crowd_strike_data
+
+    def _get_data(self, *search_jobs):
+        """
+        Create all search jobs up front and poll them in one shared status loop.
+        Returns the messages of every job in the order the jobs were given.
+        A search identical to one already in flight for the same tenant
+        is not created again; it waits for and shares the result of that job.
+        """
+        if not current_app.config["COALESCE_SEARCHES"]:
+            return self._execute(search_jobs)
+
+        leading, following = self._join_flights(search_jobs)
+        try:
+            results = dict(zip([job for job, _ in leading], self._execute([job for job, _ in leading])))
+        except BaseException as error:
+            self._land_flights(leading, error=error)
+            raise
+        self._land_flights(leading, results)
+
+        for search_job, flight in following:
+            if flight.wait(self._flight_timeout()) and not self._leader_abandoned(flight):
+                results[search_job] = self._follow(search_job, flight)
+            else:
+                (results[search_job],) = self._execute([search_job])
+        return [results[search_job] for search_job in search_jobs]
+
+    def _join_flights(self, search_jobs):
+        """
+        Split the search jobs into the ones leading their flight
+        and the ones following a job already in flight, each with its flight.
+        """
+        leading, following = [], []
+        for search_job in search_jobs:
+            flight, leader = _searches_in_flight.join(self._flight_key(search_job))
+            (leading if leader else following).append((search_job, flight))
+        return leading, following
+
+    def _land_flights(self, leading, results=None, error=None):
+        """
+        Land the flights led by the search jobs with their results, or with the error they failed with.
+        Followers may serve other requests, so a leader cancelled or interrupted by anything
+        but an Exception lands without an outcome and they run the search themselves.
+        """
+        if not isinstance(error, Exception):
+            error = None
+        for search_job, flight in leading:
+            result = (search_job, results[search_job]) if results is not None else None
+            _searches_in_flight.land(self._flight_key(search_job), flight, result=result, error=error)
+
+    def _flight_timeout(self):
+        return min(self.SEARCH_JOB_MAX_TIME + current_app.config["COALESCED_SEARCH_GRACE_TIME"], self._time_left())
+
+    @staticmethod
+    def _leader_abandoned(flight):
+        """
+        Whether the job leading the landed flight ran out of the time of its own request,
+        or was cancelled before it had an outcome.
+        Its followers may have time left, so they run the search themselves, as on a timeout.
+        """
+        if flight.result is None and flight.error is None:
+            return True
+        leader_job, _ = flight.outcome()
+        return leader_job.abandoned
+
+    def _follow(self, search_job, flight):
+        """
+        Take over the outcome of the job leading the flight. Returns its messages.
+        """
+        leader_job, messages = flight.outcome()
+        for attribute in ("status", "finished", "to_time", "warnings"):
+            setattr(search_job, attribute, getattr(leader_job, attribute))
+        for warning in search_job.warnings:
+            add_error(warning)
         return messages
 
-    def get_crowd_strike_data(self, observable):
-        search_type = "Crowd Strike"
-        search_query = (
-            f'| limit 1 | "{observable}" as observable | lookup ' "raw from sumo://threat/cs on threat=observable"
+    def _flight_key(self, search_job):
+        cached_to = search_job.cached["to"] if search_job.cached else None
+        return (*self._tenant, search_job.search_type, search_job.search_query, cached_to)
+
+    def _execute(self, search_jobs):
+        """
+        Run the search jobs and return their messages. Every job is deleted
+        as soon as its messages are fetched; jobs left behind by an error
+        are handed over to the job reaper.
+        """
+        scheduler = get_scheduler(*self._tenant)
+        try:
+            self._run_jobs(search_jobs, scheduler)
+        except BaseException:
+            self._reap_jobs(search_jobs)
+            raise
+        finally:
+            self._release_tickets(search_jobs, scheduler)
+        return self._collect_results(search_jobs)
+
+    def _reap_jobs(self, search_jobs):
+        for search_job in search_jobs:
+            if search_job.id and not search_job.deleted:
+                self._reap_job(search_job.id)
+
+    @staticmethod
+    def _release_tickets(search_jobs, scheduler):
+        for search_job in search_jobs:
+            if search_job.ticket:
+                scheduler.cancel(search_job.ticket)
+                scheduler.release(search_job.ticket)
+
+    @staticmethod
+    def _collect_results(search_jobs):
+        results = []
+        for search_job in search_jobs:
+            for warning in search_job.warnings:
+                add_error(warning)
+            results.append(search_job.messages)
+        return results
+
+    def _time_left(self):
+        return self._deadline.remaining() if self._deadline else float("inf")
+
+    def _request_timeout(self):
+        """
+        Longest wait for a response to a call to Sumo Logic: the time left before the deadline,
+        up to SUMO_REQUEST_TIMEOUT, so a call that hangs never holds the worker past the deadline.
+        """
+        return max(min(self._time_left(), current_app.config["SUMO_REQUEST_TIMEOUT"]), self.MIN_REQUEST_TIMEOUT)
+
+    def _abandon(self, search_job, outcome="deadline"):
+        """
+        Give up a search job because the request deadline passed,
+        or because Sumo Logic did not answer one of its calls in time.
+        """
+        search_job.abandoned = True
+        count("relay_search_jobs_total", outcome=outcome)
+        search_job.warnings.append(SearchJobDidNotFinishWarning(search_job.observable, search_job.search_type))
+
+    def _run_jobs(self, search_jobs, scheduler):
+        """
+        Run the search jobs, making the calls their steps ask for.
+        """
+        steps = self._job_steps(search_jobs, scheduler)
+        resume, value = steps.send, None
+        while True:
+            try:
+                method, args = resume(value)
+            except StopIteration:
+                return
+            try:
+                resume, value = steps.send, getattr(self, method)(*args)
+            except Exception as error:
+                resume, value = steps.throw, error
+
+    def _job_steps(self, search_jobs, scheduler):
+        """
+        Start the search jobs as the scheduler of the tenant admits them and poll them in one loop.
+        Each job is completed as soon as it finishes, which frees its slot for the next one.
+        The state of the jobs is handled here for the sync and async clients alike:
+        every call to make is yielded as the name of a client method with its arguments,
+        and its result is sent back, or its error thrown in.
+        """
+        queued = list(search_jobs)
+        for search_job in queued:
+            search_job.ticket = Ticket(self._priority)
+
+        pending = []
+        while queued or pending:
+            if not self._time_left():
+                for search_job in [*queued, *pending]:
+                    self._abandon(search_job)
+                for search_job in pending:
+                    yield from self._complete(search_job, scheduler)
+                return
+
+            admission_time = time.time() + (yield from self._start_jobs(queued, pending, scheduler))
+            due = [job for job in pending if job.next_check_time <= time.time()]
+            try:
+                yield "_poll_all", (due,)
+            except SumoLogicTimeoutError:
+                for search_job in due:
+                    self._abandon(search_job, "call_timed_out")
+            for search_job in due:
+                if search_job.abandoned or self._is_polling_finished(search_job):
+                    pending.remove(search_job)
+                    yield from self._complete(search_job, scheduler)
+
+            if queued or pending:
+                yield "_sleep", (self._sleep_time(queued, pending, admission_time),)
+
+    def _sleep_time(self, queued, pending, admission_time):
+        """
+        Time until the next job is due for a check or may be admitted, within the deadline.
+        """
+        next_time = min([job.next_check_time for job in pending] + ([admission_time] if queued else []))
+        return max(min(next_time - time.time(), self._time_left()), 0)
+
+    def _start_jobs(self, queued, pending, scheduler):
+        """
+        Create the queued jobs in order while the scheduler admits them. A job refused
+        by Sumo Logic with 429 stays queued and the tenant is throttled for a while.
+        Returns the time to wait before asking the scheduler again.
+        """
+        while queued:
+            search_job = queued[0]
+            wait = scheduler.try_acquire(search_job.ticket)
+            if wait:
+                return wait
+
+            search_job.to_time = int(time.time()) * 10**3
+            try:
+                search_job.id = yield "_create_search", (
+                    search_job.search_query,
+                    search_job.search_time_range,
+                    search_job.to_time,
+                )
+            except SumoLogicTimeoutError:
+                # the job may have been created, but it cannot be polled nor deleted without its id
+                queued.pop(0)
+                scheduler.release(search_job.ticket)
+                self._abandon(search_job, "call_timed_out")
+                continue
+            except CriticalSumoLogicResponseError as error:
+                return self._throttle(search_job, scheduler, error)
+
+            queued.pop(0)
+            self._start_polling(search_job)
+            try:
+                yield "_poll", (search_job,)
+            except SumoLogicTimeoutError:
+                self._abandon(search_job, "call_timed_out")
+            if search_job.abandoned or self._is_polling_finished(search_job):
+                yield from self._complete(search_job, scheduler)
+            else:
+                pending.append(search_job)
+        return 0
+
+    @staticmethod
+    def _throttle(search_job, scheduler, error):
+        """
+        Free the slot of a job Sumo Logic refused to create and hold back the tenant
+        if it was throttled. Returns the time to wait before trying again.
+        """
+        scheduler.release(search_job.ticket)
+        if error.status_code != HTTPStatus.TOO_MANY_REQUESTS:
+            raise error
+        count("relay_search_jobs_total", outcome="throttled")
+        scheduler.throttle(current_app.config["SEARCH_THROTTLE_DELAY"])
+        return current_app.config["SEARCH_THROTTLE_DELAY"]
+
+    @staticmethod
+    def _start_polling(search_job):
+        search_job.start_time = time.time()
+        search_job.poll_schedule = PollSchedule(
+            current_app.config["SEARCH_POLL_INITIAL_DELAY"],
+            current_app.config["SEARCH_POLL_MAX_DELAY"],
+            current_app.config["SEARCH_POLL_BACKOFF_FACTOR"],
+            current_app.config["SEARCH_POLL_PROGRESS_BACKOFF_FACTOR"],
         )
-        search_time_range = current_app.config["FIFTEEN_MINS_IN_SECONDS"] * 10**3
-        first_check_request_delay = 1
-        check_request_delay = 5
-        messages = self._get_data(
-            observable, search_type, search_query, search_time_range, first_check_request_delay, check_request_delay
+
+    def _complete(self, search_job, scheduler):
+        """
+        Fetch the messages of a finished search job, then delete the job and free its slot.
+        """
+        if not search_job.abandoned:
+            try:
+                search_job.messages = yield from self._fetch_messages(search_job)
+            except SumoLogicTimeoutError:
+                self._abandon(search_job, "call_timed_out")
+        try:
+            yield "_delete_job", (search_job.id,)
+        except SumoLogicTimeoutError:
+            self._reap_job(search_job.id)
+        self._finish(search_job, scheduler)
+
+    @staticmethod
+    def _finish(search_job, scheduler):
+        search_job.deleted = True
+        scheduler.release(search_job.ticket)
+
+        schedule = search_job.poll_schedule
+        schedule.finish()
+        current_app.logger.debug(
+            f"{search_job.search_type} search job for {search_job.observable} finished after "
+            f"{schedule.polls} polls, {schedule.slept:.2f}s of waiting, up to {schedule.last_wait:.2f}s wasted"
         )
-        message = messages[0]["map"] if messages else {}
-        if message.get("raw"):
-            raw = message["raw"]
-            crowd_strike_data = json.loads(raw)
-            return crowd_strike_data
-
-    def _get_data(
-        self, observable, search_type, search_query, search_time_range, first_check_request_delay, check_request_delay
-    ):
-        search_id = self._create_search(search_query, search_time_range)
-        status_response = self._check_status(search_id)
-        time.sleep(first_check_request_delay)
-        start_time = time.time()
-
-        while status_response["state"] != self.DONE_GATHERING_RESULTS:
-            if status_response["state"] in [self.FORCE_PAUSED, self.CANCELLED]:
-                raise SearchJobWrongStateError(observable, status_response["state"])
-            if time.time() - start_time > self.SEARCH_JOB_MAX_TIME:
-                if status_response["state"] == self.NOT_STARTED:
-                    raise SearchJobNotStartedError(observable, status_response["state"])
-                add_error(SearchJobDidNotFinishWarning(observable, search_type))
-                break
-            status_response = self._check_status(search_id)
-            time.sleep(check_request_delay)
-
-        if status_response["messageCount"] > self._entities_limit_default:
-            add_error(MoreMessagesAvailableWarning(observable))
-        messages = self._get_messages(search_id)
-        self._delete_job(search_id)
+
+    def _fetch_messages(self, search_job):
+        if search_job.warn_on_more_messages and search_job.status["messageCount"] > self._entities_limit_default:
+            search_job.warnings.append(MoreMessagesAvailableWarning(search_job.observable))
+        observables = search_job.observables if search_job.demultiplex else None
+        # the projection only applies to the data table of sightings, CrowdStrike lookups keep all their fields
+        projection = self._projection if search_job.search_type == "Sumo Logic" else None
+        messages = yield "_get_messages", (search_job.id, search_job.messages_limit, observables, projection)
+        if search_job.fetched_early:
+            # messages of a job still gathering results may come unsorted
+            messages.sort(key=lambda message: int(message["map"]["_messagetime"]), reverse=True)
         return messages
 
-    def _create_search(self, search_query, search_time_range):
+    def _poll(self, search_job):
+        """
+        Check the status of a search job and schedule its next check.
+        """
+        waited = time.time() - search_job.last_check_time if search_job.last_check_time else 0
+        self._record_status(search_job, self._check_status(search_job.id), waited)
+
+    def _poll_all(self, search_jobs):
+        for search_job in search_jobs:
+            self._poll(search_job)
+
+    @staticmethod
+    def _sleep(seconds):
+        with timed("sleep"):
+            time.sleep(seconds)
+
+    @staticmethod
+    def _record_status(search_job, status, waited):
+        search_job.status = status
+        search_job.last_check_time = time.time()
+        made_progress = search_job.poll_schedule.record_poll(search_job.status, waited)
+        search_job.next_check_time = search_job.last_check_time + search_job.poll_schedule.next_delay(made_progress)
+
+    def _is_polling_finished(self, search_job):
+        state = search_job.status["state"]
+        if state == self.DONE_GATHERING_RESULTS:
+            search_job.finished = True
+            count("relay_search_jobs_total", outcome="done")
+            return True
+        if state in [self.FORCE_PAUSED, self.CANCELLED]:
+            count("relay_search_jobs_total", outcome="cancelled")
+            raise SearchJobWrongStateError(search_job.observable, state)
+        if self._has_enough_messages(search_job):
+            search_job.fetched_early = True
+            count("relay_search_jobs_total", outcome="fetched_early")
+            return True
+        if not self._time_left():
+            self._abandon(search_job)
+            return True
+        if time.time() - search_job.start_time > self.SEARCH_JOB_MAX_TIME:
+            if state == self.NOT_STARTED:
+                count("relay_search_jobs_total", outcome="not_started")
+                raise SearchJobNotStartedError(search_job.observable, state)
+            count("relay_search_jobs_total", outcome="timed_out")
+            search_job.warnings.append(SearchJobDidNotFinishWarning(search_job.observable, search_job.search_type))
+            return True
+        return False
+
+    @staticmethod
+    def _has_enough_messages(search_job):
+        """
+        Whether a search job still gathering results has already found
+        all the messages that will be fetched, so there is no need to wait
+        for it to scan the rest of its time range.
+        """
+        return (
+            current_app.config["SEARCH_EARLY_FETCH"]
+            and search_job.messages_limit is not None
+            and search_job.status.get("messageCount", 0) >= search_job.messages_limit
+        )
+
+    def _create_search(self, search_query, search_time_range, current_time=None):
         path = "search/jobs"
-        current_time = int(time.time()) * 10**3
-        payload = {"query": search_query, "from": current_time - search_time_range, "to": current_time}
-        search_result = self._request(path=path, method="POST", body=payload)
+        payload = self._search_payload(search_query, search_time_range, current_time)
+        with timed("create"):
+            search_result = self._request(path=path, method="POST", body=payload)
         return search_result.get("id")
 
+    @staticmethod
+    def _search_payload(search_query, search_time_range, current_time=None):
+        current_time = current_time or int(time.time()) * 10**3
+        return {"query": search_query, "from": current_time - search_time_range, "to": current_time}
+
     def _check_status(self, search_id):
         path = f"search/jobs/{search_id}"
-        status_result = self._request(path=path)
+        with timed("status"):
+            status_result = self._request(path=path)
         return status_result
 
-    def _get_messages(self, search_id):
+    def _get_messages(self, search_id, limit=None, observables=None, projection=None):
+        """
+        Stream the messages of a search job, trimming each one as soon as it is parsed.
+        For a batch search the observables found in every message are recorded
+        before its _raw is truncated.
+        """
         path = f"search/jobs/{search_id}/messages"
-        params = {"offset": 0, "limit": self._entities_limit}
-        messages_result = self._request(path=path, params=params)
-        return messages_result["messages"]
+        params = {"offset": 0, "limit": limit or self._entities_limit}
+        chunk_size = current_app.config["MESSAGES_CHUNK_SIZE"]
+        with timed("messages"):
+            return self._request(
+                path=path,
+                params=params,
+                stream=True,
+                data_extractor=lambda r: [
+                    self._trim_message(message, observables, projection)
+                    for message in iter_messages(r.iter_content(chunk_size))
+                ],
+            )
+
+    @staticmethod
+    def _trim_message(message, observables=None, projection=None):
+        """
+        Copy of the message without the underscore fields the mapper never uses,
+        nor the fields left out of the data table of its source category by the projection,
+        and with its _raw cut at RAW_MESSAGE_MAX_SIZE.
+        """
+        fields = message["map"]
+        if projection is None:
+            trimmed = {
+                "map": {key: value for key, value in fields.items() if key in SIGHTING_MESSAGE_FIELDS or key[:1] != "_"}
+            }
+        else:
+            data_fields = projection.data_fields(fields.get(SOURCE_CATEGORY_FIELD))
+            trimmed = {
+                "map": {
+                    key: value
+                    for key, value in fields.items()
+                    if key in SIGHTING_MESSAGE_FIELDS or (key[:1] != "_" and key.casefold() in data_fields)
+                }
+            }
+
+        raw = fields.get("_raw")
+        if raw is None and projection is not None and RAW_EXCERPT_FIELD in fields:
+            raw = fields[RAW_EXCERPT_FIELD]
+            # an excerpt as long as the cut was most likely truncated by it
+            trimmed["map"]["_raw"] = f"{raw}..." if len(raw) >= projection.raw_excerpt_size else raw
+        if observables is not None:
+            folded = str(raw or "").casefold()
+            matches = {observable: keyword_match(folded, observable) for observable in observables}
+            trimmed["observables"] = [observable for observable, match in matches.items() if match]
+            trimmed["unclear"] = [observable for observable, match in matches.items() if match is None]
+
+        max_size = current_app.config["RAW_MESSAGE_MAX_SIZE"]
+        if isinstance(raw, str) and len(raw) > max_size:
+            trimmed["map"]["_raw"] = f"{raw[:max_size]}..."
+        return trimmed
 
     def _delete_job(self, search_id):
-        self._request(path=f"search/jobs/{search_id}", method="DELETE")
+        with timed("delete"):
+            if current_app.config["SEARCH_JOB_REAPER"]:
+                self._reap_job(search_id)
+            else:
+                self._request(path=f"search/jobs/{search_id}", method="DELETE")
+
+    def _reap_job(self, search_id):
+        reaper = get_reaper(
+            current_app.config["SEARCH_JOB_REAPER_MAX_RETRIES"],
+            current_app.config["SEARCH_JOB_REAPER_RETRY_DELAY"],
+            current_app.logger,
+            current_app.config["SUMO_REQUEST_TIMEOUT"],
+        )
+        reaper.delete(self._session, f"{self._url}/search/jobs/{search_id}", self._auth, self._headers, self._cookies)
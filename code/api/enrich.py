@@ -1,73 +1,150 @@
-from functools import partial
+import traceback
+from functools import cache, partial
 
 from flask import Blueprint, g, current_app
 
-from api.schemas import ObservableSchema
-from api.utils import get_json, get_credentials, jsonify_result, jsonify_data
+from api.errors import TRFormattedError
+from api.utils import (
+    get_json,
+    get_tenant,
+    get_deadline,
+    jsonify_result,
+    jsonify_data,
+    jsonify_stream,
+    wants_stream,
+    format_data,
+    add_error,
+    iterate_concurrently,
+    tenant_semaphore,
+)
 from api.mapping import Sighting, Judgement, Verdict
 from api.client import SumoLogicClient
+from api.instrumentation import timed
+from api.scheduler import PRIORITY_DELIBERATE
 
 enrich_api = Blueprint("enrich", __name__)
 
-get_observables = partial(get_json, schema=ObservableSchema(many=True))
 
+@cache
+def observables_schema():
+    # marshmallow is imported on first use, see api/startup.py
+    from api.schemas import ObservableSchema
 
-@enrich_api.route("/observe/observables", methods=["POST"])
-def observe_observables():
-    credentials = get_credentials()
-    observables = get_observables()
+    return ObservableSchema(many=True)
 
-    g.sightings = []
-    g.judgements = []
-    g.verdicts = []
 
-    sighting_map = Sighting()
-    judgment_map = Judgement()
-    verdict_map = Verdict()
+def get_observables():
+    return get_json(observables_schema())
 
-    client = SumoLogicClient(credentials)
 
-    for observable in observables:
-        messages = client.get_messages(observable["value"])
+def map_observable(tenant, observable, messages, crowd_strike_data):
+    sighting_map = Sighting(tenant)
+    judgment_map = Judgement(tenant)
+    verdict_map = Verdict()
 
-        for message in messages:
-            sighting = sighting_map.extract(message["map"], observable)
-            g.sightings.append(sighting)
+    judgements = []
+    verdicts = []
+
+    with timed("mapping"):
+        sightings = sighting_map.extract_many([message["map"] for message in messages], observable)
 
-        crowd_strike_data = client.get_crowd_strike_data(observable["value"])
         if crowd_strike_data:
             judgment = judgment_map.extract(crowd_strike_data, observable)
-            g.judgements.append(judgment)
+            judgements.append(judgment)
             verdict = verdict_map.extract(crowd_strike_data, observable, judgment["id"])
-            g.verdicts.append(verdict)
+            verdicts.append(verdict)
 
-    return jsonify_result()
+    return sightings, judgements, verdicts
 
 
-@enrich_api.route("/deliberate/observables", methods=["POST"])
-def deliberate_observables():
-    credentials = get_credentials()
+def map_verdicts(observables, crowd_strike_data_bulk):
+    verdict_map = Verdict()
+    verdicts = []
+
+    with timed("mapping"):
+        for observable in observables:
+            crowd_strike_data = crowd_strike_data_bulk[observable["value"]]
+            if crowd_strike_data:
+                verdicts.append(verdict_map.extract(crowd_strike_data, observable))
+
+    return verdicts
+
+
+def observe(tenant, client, observable):
+    messages, crowd_strike_data = client.get_messages_and_crowd_strike_data(observable["value"])
+    return map_observable(tenant, observable, messages, crowd_strike_data)
+
+
+def observe_all(tenant, client, observables):
+    """
+    Yield the sightings, judgements and verdicts of every observable in order.
+    """
+    if current_app.config["BATCH_SIGHTING_SEARCH"]:
+        data = client.get_messages_and_crowd_strike_data_batch([observable["value"] for observable in observables])
+        for observable, (messages, crowd_strike_data) in zip(observables, data):
+            yield map_observable(tenant, observable, messages, crowd_strike_data)
+    else:
+        yield from iterate_concurrently(partial(observe, tenant, client), observables, tenant_semaphore(tenant))
+
+
+def stream_observe(observables, results):
+    """
+    Yield one chunk per observable as soon as it is mapped
+    and a final chunk with the warnings and errors.
+    """
+    try:
+        for observable, (sightings, judgements, verdicts) in zip(observables, results):
+            yield {
+                "observable": observable,
+                "data": format_data(sightings=sightings, judgements=judgements, verdicts=verdicts),
+            }
+    except TRFormattedError as error:
+        add_error(error)
+        current_app.logger.error(traceback.format_exc())
+    yield {"errors": g.get("errors", [])}
+
+
+@enrich_api.route("/observe/observables", methods=["POST"])
+def observe_observables():
+    tenant = get_tenant()
     observables = get_observables()
 
+    client = SumoLogicClient(tenant, get_deadline())
+    results = observe_all(tenant, client, observables)
+
+    if wants_stream():
+        return jsonify_stream(stream_observe(observables, results))
+
+    g.sightings = []
+    g.judgements = []
     g.verdicts = []
 
-    verdict_map = Verdict()
+    for sightings, judgements, verdicts in results:
+        g.sightings.extend(sightings)
+        g.judgements.extend(judgements)
+        g.verdicts.extend(verdicts)
 
-    client = SumoLogicClient(credentials)
+    return jsonify_result()
 
-    for observable in observables:
-        crowd_strike_data = client.get_crowd_strike_data(observable["value"])
-        if crowd_strike_data:
-            verdict = verdict_map.extract(crowd_strike_data, observable)
-            g.verdicts.append(verdict)
+
+@enrich_api.route("/deliberate/observables", methods=["POST"])
+def deliberate_observables():
+    tenant = get_tenant()
+    observables = get_observables()
+
+    client = SumoLogicClient(tenant, get_deadline(), PRIORITY_DELIBERATE)
+
+    crowd_strike_data_bulk = client.get_crowd_strike_data_bulk([observable["value"] for observable in observables])
+    g.verdicts = map_verdicts(observables, crowd_strike_data_bulk)
 
     return jsonify_result()
 
 
 @enrich_api.route("/refer/observables", methods=["POST"])
 def refer_observables():
-    _ = get_credentials()
+    tenant = get_tenant()
     observables = get_observables()
+    sighting_map = Sighting(tenant)
 
     obs_types_map = current_app.config["HUMAN_READABLE_OBSERVABLE_TYPES"]
     relay_output = [
@@ -78,7 +155,7 @@ def refer_observables():
                 f"Search for this {obs_types_map.get(observable['type'], observable['type'])}"
                 " in the Sumo Logic console"
             ),
-            "url": Sighting.sighting_source_uri(f'"{observable["value"]}"', "-30d", "now"),
+            "url": sighting_map.sighting_source_uri(f'"{observable["value"]}"', "-30d", "now"),
             "categories": ["Search", "SumoLogic"],
         }
         for observable in observables
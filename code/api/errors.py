@@ -1,3 +1,4 @@
+import ssl
 from collections import defaultdict
 from http import HTTPStatus
 
@@ -38,7 +39,8 @@ class WatchdogError(TRFormattedError):
 
 class SumoLogicSSLError(TRFormattedError):
     def __init__(self, error):
-        error = error.args[0].reason.args[0]
+        if not isinstance(error, ssl.SSLError):
+            error = error.args[0].reason.args[0]
         message = getattr(error, "verify_message", error.args[0]).capitalize()
         super().__init__(UNKNOWN, f"Unable to verify SSL certificate: {message}")
 
@@ -50,6 +52,11 @@ class SumoLogicConnectionError(TRFormattedError):
         )
 
 
+class SumoLogicTimeoutError(TRFormattedError):
+    def __init__(self, url):
+        super().__init__(CONNECTION_ERROR, f"Sumo Logic did not respond in time: {url}")
+
+
 class CriticalSumoLogicResponseError(TRFormattedError):
     """https://api.us2.sumologic.com/docs/#section/Getting-Started/Status-Codes"""
 
@@ -60,6 +67,7 @@ class CriticalSumoLogicResponseError(TRFormattedError):
         }
         status_codes = defaultdict(lambda: response_text, status_codes)
 
+        self.status_code = status_code
         super().__init__(
             HTTPStatus(status_code).phrase, f"Unexpected response from SumoLogic: {status_codes[status_code]}"
         )
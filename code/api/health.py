@@ -1,5 +1,5 @@
 from flask import Blueprint
-from api.utils import get_credentials, jsonify_data
+from api.utils import get_tenant, jsonify_data
 from api.client import SumoLogicClient
 
 health_api = Blueprint("health", __name__)
@@ -7,7 +7,7 @@ health_api = Blueprint("health", __name__)
 
 @health_api.route("/health", methods=["POST"])
 def health():
-    credentials = get_credentials()
-    client = SumoLogicClient(credentials)
+    tenant = get_tenant()
+    client = SumoLogicClient(tenant)
     _ = client.health()
     return jsonify_data({"status": "ok"})
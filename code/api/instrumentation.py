@@ -0,0 +1,264 @@
+import os
+import re
+import json
+import time
+import glob
+import bisect
+import threading
+from contextlib import contextmanager
+
+from flask import g, request, current_app, has_app_context
+
+from api.cache import cache_stats
+from api.polling import poll_stats
+from api.session import session_stats
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+POLL_COUNTERS = {
+    "jobs": "relay_search_jobs_polled_total",
+    "polls": "relay_search_polls_total",
+    "slept": "relay_search_poll_sleep_seconds_total",
+    "wasted": "relay_search_poll_wasted_seconds_total",
+}
+# metrics of the worker processes that exited, folded into a single snapshot
+RETIRED_SNAPSHOT = "retired.json"
+WORKER_SNAPSHOT = re.compile(r"(\d+)\.json")
+
+_histograms = {}
+_counters = {}
+_metrics_lock = threading.Lock()
+_last_flush = 0.0
+_snapshot_pid = None
+
+
+def observe(name, seconds, **labels):
+    """
+    Record a duration in the histogram of the current worker process.
+    """
+    key = (name, tuple(sorted(labels.items())))
+    index = bisect.bisect_left(BUCKETS, seconds)
+    with _metrics_lock:
+        histogram = _histograms.setdefault(key, {"buckets": [0] * (len(BUCKETS) + 1), "count": 0, "sum": 0.0})
+        histogram["buckets"][index] += 1
+        histogram["count"] += 1
+        histogram["sum"] += seconds
+
+
+def count(name, value=1, **labels):
+    key = (name, tuple(sorted(labels.items())))
+    with _metrics_lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def add_timing(stage, seconds):
+    """
+    Add time spent in a stage to the timings of the current request, if any.
+    Stages running in several worker threads add up, so they may exceed the request time.
+    """
+    if has_app_context():
+        timings = g.setdefault("timings", {})
+        timings[stage] = timings.get(stage, 0.0) + seconds
+
+
+def merge_timings(timings):
+    for stage, seconds in timings.items():
+        add_timing(stage, seconds)
+
+
+@contextmanager
+def timed(stage):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        observe("relay_stage_seconds", elapsed, stage=stage)
+        add_timing(stage, elapsed)
+
+
+def start_request_timing():
+    g.request_start = time.perf_counter()
+
+
+def add_server_timing(response):
+    """
+    Report the time spent in every stage of the request in the Server-Timing header.
+    Work done while a streamed response is being sent is not included.
+    """
+    total = time.perf_counter() - g.get("request_start", time.perf_counter())
+    endpoint = request.url_rule.rule if request.url_rule else "unknown"
+    observe("relay_request_seconds", total, endpoint=endpoint)
+
+    timings = {**g.get("timings", {}), "total": total}
+    response.headers["Server-Timing"] = ", ".join(
+        f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in timings.items()
+    )
+
+    if time.time() - _last_flush > current_app.config["METRICS_FLUSH_INTERVAL"]:
+        write_snapshot()
+    return response
+
+
+def process_counters():
+    """
+    Counters of the current worker process kept by the session, polling and cache modules.
+    """
+    counters = [(POLL_COUNTERS[key], (), value) for key, value in poll_stats().items()]
+    for host, stats in session_stats().items():
+        counters.append(("relay_sumo_requests_total", (("host", host),), stats["requests"]))
+        counters.append(("relay_sumo_connections_total", (("host", host),), stats["connections"]))
+    for cache, stats in cache_stats().items():
+        counters.append(("relay_cache_hits_total", (("cache", cache),), stats["hits"]))
+        counters.append(("relay_cache_misses_total", (("cache", cache),), stats["misses"]))
+    return counters
+
+
+def write_snapshot():
+    """
+    Save the metrics of the current worker process to its own file, so any worker
+    can aggregate the metrics of all of them. A file already there when the process
+    writes its first snapshot was left by an exited worker with the same pid,
+    and is folded into the retired snapshot rather than overwritten.
+    """
+    global _last_flush, _snapshot_pid
+    with _metrics_lock:
+        histograms = {
+            key: {**histogram, "buckets": list(histogram["buckets"])} for key, histogram in _histograms.items()
+        }
+        counters = dict(_counters)
+        _last_flush = time.time()
+    for name, labels, value in process_counters():
+        counters[(name, labels)] = counters.get((name, labels), 0) + value
+
+    directory = current_app.config["METRICS_DIR"]
+    path = os.path.join(directory, f"{os.getpid()}.json")
+    with _snapshots_lock(directory):
+        if _snapshot_pid != os.getpid():
+            _retire(directory, [path] if os.path.exists(path) else [])
+            _snapshot_pid = os.getpid()
+        _dump(path, histograms, counters)
+
+
+def read_snapshots():
+    """
+    Sum the metrics saved by all worker processes, after folding
+    the files of the workers that exited into the retired snapshot.
+    """
+    directory = current_app.config["METRICS_DIR"]
+    with _snapshots_lock(directory):
+        exited = []
+        for path in glob.glob(os.path.join(directory, "*.json")):
+            match = WORKER_SNAPSHOT.fullmatch(os.path.basename(path))
+            if match and not _is_running(int(match[1])):
+                exited.append(path)
+        _retire(directory, exited)
+        return _load(glob.glob(os.path.join(directory, "*.json")))
+
+
+@contextmanager
+def _snapshots_lock(directory):
+    """
+    Hold the lock of the snapshot files, shared by all worker processes.
+    """
+    os.makedirs(directory, exist_ok=True)
+    fd = os.open(os.path.join(directory, "snapshots.lock"), os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        os.close(fd)
+
+
+def _retire(directory, paths):
+    """
+    Add the snapshots of exited workers to the retired snapshot and remove them.
+    """
+    if not paths:
+        return
+    retired = os.path.join(directory, RETIRED_SNAPSHOT)
+    _dump(retired, *_load([retired, *paths]))
+    for path in paths:
+        os.remove(path)
+
+
+def _is_running(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _load(paths):
+    """
+    Sum the metrics of snapshot files, skipping those that cannot be read.
+    """
+    histograms, counters = {}, {}
+    for path in paths:
+        try:
+            with open(path) as file:
+                snapshot = json.load(file)
+        except (OSError, ValueError):
+            continue
+        for name, labels, histogram in snapshot["histograms"]:
+            key = (name, tuple(map(tuple, labels)))
+            total = histograms.setdefault(key, {"buckets": [0] * (len(BUCKETS) + 1), "count": 0, "sum": 0.0})
+            total["buckets"] = [a + b for a, b in zip(total["buckets"], histogram["buckets"])]
+            total["count"] += histogram["count"]
+            total["sum"] += histogram["sum"]
+        for name, labels, value in snapshot["counters"]:
+            key = (name, tuple(map(tuple, labels)))
+            counters[key] = counters.get(key, 0) + value
+    return histograms, counters
+
+
+def _dump(path, histograms, counters):
+    snapshot = {
+        "histograms": [[name, labels, histogram] for (name, labels), histogram in histograms.items()],
+        "counters": [[name, labels, value] for (name, labels), value in counters.items()],
+    }
+    with open(f"{path}.tmp", "w") as file:
+        json.dump(snapshot, file)
+    os.replace(f"{path}.tmp", path)
+
+
+def render_metrics():
+    """
+    Render the metrics of all worker processes in the Prometheus text format.
+    """
+    write_snapshot()
+    histograms, counters = read_snapshots()
+
+    lines = []
+    for name in sorted({name for name, _ in histograms}):
+        lines.append(f"# TYPE {name} histogram")
+        for (metric, labels), histogram in sorted(histograms.items()):
+            if metric != name:
+                continue
+            cumulative = 0
+            for bound, bucket in zip([*BUCKETS, "+Inf"], histogram["buckets"]):
+                cumulative += bucket
+                lines.append(f"{name}_bucket{_labels(labels, le=bound)} {cumulative}")
+            lines.append(f"{name}_sum{_labels(labels)} {histogram['sum']}")
+            lines.append(f"{name}_count{_labels(labels)} {histogram['count']}")
+    for name in sorted({name for name, _ in counters}):
+        lines.append(f"# TYPE {name} counter")
+        for (metric, labels), value in sorted(counters.items()):
+            if metric == name:
+                lines.append(f"{name}{_labels(labels)} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def _labels(labels, **extra):
+    pairs = [*labels, *extra.items()]
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in pairs) + "}"
@@ -0,0 +1,50 @@
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+COMPACT_SEPARATORS = (",", ":")
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """
+    JSON provider backed by orjson when it is installed, producing the same bytes
+    as DefaultJSONProvider. Whenever orjson would format the output differently
+    it falls back to the stdlib: for output with non-ASCII characters, which the stdlib escapes,
+    for values orjson cannot serialize, and for any formatting other than the compact
+    separators used in responses. Floats are not expected in the payloads,
+    as orjson formats their exponents differently.
+    """
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None or kwargs != {"separators": COMPACT_SEPARATORS}:
+            return super().dumps(obj, **kwargs)
+
+        option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+
+        try:
+            data = orjson.dumps(obj, default=self.default, option=option)
+        except TypeError:
+            return super().dumps(obj, **kwargs)
+
+        if self.ensure_ascii and (not data.isascii() or b"\x7f" in data):
+            return super().dumps(obj, **kwargs)
+
+        return data.decode()
+
+    def loads(self, s, **kwargs):
+        """
+        Parse with orjson, leaving what it rejects (NaN, lone surrogates)
+        to the stdlib, so the same documents parse and fail alike.
+        """
+        if orjson is None or kwargs:
+            return super().loads(s, **kwargs)
+
+        try:
+            return orjson.loads(s)
+        except orjson.JSONDecodeError:
+            return super().loads(s)
@@ -2,7 +2,7 @@ from datetime import datetime, timezone
 from uuid import uuid5, NAMESPACE_X500
 
 from flask import current_app
-from urllib.parse import urlencode
+from urllib.parse import urlencode, quote_plus
 
 SIGHTING = "sighting"
 JUDGEMENT = "judgement"
@@ -32,6 +32,13 @@ JUDGEMENT_DEFAULTS = {
 }
 VERDICT_DEFAULTS = {"type": VERDICT}
 
+# message fields read by the mapping, besides the ones shown in the data table
+SIGHTING_MESSAGE_FIELDS = frozenset(
+    ["_raw", "_messageid", "_messagetime", "_messagecount", "_collector", "_source", "_sourcename"]
+)
+# data table fields the mapping also reads, for the relations of a sighting
+SIGHTING_RELATION_FIELDS = frozenset(["src_ip", "dest_ip"])
+
 DISPOSITION_MAP = {
     "high": {"disposition": 2, "disposition_name": "Malicious"},
     "medium": {"disposition": 2, "disposition_name": "Malicious"},
@@ -59,27 +66,32 @@ def time_format(time):
     return f'{time.isoformat(timespec="milliseconds")}'
 
 
-def source_uri():
-    host = current_app.config["HOST"]
-    return f'https://{host.replace("api", "service")}/'
+def quote_number(value):
+    """
+    Same as quote_plus for the numeric strings Sumo Logic uses for ids and timestamps,
+    which need no quoting.
+    """
+    value = str(value)
+    return value if value.lstrip("-").isdigit() else quote_plus(value)
 
 
 class Sighting:
+    def __init__(self, tenant):
+        self._tenant = tenant
+        self._search_url = f'{tenant.console_url}ui/#/search/create?query={quote_plus("_messageid = ")}'
+
     def _sighting(self, message, observable):
+        message_id = message.get("_messageid")
         sighting = {
             "count": self._count(message),
             "description": f'```\n{message.get("_raw")}\n```',
             "short_description": self._short_description(message),
-            "external_ids": [message.get("_messageid")],
-            "id": f'transient:{SIGHTING}-{uuid5(NAMESPACE_X500, message.get("_messageid"))}',
-            "observables": [observable],
+            "external_ids": [message_id],
+            "id": f"transient:{SIGHTING}-{uuid5(NAMESPACE_X500, message_id)}",
+            "observables": [dict(observable)],
             "observed_time": {"start_time": self._start_time(message)},
             "data": self._data_table(message),
-            "source_uri": self.sighting_source_uri(
-                f'_messageid = {message.get("_messageid")}',
-                message.get("_messagetime"),
-                int(message.get("_messagetime")) + 1,
-            ),
+            "source_uri": self._message_source_uri(message),
             **SIGHTING_DEFAULTS,
         }
 
@@ -88,13 +100,23 @@ class Sighting:
 
         return sighting
 
-    @staticmethod
-    def sighting_source_uri(query, start_time, end_time):
-        url = source_uri()
+    def sighting_source_uri(self, query, start_time, end_time):
+        url = self._tenant.console_url
         path = "ui/#/search/create"
         params = {"query": query, "startTime": start_time, "endTime": end_time}
         return f"{url}{path}?{urlencode(params)}"
 
+    def _message_source_uri(self, message):
+        """
+        Same as sighting_source_uri for the search of a single message,
+        with the part fixed for the tenant encoded once.
+        """
+        message_time = message.get("_messagetime")
+        return (
+            f'{self._search_url}{quote_number(message.get("_messageid"))}'
+            f"&startTime={quote_number(message_time)}&endTime={int(message_time) + 1}"
+        )
+
     @staticmethod
     def _start_time(message):
         message_timestamp = int(message.get("_messagetime")) / 10**3
@@ -125,21 +147,27 @@ class Sighting:
 
     @staticmethod
     def _data_table(message):
-        data = {"columns": [], "rows": [[]]}
-
-        for key, value in message.items():
-            if not key.startswith("_") and value:
-                data["columns"].append({"name": key, "type": "string"})
-                data["rows"][0].append(value)
-
-        return data
+        fields = [(key, value) for key, value in message.items() if value and key[:1] != "_"]
+        return {
+            "columns": [{"name": key, "type": "string"} for key, _ in fields],
+            "rows": [[value for _, value in fields]],
+        }
 
     def extract(self, message, observable):
         sighting = self._sighting(message, observable)
         return sighting
 
+    def extract_many(self, messages, observable):
+        """
+        Map a page of messages for one observable.
+        """
+        return [self._sighting(message, observable) for message in messages]
+
 
 class Judgement:
+    def __init__(self, tenant):
+        self._tenant = tenant
+
     def _judgement(self, cs_data, observable):
         judgement = {
             **DISPOSITION_MAP[cs_data["malicious_confidence"]],
@@ -151,7 +179,7 @@ class Judgement:
                 "end_time": valid_time(cs_data["last_updated"], observable["type"]),
             },
             "external_references": self._external_references(cs_data),
-            "source_uri": source_uri(),
+            "source_uri": self._tenant.console_url,
             **JUDGEMENT_DEFAULTS,
         }
         return judgement
@@ -0,0 +1,152 @@
+import codecs
+from json import JSONDecoder, JSONDecodeError
+
+WHITESPACE = " \t\n\r"
+NUMBER_CHARS = "0123456789.eE+-"
+
+_decoder = JSONDecoder()
+
+INCOMPLETE = object()
+
+
+class MessagesParser:
+    """
+    Incremental parser of the body of a search job messages response.
+    Chunks of the body are fed as they arrive and every message is returned
+    as soon as it is complete; only the part of the body that was not parsed
+    yet is buffered, rather than the whole page.
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._pos = 0
+        self._state = "object"
+        self._key = None
+        self._retry_size = 0
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+
+    def feed(self, chunk):
+        """
+        Add a chunk of the body. Returns the messages completed by it.
+        """
+        self._append(self._decoder.decode(chunk))
+        return self._parse(final=False)
+
+    def close(self):
+        """
+        End the body. Returns the last messages; raises JSONDecodeError
+        if the body is incomplete or followed by anything but whitespace.
+        """
+        self._append(self._decoder.decode(b"", final=True))
+        messages = self._parse(final=True)
+        if self._state != "done":
+            raise JSONDecodeError("Unexpected end of data", self._buffer, self._pos)
+        return messages
+
+    def _append(self, text):
+        """
+        Drop the parsed text and add the new one.
+        """
+        consumed, self._pos = self._pos, 0
+        self._buffer = self._buffer[consumed:] + text
+
+    def _parse(self, final):
+        messages = []
+        while True:
+            while self._pos < len(self._buffer) and self._buffer[self._pos] in WHITESPACE:
+                self._pos += 1
+            if self._pos == len(self._buffer):
+                return messages
+
+            state = self._state
+            if state == "done":
+                raise JSONDecodeError("Extra data", self._buffer, self._pos)
+            if state == "object":
+                self._expect("{")
+                self._state = "first key"
+            elif state == "first key" and self._buffer[self._pos] == "}":
+                self._pos += 1
+                self._state = "done"
+            elif state in ("first key", "key"):
+                self._key = self._value(final)
+                if self._key is INCOMPLETE:
+                    return messages
+                self._state = "colon"
+            elif state == "colon":
+                self._expect(":")
+                self._state = "messages" if self._key == "messages" else "value"
+            elif state == "value":
+                if self._value(final) is INCOMPLETE:
+                    return messages
+                self._state = "next key"
+            elif state == "next key":
+                self._state = "key" if self._expect(",}") == "," else "done"
+            elif state == "messages":
+                self._expect("[")
+                self._state = "first message"
+            elif state == "first message" and self._buffer[self._pos] == "]":
+                self._pos += 1
+                self._state = "next key"
+            elif state in ("first message", "message"):
+                message = self._value(final)
+                if message is INCOMPLETE:
+                    return messages
+                messages.append(message)
+                self._state = "next message"
+            elif state == "next message":
+                self._state = "message" if self._expect(",]") == "," else "next key"
+
+    def _expect(self, chars):
+        char = self._buffer[self._pos]
+        if char not in chars:
+            raise JSONDecodeError(f"Expecting one of {chars!r}", self._buffer, self._pos)
+        self._pos += 1
+        return char
+
+    def _value(self, final):
+        """
+        Decode the value at the current position, or return INCOMPLETE
+        when it did not fully arrive yet. A value spanning many chunks is only retried
+        once the unparsed text has doubled, so it is decoded a logarithmic number of times.
+        """
+        available = len(self._buffer) - self._pos
+        if not final and available < self._retry_size:
+            return INCOMPLETE
+        try:
+            value, end = _decoder.raw_decode(self._buffer, self._pos)
+        except JSONDecodeError:
+            if final:
+                raise
+            self._retry_size = available * 2
+            return INCOMPLETE
+        # a number cut at the end of the buffer may go on in the next chunk
+        if not final and (end == len(self._buffer) or self._buffer[end] in NUMBER_CHARS):
+            self._retry_size = available * 2
+            return INCOMPLETE
+
+        self._retry_size = 0
+        self._pos = end
+        return value
+
+
+def iter_messages(chunks):
+    """
+    Parse the body of a search job messages response incrementally from its chunks,
+    yielding the messages one at a time as soon as they are complete.
+    """
+    parser = MessagesParser()
+    for chunk in chunks:
+        yield from parser.feed(chunk)
+    yield from parser.close()
+
+
+async def aiter_messages(chunks):
+    """
+    Same as iter_messages for the chunks of an asynchronous response body.
+    """
+    parser = MessagesParser()
+    async for chunk in chunks:
+        for message in parser.feed(chunk):
+            yield message
+    for message in parser.close():
+        yield message
@@ -0,0 +1,10 @@
+from flask import Blueprint, Response
+
+from api.instrumentation import render_metrics
+
+metrics_api = Blueprint("metrics", __name__)
+
+
+@metrics_api.route("/metrics", methods=["GET"])
+def metrics():
+    return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
@@ -0,0 +1,59 @@
+import threading
+
+_poll_stats = {"jobs": 0, "polls": 0, "slept": 0.0, "wasted": 0.0}
+_poll_stats_lock = threading.Lock()
+
+
+class PollSchedule:
+    """
+    Delays between status checks of a search job.
+    Starts short and backs off exponentially while the job makes no progress;
+    while messageCount/recordCount keep growing the job is gathering
+    results, so the delay grows by the gentler progress factor instead,
+    keeping long jobs from being checked at the initial rate throughout.
+    """
+
+    def __init__(self, initial_delay, max_delay, backoff_factor, progress_backoff_factor=1):
+        self.delay = initial_delay
+        self.max_delay = max_delay
+        self.backoff_factor = backoff_factor
+        self.progress_backoff_factor = progress_backoff_factor
+        self.polls = 0
+        self.slept = 0.0
+        self.last_wait = 0.0
+        self._progress = None
+
+    def record_poll(self, status, waited):
+        """
+        Account for one status check made after waiting for the given time.
+        """
+        self.polls += 1
+        self.slept += waited
+        self.last_wait = waited
+        progress = (status.get("messageCount", 0), status.get("recordCount", 0))
+        made_progress = self._progress is not None and progress != self._progress
+        self._progress = progress
+        return made_progress
+
+    def next_delay(self, made_progress):
+        delay = self.delay
+        factor = self.progress_backoff_factor if made_progress else self.backoff_factor
+        self.delay = min(self.delay * factor, self.max_delay)
+        return delay
+
+    def finish(self):
+        """
+        Record the schedule of a finished job in the process-wide poll stats.
+        The wait before the check that saw the terminal state is counted as
+        wasted, as the job may have finished at any moment during it.
+        """
+        with _poll_stats_lock:
+            _poll_stats["jobs"] += 1
+            _poll_stats["polls"] += self.polls
+            _poll_stats["slept"] += self.slept
+            _poll_stats["wasted"] += self.last_wait
+
+
+def poll_stats():
+    with _poll_stats_lock:
+        return dict(_poll_stats)
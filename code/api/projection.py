@@ -0,0 +1,84 @@
+import re
+from fnmatch import fnmatchcase
+
+from api.mapping import SIGHTING_MESSAGE_FIELDS, SIGHTING_RELATION_FIELDS
+
+SOURCE_CATEGORY_FIELD = "_sourcecategory"
+RAW_EXCERPT_FIELD = "raw_excerpt"
+
+FIELD_NAME = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+
+def quote_field(name):
+    """
+    Quote a field name for the Sumo Logic query language where it is not a plain identifier.
+    """
+    return name if FIELD_NAME.match(name) else f'%"{name}"'
+
+
+class FieldProjection:
+    """
+    Fields returned for sighting searches, pushed into their query as a fields clause,
+    so that Sumo Logic never sends the fields that would not be shown.
+    The data table of every message keeps the fields set for all source categories
+    and those set for the patterns its source category matches. Sumo Logic returns
+    field names in lower case, so they are matched without regard to case.
+    Optionally only an excerpt of _raw is returned, cut by Sumo Logic.
+    """
+
+    def __init__(self, fields, fields_by_source_category, raw_excerpt_size=None):
+        self._fields = frozenset(field.casefold() for field in fields)
+        self._fields_by_source_category = [
+            (pattern.casefold(), frozenset(field.casefold() for field in category_fields))
+            for pattern, category_fields in fields_by_source_category.items()
+        ]
+        projected = list(fields)
+        for category_fields in fields_by_source_category.values():
+            projected.extend(category_fields)
+        self._projected = list(dict.fromkeys(projected))
+        self.raw_excerpt_size = raw_excerpt_size
+        self._data_fields = {}
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        Projection set in the config, or None when every field is to be returned.
+        """
+        fields, fields_by_source_category = config["SIGHTING_FIELDS"], config["SIGHTING_FIELDS_BY_SOURCE_CATEGORY"]
+        if fields is None and not fields_by_source_category:
+            return None
+        return cls(fields or [], fields_by_source_category, config["SIGHTING_RAW_EXCERPT_SIZE"])
+
+    def clause(self, raw_excerpt=True):
+        """
+        Query operators that keep the projected fields and the ones the mapping reads.
+        Without raw_excerpt, the whole _raw is returned, as for batch searches
+        finding their observables in it.
+        """
+        excerpt = raw_excerpt and self.raw_excerpt_size is not None
+        fields = [field for field in sorted(SIGHTING_MESSAGE_FIELDS) if not (excerpt and field == "_raw")]
+        fields.extend(sorted(SIGHTING_RELATION_FIELDS))
+        if self._fields_by_source_category:
+            fields.append(SOURCE_CATEGORY_FIELD)
+        if excerpt:
+            fields.append(RAW_EXCERPT_FIELD)
+        fields.extend(self._projected)
+
+        operators = []
+        if excerpt:
+            operators.append(f"substring(_raw, 0, {self.raw_excerpt_size}) as {RAW_EXCERPT_FIELD}")
+        operators.append("fields " + ", ".join(quote_field(field) for field in dict.fromkeys(fields)))
+        return "".join(f" | {operator}" for operator in operators)
+
+    def data_fields(self, source_category):
+        """
+        Lower case names of the fields kept in the data table of a message from the source category.
+        """
+        category = (source_category or "").casefold()
+        if category not in self._data_fields:
+            fields = set(self._fields | SIGHTING_RELATION_FIELDS)
+            for pattern, category_fields in self._fields_by_source_category:
+                if fnmatchcase(category, pattern):
+                    fields.update(category_fields)
+            self._data_fields[category] = frozenset(fields)
+        return self._data_fields[category]
@@ -0,0 +1,96 @@
+import os
+import atexit
+import queue
+import time
+import threading
+from http import HTTPStatus
+
+from api.instrumentation import observe
+
+_reapers = {}
+_reapers_lock = threading.Lock()
+
+
+class JobReaper:
+    """
+    Deletes finished Sumo Logic search jobs in the background of the current worker process.
+    Failed deletions are retried with exponential backoff, and jobs still pending
+    at shutdown are deleted synchronously so they stop counting against the job quota.
+    Every deletion waits at most timeout seconds for Sumo Logic to answer.
+    """
+
+    def __init__(self, max_retries, retry_delay, logger, timeout=None):
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.logger = logger
+        self.timeout = timeout
+        self._queue = queue.Queue()
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def delete(self, session, url, auth, headers, cookies=None):
+        job = {"session": session, "url": url, "auth": auth, "headers": headers, "cookies": cookies, "attempt": 0}
+        with self._lock:
+            self._pending[url] = job
+        self._queue.put(job)
+
+    def pending(self):
+        with self._lock:
+            return list(self._pending)
+
+    def sweep(self):
+        """
+        Delete every pending job right away, without retries.
+        """
+        with self._lock:
+            jobs = list(self._pending.values())
+        for job in jobs:
+            self._delete(job)
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            if self._delete(job):
+                continue
+            job["attempt"] += 1
+            if job["attempt"] > self.max_retries:
+                self.logger.error(f"Giving up deleting search job {job['url']}")
+                with self._lock:
+                    self._pending.pop(job["url"], None)
+                continue
+            timer = threading.Timer(self.retry_delay * 2 ** (job["attempt"] - 1), self._queue.put, [job])
+            timer.daemon = True
+            timer.start()
+
+    def _delete(self, job):
+        with self._lock:
+            if job["url"] not in self._pending:
+                return True
+        start = time.perf_counter()
+        try:
+            response = job["session"].delete(
+                job["url"], auth=job["auth"], headers=job["headers"], cookies=job["cookies"], timeout=self.timeout
+            )
+            observe("relay_sumo_request_seconds", time.perf_counter() - start, path="DELETE search/jobs/{id}")
+            deleted = response.ok or response.status_code == HTTPStatus.NOT_FOUND
+        except Exception:
+            self.logger.exception(f"Failed to delete search job {job['url']}")
+            deleted = False
+        if deleted:
+            with self._lock:
+                self._pending.pop(job["url"], None)
+        return deleted
+
+
+def get_reaper(max_retries, retry_delay, logger, timeout=None):
+    """
+    Get the job reaper of the current worker process, starting it on first use.
+    """
+    pid = os.getpid()
+    with _reapers_lock:
+        if pid not in _reapers:
+            _reapers[pid] = JobReaper(max_retries, retry_delay, logger, timeout)
+            atexit.register(_reapers[pid].sweep)
+        return _reapers[pid]
@@ -0,0 +1,186 @@
+import os
+import json
+import time
+import uuid
+import hashlib
+import threading
+from contextlib import contextmanager
+
+from flask import current_app
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+PRIORITY_DELIBERATE = 0
+PRIORITY_OBSERVE = 1
+
+# waiters that stopped asking for a slot this long ago are gone
+WAITER_TIMEOUT = 5
+# time between attempts while every slot is taken
+RETRY_INTERVAL = 0.1
+
+_schedulers = {}
+_schedulers_lock = threading.Lock()
+
+
+class Ticket:
+    """
+    Place of one search job in the queue of its tenant.
+    """
+
+    def __init__(self, priority):
+        self.id = uuid.uuid4().hex
+        self.priority = priority
+        self.since = time.time()
+        self.admitted = False
+
+
+class SearchJobScheduler:
+    """
+    Admission control for the search jobs of one Sumo Logic tenant, shared by all
+    worker processes through a state file held under an exclusive lock.
+    A job may start while fewer than max_jobs are running and the token bucket
+    holds a token; waiting jobs are admitted by priority, then in arrival order.
+    Slots of processes that died expire after the lease time.
+    """
+
+    def __init__(self, path, max_jobs, rate, burst, lease):
+        self.path = path
+        self.max_jobs = max_jobs
+        self.rate = rate
+        self.burst = burst
+        self.lease = lease
+        self._lock = threading.Lock()
+
+    def try_acquire(self, ticket):
+        """
+        Take a slot for the ticket if it is its turn.
+        Returns 0 when the slot was taken, otherwise the time to wait before trying again.
+        """
+        with self._state() as state:
+            now = time.time()
+            waiting = state["waiting"]
+            waiting[ticket.id] = {"priority": ticket.priority, "since": ticket.since, "seen": now}
+            if now < state["throttled_until"]:
+                return state["throttled_until"] - now
+
+            ahead = sum(
+                (waiter["priority"], waiter["since"]) < (ticket.priority, ticket.since)
+                for waiter_id, waiter in waiting.items()
+                if waiter_id != ticket.id
+            )
+            free_slots = self.max_jobs - len(state["running"])
+            if ahead < min(free_slots, int(state["tokens"])):
+                del waiting[ticket.id]
+                state["running"][ticket.id] = now + self.lease
+                state["tokens"] -= 1
+                ticket.admitted = True
+                return 0
+
+            if ahead >= free_slots:
+                return RETRY_INTERVAL
+            return max((ahead + 1 - state["tokens"]) / self.rate, RETRY_INTERVAL)
+
+    def release(self, ticket):
+        if not ticket.admitted:
+            return
+        with self._state() as state:
+            state["running"].pop(ticket.id, None)
+        ticket.admitted = False
+
+    def cancel(self, ticket):
+        """
+        Stop waiting for a slot.
+        """
+        if ticket.admitted:
+            return
+        with self._state() as state:
+            state["waiting"].pop(ticket.id, None)
+
+    def throttle(self, seconds):
+        """
+        Hold back every new job of the tenant after Sumo Logic refused one.
+        """
+        with self._state() as state:
+            state["throttled_until"] = max(state["throttled_until"], time.time() + seconds)
+            state["tokens"] = 0
+
+    @contextmanager
+    def _state(self):
+        """
+        Read the shared state under the lock, drop expired slots and waiters,
+        refill the token bucket, and write the state back on exit.
+        """
+        with self._lock:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            try:
+                if fcntl is not None:
+                    fcntl.flock(fd, fcntl.LOCK_EX)
+                with os.fdopen(os.dup(fd), "r+") as file:
+                    content = file.read()
+                    state = json.loads(content) if content else {}
+
+                    now = time.time()
+                    updated = state.get("updated", now)
+                    state["tokens"] = min(self.burst, state.get("tokens", self.burst) + (now - updated) * self.rate)
+                    state["updated"] = now
+                    state.setdefault("throttled_until", 0)
+                    state["running"] = {key: until for key, until in state.get("running", {}).items() if until > now}
+                    state["waiting"] = {
+                        key: waiter
+                        for key, waiter in state.get("waiting", {}).items()
+                        if waiter["seen"] > now - WAITER_TIMEOUT
+                    }
+
+                    yield state
+
+                    file.seek(0)
+                    file.truncate()
+                    json.dump(state, file)
+            finally:
+                os.close(fd)
+
+
+class UnlimitedScheduler:
+    """
+    Scheduler admitting every search job at once, used when scheduling is disabled.
+    """
+
+    def try_acquire(self, ticket):
+        ticket.admitted = True
+        return 0
+
+    def release(self, ticket):
+        ticket.admitted = False
+
+    def cancel(self, ticket):
+        pass
+
+    def throttle(self, seconds):
+        pass
+
+
+def get_scheduler(host, access_id):
+    """
+    Get the search job scheduler of a Sumo Logic tenant.
+    """
+    config = current_app.config
+    if not config["SEARCH_SCHEDULER"]:
+        return UnlimitedScheduler()
+
+    key = (host, access_id)
+    with _schedulers_lock:
+        if key not in _schedulers:
+            directory = config["SEARCH_SCHEDULER_DIR"]
+            os.makedirs(directory, exist_ok=True)
+            name = hashlib.sha256("\x1f".join(map(str, key)).encode()).hexdigest()
+            _schedulers[key] = SearchJobScheduler(
+                os.path.join(directory, f"{name}.json"),
+                config["SEARCH_JOBS_PER_TENANT"],
+                config["SEARCH_JOBS_RATE"],
+                config["SEARCH_JOBS_BURST"],
+                config["SEARCH_JOB_LEASE"],
+            )
+        return _schedulers[key]
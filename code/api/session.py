@@ -0,0 +1,60 @@
+import os
+import threading
+from http.cookiejar import DefaultCookiePolicy
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def get_session(host, pool_size, max_retries, backoff_factor):
+    """
+    Get the keep-alive session of the current worker process for a Sumo Logic host.
+    Connections are pooled per host and reused across requests and threads.
+    Only idempotent calls are retried on throttling and gateway errors,
+    so a retry never creates a duplicate search job.
+    The session keeps no cookies, as it is shared by every tenant of the host:
+    the search job cookies are kept per client and passed with each request.
+    """
+    # requests is imported on first use, see api/startup.py
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    key = (os.getpid(), host)
+    with _sessions_lock:
+        if key not in _sessions:
+            retry = Retry(
+                total=max_retries,
+                backoff_factor=backoff_factor,
+                status_forcelist=(429, 502, 503, 504),
+                allowed_methods=frozenset({"GET", "DELETE"}),
+                raise_on_status=False,
+            )
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+            session = requests.Session()
+            session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _sessions[key] = session
+        return _sessions[key]
+
+
+def session_stats():
+    """
+    Count the requests sent and the connections opened per Sumo Logic host
+    by the current worker process. Requests above the number of connections
+    were served over a reused keep-alive connection.
+    """
+    stats = {}
+    with _sessions_lock:
+        sessions = [(host, session) for (pid, host), session in _sessions.items() if pid == os.getpid()]
+    for host, session in sessions:
+        requests_count, connections_count = 0, 0
+        for adapter in set(session.adapters.values()):
+            for pool_key in adapter.poolmanager.pools.keys():
+                pool = adapter.poolmanager.pools.get(pool_key)
+                if pool is not None:
+                    requests_count += pool.num_requests
+                    connections_count += pool.num_connections
+        stats[host] = {"requests": requests_count, "connections": connections_count}
+    return stats
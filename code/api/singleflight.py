@@ -0,0 +1,52 @@
+import threading
+
+
+class Flight:
+    """
+    One in-flight call whose outcome is shared by every caller waiting on it.
+    """
+
+    def __init__(self):
+        self.result = None
+        self.error = None
+        self._done = threading.Event()
+
+    def wait(self, timeout):
+        """
+        Wait for the outcome; returns False if the flight did not land in time.
+        """
+        return self._done.wait(timeout)
+
+    def outcome(self):
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key: the first caller leads the call
+    and the callers joining while it is in flight wait for its outcome.
+    """
+
+    def __init__(self):
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def join(self, key):
+        """
+        Join the flight for the key. Returns the flight and whether the caller leads it.
+        """
+        with self._lock:
+            if key in self._flights:
+                return self._flights[key], False
+            flight = self._flights[key] = Flight()
+            return flight, True
+
+    def land(self, key, flight, result=None, error=None):
+        flight.result = result
+        flight.error = error
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+        flight._done.set()
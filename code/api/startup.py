@@ -0,0 +1,115 @@
+import gc
+import os
+import time
+import logging
+import importlib
+
+try:
+    import uwsgi
+except ImportError:
+    uwsgi = None
+
+logger = logging.getLogger(__name__)
+
+# heavy dependencies the views import on first use rather than with the app,
+# so that /watchdog and /version are served without them
+LAZY_MODULES = ("requests", "jwt", "api.schemas")
+
+
+class StartupReport:
+    """
+    Time spent in each phase of loading the app, after the time the process took
+    to get to it (interpreter start and imports), where /proc is available.
+    """
+
+    def __init__(self):
+        self.started = process_age()
+        self.phases = {}
+        self.preloaded = {}
+        self.frozen = 0
+        self._last = time.perf_counter()
+
+    def mark(self, phase):
+        now = time.perf_counter()
+        self.phases[phase] = self.phases.get(phase, 0) + now - self._last
+        self._last = now
+
+    @property
+    def total(self):
+        return (self.started or 0) + sum(self.phases.values())
+
+    def __str__(self):
+        phases = [("imports", self.started)] if self.started is not None else []
+        parts = []
+        for phase, seconds in [*phases, *self.phases.items()]:
+            parts.append(f"{phase} {seconds * 1000:.1f} ms")
+            if phase == "preload" and self.preloaded:
+                modules = ", ".join(f"{name} {took * 1000:.1f} ms" for name, took in self.preloaded.items())
+                parts[-1] += f" ({modules})"
+        if self.frozen:
+            parts.append(f"{self.frozen} objects frozen")
+        return f"App loaded in {self.total * 1000:.1f} ms: " + ", ".join(parts)
+
+
+def process_age():
+    """
+    Seconds since the current process started, with the clock tick resolution.
+    """
+    try:
+        with open("/proc/self/stat") as stat:
+            # fields after the command name, which may contain spaces, start with the third one
+            start_ticks = int(stat.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as uptime:
+            seconds_since_boot = float(uptime.read().split()[0])
+        return max(seconds_since_boot - start_ticks / os.sysconf("SC_CLK_TCK"), 0)
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def in_uwsgi_master():
+    """
+    Whether the app is being loaded by the uwsgi master, before it forks the workers.
+    """
+    return uwsgi is not None and uwsgi.worker_id() == 0
+
+
+def preload(modules):
+    """
+    Import the modules, returning the time each one took. Modules that are not installed are skipped.
+    """
+    timings = {}
+    for name in modules:
+        start = time.perf_counter()
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            continue
+        timings[name] = time.perf_counter() - start
+    return timings
+
+
+def freeze():
+    """
+    Move every object allocated so far out of reach of the garbage collector,
+    so that the collections of forked workers never write to the pages
+    holding them and those pages stay shared copy-on-write with the master.
+    Returns the number of frozen objects.
+    """
+    gc.collect()
+    gc.freeze()
+    return gc.get_freeze_count()
+
+
+def log_report(report):
+    """
+    Log the startup report at the INFO level. The app logger only emits warnings
+    unless debug is on, so the report has a logger of its own, writing to the
+    same stream and in the same format as the app logger.
+    """
+    from flask.logging import default_handler
+
+    if default_handler not in logger.handlers:
+        logger.addHandler(default_handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+    logger.info(report)
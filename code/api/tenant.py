@@ -0,0 +1,37 @@
+from collections import namedtuple
+
+_TenantFields = namedtuple(
+    "TenantContext", ["host", "access_id", "access_key", "entities_limit", "api_url", "console_url"]
+)
+
+
+class TenantContext(_TenantFields):
+    """
+    Immutable settings of the Sumo Logic tenant a request is served for, built once
+    from its verified token and passed to the client and the mappers. Unlike the app
+    config, it is never shared by concurrent requests of different tenants.
+    """
+
+    __slots__ = ()
+
+    @classmethod
+    def from_payload(cls, payload, entities_limit, api_endpoint):
+        host = payload["host"]
+        return cls(
+            host=host,
+            access_id=payload["access_id"],
+            access_key=payload["access_key"],
+            entities_limit=entities_limit,
+            api_url=api_endpoint.format(host=host),
+            console_url=f'https://{host.replace("api", "service")}/',
+        )
+
+    @property
+    def key(self):
+        """
+        Identity of the tenant for its caches, schedulers and semaphores.
+        """
+        return self.host, self.access_id
+
+    def __repr__(self):
+        return f"TenantContext(host={self.host!r}, access_id={self.access_id!r}, entities_limit={self.entities_limit})"
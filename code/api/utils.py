@@ -1,12 +1,15 @@
 import json
+import time
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from json.decoder import JSONDecodeError
-import requests
-from requests.exceptions import ConnectionError, InvalidURL
-import jwt
-from jwt import InvalidSignatureError, DecodeError, InvalidAudienceError, MissingRequiredClaimError
-from flask import request, jsonify, g, current_app
+from flask import request, jsonify, g, current_app, copy_current_request_context, Response, stream_with_context
 
+from api.cache import LRUCache
+from api.instrumentation import timed, merge_timings
 from api.errors import AuthorizationError, InvalidArgumentError
+from api.tenant import TenantContext
 
 
 NO_AUTH_HEADER = "Authorization header is missing"
@@ -22,22 +25,107 @@ WRONG_KEY = (
 JWKS_HOST_MISSING = "jwks_host is missing in JWT payload. Make sure custom_jwks_host field is present in module_type"
 WRONG_JWKS_HOST = "Wrong jwks_host in JWT payload. Make sure domain follows the visibility.<region>.cisco.com structure"
 
+NDJSON_MIMETYPE = "application/x-ndjson"
+REQUEST_TIMEOUT_HEADER = "X-Request-Timeout"
 
-def get_public_key(jwks_host, token):
+_tenant_semaphores = {}
+_tenant_semaphores_lock = threading.Lock()
+
+_jwks_cache = None
+_jwks_cache_lock = threading.Lock()
+_jwks_refreshing = set()
+
+_verified_tokens = None
+_verified_tokens_lock = threading.Lock()
+
+
+def fetch_public_keys(jwks_url, timeout):
     """
-    Get public key by requesting it from specified jwks host.
+    Request the key set from a jwks endpoint and parse every key in it.
     """
+    # requests and jwt are imported on first use, see api/startup.py
+    import requests
+    import jwt
 
-    expected_errors = (ConnectionError, InvalidURL, KeyError, JSONDecodeError)
-    try:
-        response = requests.get(f"https://{jwks_host}/.well-known/jwks")
+    with timed("jwks"):
+        response = requests.get(jwks_url, timeout=timeout)
         jwks = response.json()
 
-        public_keys = {}
-        for jwk in jwks["keys"]:
-            kid = jwk["kid"]
-            public_keys[kid] = jwt.algorithms.RSAAlgorithm.from_jwk(json.dumps(jwk))
+    public_keys = {}
+    for jwk in jwks["keys"]:
+        kid = jwk["kid"]
+        public_keys[kid] = jwt.algorithms.RSAAlgorithm.from_jwk(json.dumps(jwk))
+    return public_keys
+
+
+def get_jwks_cache():
+    """
+    Get the process-wide LRU cache of the key sets fetched per jwks host,
+    each kept with its fetch time until it gets older than the allowed staleness.
+    """
+    global _jwks_cache
+    with _jwks_cache_lock:
+        if _jwks_cache is None:
+            _jwks_cache = LRUCache(
+                current_app.config["JWKS_CACHE_SIZE"], ttl=current_app.config["JWKS_CACHE_MAX_STALE"]
+            )
+        return _jwks_cache
+
+
+def refresh_public_keys(jwks_cache, jwks_host, jwks_url, timeout):
+    """
+    Fetch the key set of the jwks host, caching it only when it holds keys,
+    so that hosts serving no key set do not take cache entries.
+    """
+    public_keys = fetch_public_keys(jwks_url, timeout)
+    if public_keys:
+        jwks_cache.set(jwks_host, (time.time(), public_keys))
+    return public_keys
+
+
+def refresh_public_keys_in_background(jwks_cache, jwks_host, jwks_url, timeout, logger):
+    def refresh():
+        try:
+            refresh_public_keys(jwks_cache, jwks_host, jwks_url, timeout)
+        except Exception:
+            logger.exception(f"Failed to refresh the public keys of {jwks_host}")
+        finally:
+            with _jwks_cache_lock:
+                _jwks_refreshing.discard(jwks_host)
+
+    with _jwks_cache_lock:
+        if jwks_host in _jwks_refreshing:
+            return
+        _jwks_refreshing.add(jwks_host)
+    threading.Thread(target=refresh, daemon=True).start()
+
+
+def get_public_key(jwks_host, token):
+    """
+    Get public key from the process-wide key set cache of the specified jwks host.
+    The jwks host is read from the token before it is verified, so the cache
+    is bounded and only holds the key sets that were fetched with keys.
+    The key set is requested again when the kid is unknown (key rotation).
+    After the TTL the cached keys are still served while being refreshed
+    in the background, until they get older than the allowed staleness.
+    """
+    import jwt
+    from requests.exceptions import ConnectionError, Timeout, InvalidURL
+
+    expected_errors = (ConnectionError, Timeout, InvalidURL, KeyError, JSONDecodeError)
+    try:
         kid = jwt.get_unverified_header(token)["kid"]
+        jwks_url = current_app.config["JWKS_URL"].format(jwks_host=jwks_host)
+        timeout = current_app.config["JWKS_REQUEST_TIMEOUT"]
+        jwks_cache = get_jwks_cache()
+        fetched_at, public_keys = jwks_cache.get(jwks_host, (None, None))
+        age = time.time() - fetched_at if fetched_at else None
+
+        if public_keys is None or (kid not in public_keys and age > current_app.config["JWKS_REFRESH_MIN_INTERVAL"]):
+            public_keys = refresh_public_keys(jwks_cache, jwks_host, jwks_url, timeout)
+        elif age > current_app.config["JWKS_CACHE_TTL"]:
+            refresh_public_keys_in_background(jwks_cache, jwks_host, jwks_url, timeout, current_app.logger)
+
         return public_keys.get(kid)
     except expected_errors:
         raise AuthorizationError(WRONG_JWKS_HOST)
@@ -56,11 +144,27 @@ def get_auth_token():
         raise AuthorizationError(expected_errors[error.__class__])
 
 
-def get_credentials():
+def get_verified_tokens():
+    """
+    Get the process-wide LRU cache of the tenant contexts of verified JWTs.
+    """
+    global _verified_tokens
+    with _verified_tokens_lock:
+        if _verified_tokens is None:
+            _verified_tokens = LRUCache(current_app.config["VERIFIED_TOKEN_CACHE_SIZE"])
+        return _verified_tokens
+
+
+def get_tenant():
     """
     Get Authorization token and validate its signature
     against the public key from /.well-known/jwks endpoint.
+    Returns the context of the tenant the token was issued for.
+    Tenant contexts are cached until the token expires,
+    so repeated tokens skip decoding and signature verification.
     """
+    import jwt
+    from jwt import InvalidSignatureError, DecodeError, InvalidAudienceError, MissingRequiredClaimError
 
     expected_errors = {
         KeyError: JWKS_HOST_MISSING,
@@ -72,22 +176,56 @@ def get_credentials():
         MissingRequiredClaimError: WRONG_PAYLOAD_STRUCTURE,
     }
     token = get_auth_token()
+    aud = request.url_root.rstrip("/")
+    cache_key = (hashlib.sha256(token.encode()).hexdigest(), aud)
+
+    tenant = get_verified_tokens().get(cache_key)
+    if tenant is None:
+        try:
+            jwks_host = jwt.decode(token, options={"verify_signature": False})["jwks_host"]
+            key = get_public_key(jwks_host, token)
+            with timed("jwt"):
+                payload = jwt.decode(token, key=key, algorithms=["RS256"], audience=[aud])
+
+            assert "host" in payload
+            assert "access_id" in payload
+            assert "access_key" in payload
+        except tuple(expected_errors) as error:
+            message = expected_errors[error.__class__]
+            raise AuthorizationError(message)
+
+        tenant = TenantContext.from_payload(
+            payload, get_entities_limit(payload), current_app.config["SUMO_API_ENDPOINT"]
+        )
+        if isinstance(payload.get("exp"), (int, float)):
+            get_verified_tokens().set(cache_key, tenant, expires_at=payload["exp"])
+
+    return tenant
+
+
+class Deadline:
+    """
+    Time budget shared by all search jobs of a request.
+    """
+
+    def __init__(self, seconds):
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self):
+        return max(self.expires_at - time.monotonic(), 0)
+
+
+def get_deadline():
+    """
+    Start the deadline of the current request. The request header
+    can shorten the configured budget, but not extend it.
+    """
+    timeout = current_app.config["REQUEST_TIMEOUT"]
     try:
-        jwks_host = jwt.decode(token, options={"verify_signature": False})["jwks_host"]
-        key = get_public_key(jwks_host, token)
-        aud = request.url_root
-        payload = jwt.decode(token, key=key, algorithms=["RS256"], audience=[aud.rstrip("/")])
-
-        assert "host" in payload
-        assert "access_id" in payload
-        assert "access_key" in payload
-
-        set_entities_limit(payload)
-        current_app.config["HOST"] = payload["host"]
-        return payload
-    except tuple(expected_errors) as error:
-        message = expected_errors[error.__class__]
-        raise AuthorizationError(message)
+        timeout = min(timeout, float(request.headers[REQUEST_TIMEOUT_HEADER]))
+    except (KeyError, ValueError):
+        pass
+    return Deadline(timeout)
 
 
 def get_json(schema):
@@ -110,17 +248,14 @@ def format_docs(docs):
     return {"count": len(docs), "docs": docs}
 
 
-def jsonify_result():
-    result = {"data": {}}
+def format_data(**entities):
+    return {name: format_docs(docs) for name, docs in entities.items() if docs}
 
-    if g.get("sightings"):
-        result["data"]["sightings"] = format_docs(g.sightings)
 
-    if g.get("judgements"):
-        result["data"]["judgements"] = format_docs(g.judgements)
-
-    if g.get("verdicts"):
-        result["data"]["verdicts"] = format_docs(g.verdicts)
+def jsonify_result():
+    result = {
+        "data": format_data(sightings=g.get("sightings"), judgements=g.get("judgements"), verdicts=g.get("verdicts"))
+    }
 
     if g.get("errors"):
         result["errors"] = g.errors
@@ -128,21 +263,127 @@ def jsonify_result():
         if not result.get("data"):
             result.pop("data", None)
 
-    return jsonify(result)
+    with timed("serialization"):
+        return jsonify(result)
+
+
+def wants_stream():
+    """
+    Check whether the caller opted in to a streamed NDJSON response,
+    either with the stream query flag or by preferring it in the Accept header.
+    """
+    if request.args.get("stream", "").lower() in ("1", "true"):
+        return True
+    return request.accept_mimetypes.best_match(["application/json", NDJSON_MIMETYPE]) == NDJSON_MIMETYPE
+
+
+def jsonify_stream(chunks):
+    """
+    Stream every chunk as one line of JSON while the request context stays available.
+    """
+    lines = (current_app.json.dumps(chunk, separators=(",", ":")) + "\n" for chunk in chunks)
+    return Response(stream_with_context(lines), mimetype=NDJSON_MIMETYPE)
+
+
+def jsonify_lines(chunks):
+    """
+    Serialize every chunk as one line of JSON up front, for async views:
+    their context ends with the view, so they cannot stream.
+    """
+    with timed("serialization"):
+        lines = [current_app.json.dumps(chunk, separators=(",", ":")) + "\n" for chunk in chunks]
+    return Response(lines, mimetype=NDJSON_MIMETYPE)
 
 
 def jsonify_data(data):
-    return jsonify({"data": data})
+    with timed("serialization"):
+        return jsonify({"data": data})
 
 
 def add_error(error):
     g.errors = [*g.get("errors", []), error.json]
 
 
-def set_entities_limit(payload):
+def get_entities_limit(payload):
     default = current_app.config["CTR_ENTITIES_LIMIT_DEFAULT"]
     try:
         value = int(payload["CTR_ENTITIES_LIMIT"])
-        current_app.config["CTR_ENTITIES_LIMIT"] = value if value in range(1, default + 1) else default
+        return value if value in range(1, default + 1) else default
     except (ValueError, TypeError, KeyError):
-        current_app.config["CTR_ENTITIES_LIMIT"] = default
+        return default
+
+
+def tenant_semaphore(tenant):
+    """
+    Get the process-wide semaphore capping concurrent work per Sumo Logic tenant.
+    """
+    key = tenant.key
+    with _tenant_semaphores_lock:
+        if key not in _tenant_semaphores:
+            limit = current_app.config["OBSERVE_WORKERS_PER_TENANT"]
+            _tenant_semaphores[key] = threading.BoundedSemaphore(limit)
+        return _tenant_semaphores[key]
+
+
+def iterate_concurrently(func, items, semaphore):
+    """
+    Call func for every item in a worker pool sized for the request.
+    Results are yielded in the order of items as soon as they are ready,
+    and warnings added by the workers are merged into g.errors in the same order,
+    as are their stage timings. Every call holds the semaphore of the tenant,
+    including when the items are run inline by a single worker.
+    """
+
+    def task(item):
+        with semaphore:
+            result = func(item)
+        return result, g.get("errors", []), g.get("timings", {})
+
+    max_workers = min(len(items), current_app.config["OBSERVE_WORKERS_PER_REQUEST"])
+    if max_workers <= 1:
+        for item in items:
+            with semaphore:
+                result = func(item)
+            yield result
+        return
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(copy_current_request_context(task), item) for item in items]
+        try:
+            for future in futures:
+                result, errors, timings = future.result()
+                g.errors = [*g.get("errors", []), *errors]
+                merge_timings(timings)
+                yield result
+        finally:
+            for future in futures:
+                future.cancel()
+
+
+async def gather_concurrently(func, items):
+    """
+    Await func for every item concurrently in the event loop of the request.
+    Every call gets its own g, so warnings and stage timings are merged
+    in the order of items, as with iterate_concurrently. The first error
+    cancels the calls still running.
+    """
+    import asyncio
+
+    async def task(item):
+        with current_app.app_context():
+            result = await func(item)
+            return result, g.get("errors", []), g.get("timings", {})
+
+    try:
+        async with asyncio.TaskGroup() as group:
+            tasks = [group.create_task(task(item)) for item in items]
+    except ExceptionGroup as error:
+        raise error.exceptions[0]
+
+    results = []
+    for done in tasks:
+        result, errors, timings = done.result()
+        g.errors = [*g.get("errors", []), *errors]
+        merge_timings(timings)
+        results.append(result)
+    return results
@@ -1,8 +1,26 @@
+import json
+import threading
+
 from flask import Blueprint, jsonify, current_app
 
 version_api = Blueprint("version", __name__)
 
+_version = None
+_version_lock = threading.Lock()
+
+
+def get_version():
+    """
+    Read the version from the container settings on first use rather than on import.
+    """
+    global _version
+    with _version_lock:
+        if _version is None:
+            with open(current_app.config["SETTINGS_FILE"]) as settings:
+                _version = json.load(settings)["VERSION"]
+        return _version
+
 
 @version_api.route("/version", methods=["POST"])
 def version():
-    return jsonify({"version": current_app.config["VERSION"]})
+    return jsonify({"version": get_version()})
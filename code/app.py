@@ -6,18 +6,40 @@ from api.enrich import enrich_api
 from api.health import health_api
 from api.version import version_api
 from api.watchdog import watchdog_api
+from api.metrics import metrics_api
 from api.errors import TRFormattedError
 from api.utils import jsonify_result, add_error
+from api.json_provider import FastJSONProvider
+from api.instrumentation import start_request_timing, add_server_timing
+from api.startup import StartupReport, LAZY_MODULES, in_uwsgi_master, preload, freeze, log_report
+
+startup_report = StartupReport()
 
 app = Flask(__name__)
 
 app.url_map.strict_slashes = False
 app.config.from_object("config.Config")
 
-app.register_blueprint(enrich_api)
+if app.config["FAST_JSON"]:
+    app.json = FastJSONProvider(app)
+
+startup_report.mark("config")
+
+if app.config["ASYNC_VIEWS"]:
+    from api.async_enrich import async_enrich_api
+
+    app.register_blueprint(async_enrich_api)
+else:
+    app.register_blueprint(enrich_api)
 app.register_blueprint(health_api)
 app.register_blueprint(version_api)
 app.register_blueprint(watchdog_api)
+app.register_blueprint(metrics_api)
+
+app.before_request(start_request_timing)
+app.after_request(add_server_timing)
+
+startup_report.mark("blueprints")
 
 
 @app.errorhandler(Exception)
@@ -45,5 +67,16 @@ def handle_tr_formatted_error(exception):
     return jsonify_result()
 
 
+if app.config["UWSGI_PRELOAD"] and in_uwsgi_master():
+    # the workers forked from the master share the preloaded modules
+    # instead of each importing them on its first request
+    startup_report.preloaded = preload(LAZY_MODULES)
+    startup_report.mark("preload")
+    startup_report.frozen = freeze()
+    startup_report.mark("gc freeze")
+
+log_report(startup_report)
+
+
 if __name__ == "__main__":
     app.run()
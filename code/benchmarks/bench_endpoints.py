@@ -0,0 +1,194 @@
+"""
+End-to-end benchmark of the relay endpoints against a local fake of Sumo Logic.
+
+Every scenario drives one endpoint through the Flask app, reporting latency
+percentiles, Sumo Logic calls per request, the mean response size and the peak memory of a request.
+Observables are unique per request unless the scenario is warm, so the caches
+only help where intended.
+
+Run from the code folder:
+
+    python -m benchmarks.bench_endpoints [--requests 20] [--concurrency 1] [--scenario observe ...]
+"""
+
+import json
+import time
+import logging
+import argparse
+import itertools
+import statistics
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+import jwt
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+from app import app
+from api import async_enrich
+from api.reaper import get_reaper
+from benchmarks.fake_sumo import FakeSumo
+
+SCENARIOS = {
+    "health": {"path": "/health", "observables": 0},
+    "refer": {"path": "/refer/observables", "observables": 3},
+    "deliberate": {"path": "/deliberate/observables", "observables": 3},
+    "observe": {"path": "/observe/observables", "observables": 3},
+    "observe-warm": {"path": "/observe/observables", "observables": 3, "warm": True},
+    "observe-noisy": {
+        "path": "/observe/observables",
+        "observables": 3,
+        "fake": {"messages_per_observable": 150, "raw_size": 10_000, "fields": 50, "job_duration": 3},
+    },
+    "observe-errors": {
+        "path": "/observe/observables",
+        "observables": 3,
+        "fake": {"error_rate": 0.05, "error_status": 503},
+    },
+    "observe-wide": {
+        "path": "/observe/observables",
+        "observables": 3,
+        "fake": {"fields": 300, "raw_size": 10_000},
+    },
+    "observe-wide-projected": {
+        "path": "/observe/observables",
+        "observables": 3,
+        "fake": {"fields": 300, "raw_size": 10_000},
+        "config": {
+            "SIGHTING_FIELDS": ["field_0", "field_1"],
+            "SIGHTING_FIELDS_BY_SOURCE_CATEGORY": {"cat*": ["field_2", "field_3"]},
+            "SIGHTING_RAW_EXCERPT_SIZE": 2048,
+        },
+    },
+    "observe-batch": {"path": "/observe/observables", "observables": 10, "config": {"BATCH_SIGHTING_SEARCH": True}},
+    "deliberate-async": {"path": "/deliberate/observables", "observables": 3, "async": True},
+    "observe-async": {"path": "/observe/observables", "observables": 3, "async": True},
+    "observe-batch-async": {
+        "path": "/observe/observables",
+        "observables": 10,
+        "config": {"BATCH_SIGHTING_SEARCH": True},
+        "async": True,
+    },
+}
+# async scenarios swap these views in, as if the app ran with ASYNC_VIEWS
+ASYNC_VIEWS = {
+    "enrich.observe_observables": async_enrich.observe_observables,
+    "enrich.deliberate_observables": async_enrich.deliberate_observables,
+}
+SUMO_CALLS = ["create", "status", "messages", "delete"]
+
+_unique = itertools.count()
+
+
+def make_jwk(key, kid):
+    jwk = json.loads(jwt.algorithms.RSAAlgorithm.to_jwk(key.public_key()))
+    return {**jwk, "kid": kid, "use": "sig", "alg": "RS256"}
+
+
+def make_token(key, kid, jwks_host):
+    payload = {
+        "jwks_host": jwks_host,
+        "aud": "http://localhost",
+        "host": "api.us2.sumologic.com",
+        "access_id": "bench",
+        "access_key": "bench",
+        "exp": int(time.time()) + 3600,
+    }
+    return jwt.encode(payload, key, algorithm="RS256", headers={"kid": kid})
+
+
+def make_observables(count, warm):
+    """
+    Observables with intel (bad), with messages only (good) and with neither (none), in turns.
+    """
+    suffix = "warm" if warm else next(_unique)
+    kinds = itertools.cycle(["bad", "good", "none"])
+    return [{"type": "domain", "value": f"{next(kinds)}-{index}-{suffix}.example.com"} for index in range(count)]
+
+
+def send(scenario, token):
+    body = make_observables(scenario["observables"], scenario.get("warm")) if scenario["observables"] else None
+    start = time.perf_counter()
+    response = app.test_client().post(scenario["path"], json=body, headers={"Authorization": f"Bearer {token}"})
+    elapsed = time.perf_counter() - start
+    errors = {error["type"] for error in response.get_json().get("errors", [])}
+    return elapsed, response.status_code != 200 or "fatal" in errors, "warning" in errors, len(response.data)
+
+
+def wait_for_reaper(timeout=10):
+    with app.app_context():
+        reaper = get_reaper(
+            app.config["SEARCH_JOB_REAPER_MAX_RETRIES"], app.config["SEARCH_JOB_REAPER_RETRY_DELAY"], app.logger
+        )
+    deadline = time.time() + timeout
+    while reaper.pending() and time.time() < deadline:
+        time.sleep(0.05)
+
+
+def run_scenario(name, scenario, args, key):
+    with FakeSumo(make_jwk(key, name), **scenario.get("fake", {})) as fake:
+        config = {
+            "SUMO_API_ENDPOINT": f"{fake.url}/api/v1",
+            "JWKS_URL": "http://{jwks_host}/.well-known/jwks",
+            **scenario.get("config", {}),
+        }
+        previous = {key: app.config[key] for key in config}
+        views = {endpoint: app.view_functions[endpoint] for endpoint in ASYNC_VIEWS}
+        app.config.update(config)
+        if scenario.get("async"):
+            app.view_functions.update(ASYNC_VIEWS)
+        token = make_token(key, name, f"127.0.0.1:{fake.port}")
+        try:
+            send(scenario, token)
+            wait_for_reaper()
+            before = fake.stats()["calls"]
+
+            with ThreadPoolExecutor(args.concurrency) as executor:
+                outcomes = list(executor.map(lambda _: send(scenario, token), range(args.requests)))
+            wait_for_reaper()
+            after = fake.stats()["calls"]
+
+            tracemalloc.start()
+            send(scenario, token)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            wait_for_reaper()
+        finally:
+            app.config.update(previous)
+            app.view_functions.update(views)
+
+    latencies = [elapsed * 1000 for elapsed, _, _, _ in outcomes]
+    percentiles = statistics.quantiles(latencies, n=100, method="inclusive")
+    calls = [(after.get(call, 0) - before.get(call, 0)) / args.requests for call in SUMO_CALLS]
+    failed = sum(failed for _, failed, _, _ in outcomes)
+    warned = sum(warned for _, _, warned, _ in outcomes)
+    size = statistics.mean(size for _, _, _, size in outcomes)
+    print(
+        f"{name:<24} {percentiles[49]:8.1f} {percentiles[89]:8.1f} {percentiles[98]:8.1f} {max(latencies):8.1f}"
+        + "".join(f" {count:8.1f}" for count in calls)
+        + f" {size / 2**10:8.1f} {peak / 2**20:9.2f} {failed:7} {warned:7}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--scenario", action="append", choices=SCENARIOS, help="run only these scenarios")
+    args = parser.parse_args()
+
+    # failed requests are counted in the report, their tracebacks would only get in the way
+    app.logger.setLevel(logging.CRITICAL)
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+    print(f"{args.requests} requests per scenario, concurrency {args.concurrency}; latency in ms, calls per request")
+    print(
+        f"{'scenario':<24} {'p50':>8} {'p90':>8} {'p99':>8} {'max':>8}"
+        + "".join(f" {call:>8}" for call in SUMO_CALLS)
+        + f" {'KiB':>8} {'peak MiB':>9} {'failed':>7} {'warned':>7}"
+    )
+    for name in args.scenario or SCENARIOS:
+        run_scenario(name, SCENARIOS[name], args, key)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Micro-benchmark of FastJSONProvider against Flask's DefaultJSONProvider,
+encoding an observe response and decoding a page of Sumo Logic messages.
+
+Run from the code folder:
+
+    python -m benchmarks.bench_json [--observables 3] [--messages 100] [--fields 50] [--repeat 50]
+"""
+
+import argparse
+
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+from api.json_provider import FastJSONProvider, COMPACT_SEPARATORS, orjson
+from api.mapping import Sighting
+from api.utils import format_data
+from benchmarks.bench_sighting import TENANT, build_messages, measure
+
+EDGE_CASES = [
+    {"control": '\x00\x1f\x7f\b\f\n\r\t"\\/', "empty": "", "nested": [[], {}, None, True, False]},
+    {"unicode": "café   \U0001f600", "count": -(2**63)},
+    {"big": 2**64},
+    {1: "non-string key"},
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--observables", type=int, default=3)
+    parser.add_argument("--messages", type=int, default=100)
+    parser.add_argument("--fields", type=int, default=50)
+    parser.add_argument("--raw-size", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    if orjson is None:
+        print("orjson is not installed, FastJSONProvider falls back to the stdlib")
+
+    app = Flask(__name__)
+    app.config.from_object("config.Config")
+    default, fast = DefaultJSONProvider(app), FastJSONProvider(app)
+
+    messages = build_messages(args.messages, args.fields, args.raw_size)
+    page = default.dumps({"fields": [], "messages": [{"map": message} for message in messages]}).encode()
+
+    with app.app_context():
+        sightings = []
+        for index in range(args.observables):
+            observable = {"type": "ip", "value": f"10.0.0.{index}"}
+            sightings.extend(Sighting(TENANT).extract_many(messages, observable))
+        result = {"data": format_data(sightings=sightings)}
+
+    for obj in [result, *EDGE_CASES]:
+        expected = default.dumps(obj, separators=COMPACT_SEPARATORS)
+        assert fast.dumps(obj, separators=COMPACT_SEPARATORS) == expected, "dumps output differs"
+    assert fast.loads(page) == default.loads(page), "loads output differs"
+
+    encoded = len(default.dumps(result, separators=COMPACT_SEPARATORS))
+    dumps_default, dumps_fast, loads_default, loads_fast = measure(
+        [
+            lambda: default.dumps(result, separators=COMPACT_SEPARATORS),
+            lambda: fast.dumps(result, separators=COMPACT_SEPARATORS),
+            lambda: default.loads(page),
+            lambda: fast.loads(page),
+        ],
+        args.repeat,
+    )
+
+    print(f"{len(sightings)} sightings ({encoded // 1024} KiB), {args.messages} messages ({len(page) // 1024} KiB)")
+    print(f"median of {args.repeat} runs")
+    print(f"  dumps stdlib {dumps_default * 1000:8.2f} ms")
+    print(f"  dumps fast   {dumps_fast * 1000:8.2f} ms  {dumps_default / dumps_fast:6.2f}x")
+    print(f"  loads stdlib {loads_default * 1000:8.2f} ms")
+    print(f"  loads fast   {loads_fast * 1000:8.2f} ms  {loads_default / loads_fast:6.2f}x")
+
+
+if __name__ == "__main__":
+    main()
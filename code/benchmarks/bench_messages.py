@@ -0,0 +1,58 @@
+"""
+Peak memory of parsing a messages page at once against streaming it through iter_messages
+and trimming every message, for growing _raw sizes.
+
+Run from the code folder:
+
+    python -m benchmarks.bench_messages [--messages 100] [--chunk-size 65536]
+"""
+
+import json
+import argparse
+import tracemalloc
+
+from flask import Flask
+
+from api.client import SumoLogicClient
+from api.messages import iter_messages
+from benchmarks.bench_sighting import build_messages
+
+
+def peak_memory(func):
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=100)
+    parser.add_argument("--chunk-size", type=int, default=64 * 1024)
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    app.config.from_object("config.Config")
+
+    print(f"{args.messages} messages, peak memory in MiB")
+    print(f"  {'_raw size':>10} {'page':>8} {'json.loads':>11} {'streamed':>9}")
+    with app.app_context():
+        for raw_size in [1_000, 10_000, 100_000, 1_000_000]:
+            messages = build_messages(args.messages, 20, raw_size)
+            body = json.dumps({"fields": [], "messages": [{"map": message} for message in messages]}).encode()
+            chunks = [body[start:][: args.chunk_size] for start in range(0, len(body), args.chunk_size)]
+            del messages
+
+            expected = [SumoLogicClient._trim_message(message) for message in json.loads(body)["messages"]]
+            assert [SumoLogicClient._trim_message(message) for message in iter_messages(chunks)] == expected
+            del expected
+
+            loaded = peak_memory(lambda: [SumoLogicClient._trim_message(m) for m in json.loads(body)["messages"]])
+            streamed = peak_memory(lambda: [SumoLogicClient._trim_message(m) for m in iter_messages(chunks)])
+            print(f"  {raw_size:>10} {len(body) / 2**20:8.1f} {loaded / 2**20:11.1f} {streamed / 2**20:9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+"""
+Micro-benchmark of Sighting.extract_many against the per-message mapping it replaced,
+frozen below as BaselineSighting.
+
+Run from the code folder:
+
+    python -m benchmarks.bench_sighting [--messages 100] [--fields 200] [--repeat 50]
+"""
+
+import gc
+import argparse
+import time
+import statistics
+
+from urllib.parse import urlencode
+from uuid import uuid5, NAMESPACE_X500
+
+from flask import Flask, current_app
+
+from api.mapping import Sighting, SIGHTING, SIGHTING_DEFAULTS, time_format
+from api.tenant import TenantContext
+
+TENANT = TenantContext.from_payload(
+    {"host": "api.us2.sumologic.com", "access_id": "bench", "access_key": "bench"}, 100, "https://{host}/api/v1"
+)
+
+
+class BaselineSighting:
+    """
+    Sighting mapping as it was before extract_many, with the console URL read from
+    the app config and urlencoded for every message.
+    """
+
+    def _sighting(self, message, observable):
+        sighting = {
+            "count": self._count(message),
+            "description": f'```\n{message.get("_raw")}\n```',
+            "short_description": self._short_description(message),
+            "external_ids": [message.get("_messageid")],
+            "id": f'transient:{SIGHTING}-{uuid5(NAMESPACE_X500, message.get("_messageid"))}',
+            "observables": [observable],
+            "observed_time": {"start_time": self._start_time(message)},
+            "data": self._data_table(message),
+            "source_uri": self.sighting_source_uri(
+                f'_messageid = {message.get("_messageid")}',
+                message.get("_messagetime"),
+                int(message.get("_messagetime")) + 1,
+            ),
+            **SIGHTING_DEFAULTS,
+        }
+
+        if message.get("src_ip") and message.get("dest_ip"):
+            sighting["relations"] = self._relation(message)
+
+        return sighting
+
+    @staticmethod
+    def sighting_source_uri(query, start_time, end_time):
+        host = current_app.config["HOST"]
+        url = f'https://{host.replace("api", "service")}/'
+        path = "ui/#/search/create"
+        params = {"query": query, "startTime": start_time, "endTime": end_time}
+        return f"{url}{path}?{urlencode(params)}"
+
+    @staticmethod
+    def _start_time(message):
+        message_timestamp = int(message.get("_messagetime")) / 10**3
+        return time_format(message_timestamp)
+
+    @staticmethod
+    def _count(message):
+        return int(message.get("_messagecount")) if message.get("_messagecount") else 1
+
+    @staticmethod
+    def _short_description(message):
+        return (
+            f'{message.get("_collector")} received a log from '
+            f'{message.get("_source")} - {message.get("_sourcename")} '
+            "containing the observable"
+        )
+
+    @staticmethod
+    def _relation(message):
+        return [
+            {
+                "origin": message.get("_source"),
+                "relation": "Connected_To",
+                "source": {"type": "ip", "value": message.get("src_ip")},
+                "related": {"type": "ip", "value": message.get("dest_ip")},
+            }
+        ]
+
+    @staticmethod
+    def _data_table(message):
+        data = {"columns": [], "rows": [[]]}
+
+        for key, value in message.items():
+            if not key.startswith("_") and value:
+                data["columns"].append({"name": key, "type": "string"})
+                data["rows"][0].append(value)
+
+        return data
+
+    def extract(self, message, observable):
+        return self._sighting(message, observable)
+
+
+def build_messages(count, fields, raw_size):
+    messages = []
+    for index in range(count):
+        message = {
+            "_raw": f"message {index} " + "x" * raw_size,
+            "_messageid": str(-8_500_000_000_000_000_000 + index),
+            "_messagetime": str(1_700_000_000_000 + index * 1000),
+            "_messagecount": str(index % 3 or ""),
+            "_collector": "collector",
+            "_source": "source",
+            "_sourcename": "/var/log/messages",
+            "_sourcecategory": "category",
+            "src_ip": "10.0.0.1",
+            "dest_ip": "10.0.0.2",
+        }
+        for field in range(fields):
+            message[f"field_{field}"] = f"value {index}-{field}"
+        messages.append(message)
+    return messages
+
+
+def measure(funcs, repeat):
+    """
+    Time the functions in turns, so machine noise hits all of them alike.
+    Returns the median time of each function.
+    """
+    timings = [[] for _ in funcs]
+    for _ in range(repeat):
+        for func, func_timings in zip(funcs, timings):
+            gc.collect()
+            gc.disable()
+            try:
+                start = time.perf_counter()
+                func()
+                func_timings.append(time.perf_counter() - start)
+            finally:
+                gc.enable()
+    return [statistics.median(func_timings) for func_timings in timings]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=100)
+    parser.add_argument("--fields", type=int, default=200)
+    parser.add_argument("--raw-size", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    app.config.from_object("config.Config")
+    app.config["HOST"] = TENANT.host
+
+    messages = build_messages(args.messages, args.fields, args.raw_size)
+    observable = {"type": "ip", "value": "10.0.0.1"}
+    baseline_map = BaselineSighting()
+    sighting_map = Sighting(TENANT)
+
+    with app.app_context():
+        expected = [baseline_map.extract(message, observable) for message in messages]
+        assert sighting_map.extract_many(messages, observable) == expected, "extract_many output differs"
+
+        per_message, batched = measure(
+            [
+                lambda: [baseline_map.extract(message, observable) for message in messages],
+                lambda: sighting_map.extract_many(messages, observable),
+            ],
+            args.repeat,
+        )
+
+    print(f"{args.messages} messages x {args.fields} fields, median of {args.repeat} runs")
+    print(f"  baseline     {per_message * 1000:8.2f} ms")
+    print(f"  extract_many {batched * 1000:8.2f} ms")
+    print(f"  speedup      {per_message / batched:8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""
+Cold start benchmark of the app as uwsgi runs it: a fresh interpreter loads
+the app like the master does, optionally preloading the lazily imported modules
+and freezing the garbage collector, then forks a worker that serves its first
+/watchdog and its first /health (against a local fake of Sumo Logic).
+
+Reports, per mode, the time the master takes to load the app, the time
+the worker takes to serve its first requests, the time from the start
+of the process to the first healthy watchdog, and the memory the worker
+stops sharing with the master once it has served a request and collected garbage.
+
+Run from the code folder:
+
+    python -m benchmarks.bench_startup [--repeat 5]
+"""
+
+import os
+import gc
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+
+MODES = {
+    "lazy": {"preload": False, "freeze": False},
+    "preload": {"preload": True, "freeze": False},
+    "preload-freeze": {"preload": True, "freeze": True},
+}
+COLUMNS = ["load", "watchdog", "health", "ready"]
+
+
+def private_dirty():
+    """
+    Memory of the current process written to since it was forked, in bytes.
+    """
+    with open("/proc/self/smaps_rollup") as smaps:
+        for line in smaps:
+            if line.startswith("Private_Dirty:"):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+def serve_first_requests(app, token):
+    client = app.test_client()
+    start = time.perf_counter()
+    response = client.get("/watchdog", headers={"Health-Check": "ok"})
+    assert response.status_code == 200, response.status_code
+    watchdog = time.perf_counter() - start
+
+    start = time.perf_counter()
+    response = client.post("/health", headers={"Authorization": f"Bearer {token}"})
+    assert response.get_json() == {"data": {"status": "ok"}}, response.get_json()
+    health = time.perf_counter() - start
+
+    gc.collect()
+    return watchdog, health
+
+
+def child(mode, config, token):
+    """
+    Load the app as the uwsgi master would, fork a worker and report its first requests.
+    """
+    from app import app, startup_report
+    from api.startup import LAZY_MODULES, preload, freeze
+
+    app.config.update(config)
+    if MODES[mode]["preload"]:
+        startup_report.preloaded = preload(LAZY_MODULES)
+        startup_report.mark("preload")
+    if MODES[mode]["freeze"]:
+        startup_report.frozen = freeze()
+        startup_report.mark("gc freeze")
+
+    read_end, write_end = os.pipe()
+    fork_start = time.perf_counter()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_end)
+        forked = time.perf_counter() - fork_start
+        watchdog, health = serve_first_requests(app, token)
+        with os.fdopen(write_end, "w") as pipe:
+            json.dump({"watchdog": forked + watchdog, "health": health, "dirty": private_dirty()}, pipe)
+        os._exit(0)
+
+    os.close(write_end)
+    with os.fdopen(read_end) as pipe:
+        worker = json.load(pipe)
+    os.waitpid(pid, 0)
+    load = startup_report.total
+    print(json.dumps({**worker, "load": load, "ready": load + worker["watchdog"], "report": str(startup_report)}))
+
+
+def run_mode(mode, config, token, repeat):
+    samples = []
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, "-m", "benchmarks.bench_startup", "--child", mode, json.dumps(config), token],
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+        samples.append(json.loads(output.splitlines()[-1]))
+
+    medians = [statistics.median(sample[column] for sample in samples) * 1000 for column in COLUMNS]
+    dirty = statistics.median(sample["dirty"] for sample in samples)
+    print(f"{mode:<16}" + "".join(f" {value:9.1f}" for value in medians) + f" {dirty / 2**20:11.2f}")
+    return samples[-1]["report"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--child", nargs=3, metavar=("MODE", "CONFIG", "TOKEN"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        mode, config, token = args.child
+        return child(mode, json.loads(config), token)
+
+    from cryptography.hazmat.primitives.asymmetric import rsa
+
+    from benchmarks.fake_sumo import FakeSumo
+    from benchmarks.bench_endpoints import make_jwk, make_token
+
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    with FakeSumo(make_jwk(key, "startup")) as fake:
+        config = {"SUMO_API_ENDPOINT": f"{fake.url}/api/v1", "JWKS_URL": "http://{jwks_host}/.well-known/jwks"}
+        token = make_token(key, "startup", f"127.0.0.1:{fake.port}")
+
+        print(f"median of {args.repeat} cold starts per mode; time in ms since the start of the process")
+        print(f"{'mode':<16}" + "".join(f" {column:>9}" for column in COLUMNS) + f" {'dirty MiB':>11}")
+        reports = {mode: run_mode(mode, config, token, args.repeat) for mode in MODES}
+
+    print()
+    for mode, report in reports.items():
+        print(f"{mode:<16} {report}")
+
+
+if __name__ == "__main__":
+    main()
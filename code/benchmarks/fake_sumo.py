@@ -0,0 +1,220 @@
+"""
+Local stand-in for the Sumo Logic search job API and the JWKS endpoint, for offline benchmarks.
+
+The fake runs in its own process, so it does not add to the time and memory
+measured in the app. Search queries are answered by the quoted values in them:
+sighting searches find messages_per_observable messages for every value except
+the ones starting with "none", and CrowdStrike lookups find intel for the values
+starting with "bad". Jobs gather their messages evenly over job_duration seconds.
+Fields clauses and _raw excerpts in sighting searches are applied to their messages.
+"""
+
+import re
+import json
+import time
+import random
+import threading
+import multiprocessing
+from http import HTTPStatus
+from urllib.parse import urlsplit, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import requests
+
+JOB_PATH = re.compile(r"^/api/v1/search/jobs/(?P<id>[^/]+)(?P<messages>/messages)?$")
+FIELDS_CLAUSE = re.compile(r" \| fields (?P<fields>[^|]*)")
+RAW_EXCERPT = re.compile(r" \| substring\(_raw, 0, (?P<size>\d+)\) as (?P<field>\w+)")
+
+
+class FakeSumoHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def settings(self):
+        return self.server.settings
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+    def do_DELETE(self):
+        self._handle("DELETE")
+
+    def _handle(self, method):
+        url = urlsplit(self.path)
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length)) if length else None
+
+        if url.path == "/_stats":
+            with self.server.lock:
+                stats = {"calls": self.server.calls, "jobs": len(self.server.jobs), "peak_jobs": self.server.peak_jobs}
+                return self._send(HTTPStatus.OK, stats)
+
+        match = JOB_PATH.match(url.path)
+        if url.path == "/api/v1/search/jobs":
+            call = "create"
+        elif match:
+            call = {"GET": "messages" if match["messages"] else "status", "DELETE": "delete"}[method]
+        else:
+            call = {"/.well-known/jwks": "jwks", "/api/v1/healthEvents": "health"}.get(url.path, "unknown")
+
+        with self.server.lock:
+            self.server.calls[call] = self.server.calls.get(call, 0) + 1
+        if self.settings["latency"]:
+            time.sleep(self.settings["latency"])
+
+        if call == "jwks":
+            return self._send(HTTPStatus.OK, {"keys": [self.server.jwk]})
+        if call == "unknown":
+            return self._send(HTTPStatus.NOT_FOUND, {"message": "Not found"})
+        if call != "delete" and random.random() < self.settings["error_rate"]:
+            return self._send(self.settings["error_status"], {"message": "Injected error"})
+        if call == "health":
+            return self._send(HTTPStatus.OK, {"data": []})
+        if call == "create":
+            return self._send(HTTPStatus.ACCEPTED, {"id": self._create_job(body["query"])})
+
+        with self.server.lock:
+            job = self.server.jobs.get(match["id"])
+            if call == "delete":
+                self.server.jobs.pop(match["id"], None)
+        if job is None:
+            return self._send(HTTPStatus.NOT_FOUND, {"message": "Job not found"})
+        if call == "delete":
+            return self._send(HTTPStatus.OK, {"id": match["id"]})
+
+        elapsed = time.time() - job["start"]
+        done = elapsed >= self.settings["job_duration"]
+        found = job["messages"] if done else job["messages"][: int(len(job["messages"]) * elapsed / job["duration"])]
+        if call == "status":
+            state = "DONE GATHERING RESULTS" if done else "GATHERING RESULTS"
+            return self._send(HTTPStatus.OK, {"state": state, "messageCount": len(found), "recordCount": 0})
+
+        params = parse_qs(url.query)
+        offset, limit = int(params.get("offset", [0])[0]), int(params.get("limit", [100])[0])
+        return self._send(HTTPStatus.OK, {"fields": [], "messages": found[offset:][:limit]})
+
+    def _create_job(self, query):
+        excerpt, projection = RAW_EXCERPT.search(query), FIELDS_CLAUSE.search(query)
+        query = FIELDS_CLAUSE.sub("", RAW_EXCERPT.sub("", query))
+        values = [value for quoted in re.findall(r'"([^"]*)"', query) for value in quoted.split(",")]
+        if "sumo://threat/cs" in query:
+            messages = [self._intel(value) for value in values if value.startswith("bad")]
+        else:
+            messages = [
+                self._project(self._message(value, index), excerpt, projection)
+                for value in values
+                if not value.startswith("none")
+                for index in range(self.settings["messages_per_observable"])
+            ]
+            messages.sort(key=lambda message: message["map"]["_messagetime"], reverse=True)
+
+        with self.server.lock:
+            self.server.job_count += 1
+            job_id = f"{self.server.job_count:016X}"
+            duration = max(self.settings["job_duration"], 1e-3)
+            self.server.jobs[job_id] = {"start": time.time(), "duration": duration, "messages": messages}
+            self.server.peak_jobs = max(self.server.peak_jobs, len(self.server.jobs))
+        return job_id
+
+    def _message(self, value, index):
+        message_time = int(time.time() * 1000) - 60_000 - index * 1000
+        fields = {
+            "_raw": f"{message_time} event {index} for {value} " + "x" * self.settings["raw_size"],
+            "_messageid": str(-8_500_000_000_000_000_000 + index),
+            "_messagetime": str(message_time),
+            "_messagecount": str(index),
+            "_collector": "collector",
+            "_source": "source",
+            "_sourcename": "/var/log/messages",
+            "_sourcecategory": "category",
+            "_blockid": "block",
+            "_size": str(self.settings["raw_size"]),
+            "src_ip": "10.0.0.1",
+            "dest_ip": "10.0.0.2",
+        }
+        fields.update({f"field_{field}": f"value {index}-{field}" for field in range(self.settings["fields"])})
+        return {"map": fields}
+
+    @staticmethod
+    def _project(message, excerpt, projection):
+        fields = message["map"]
+        if excerpt:
+            fields[excerpt["field"]] = fields["_raw"][: int(excerpt["size"])]
+        if projection:
+            names = {name.strip().removeprefix('%"').removesuffix('"') for name in projection["fields"].split(",")}
+            fields = {key: value for key, value in fields.items() if key in names}
+        return {"map": fields}
+
+    @staticmethod
+    def _intel(value):
+        raw = {"malicious_confidence": "high", "last_updated": 1_700_000_000, "reports": ["CSIT-0001"]}
+        return {"map": {"observable": value, "raw": json.dumps(raw)}}
+
+    def _send(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def serve(port, settings, jwk, ready):
+    server = ThreadingHTTPServer(("127.0.0.1", port), FakeSumoHandler)
+    server.daemon_threads = True
+    server.settings = settings
+    server.jwk = jwk
+    server.lock = threading.Lock()
+    server.calls = {}
+    server.jobs = {}
+    server.job_count = 0
+    server.peak_jobs = 0
+    ready.put(server.server_address[1])
+    server.serve_forever()
+
+
+class FakeSumo:
+    """
+    Fake Sumo Logic API running in a child process while used as a context manager.
+    """
+
+    DEFAULTS = {
+        "job_duration": 0.5,
+        "messages_per_observable": 20,
+        "raw_size": 200,
+        "fields": 10,
+        "latency": 0.0,
+        "error_rate": 0.0,
+        "error_status": HTTPStatus.INTERNAL_SERVER_ERROR,
+    }
+
+    def __init__(self, jwk, **settings):
+        self.jwk = jwk
+        self.settings = {**self.DEFAULTS, **settings}
+        self.port = None
+        self._process = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.port}"
+
+    def stats(self):
+        return requests.get(f"{self.url}/_stats").json()
+
+    def __enter__(self):
+        ready = multiprocessing.Queue()
+        self._process = multiprocessing.Process(target=serve, args=(0, self.settings, self.jwk, ready), daemon=True)
+        self._process.start()
+        self.port = ready.get(timeout=10)
+        return self
+
+    def __exit__(self, *exc_info):
+        self._process.terminate()
+        self._process.join()
@@ -1,15 +1,81 @@
-import json
-
-
 class Config:
-    settings = json.load(open("container_settings.json", "r"))
-    VERSION = settings["VERSION"]
+    SETTINGS_FILE = "container_settings.json"
 
     USER_AGENT = "SecureX Threat Response Integrations " "<tr-integrations-support@cisco.com>"
 
     CTR_ENTITIES_LIMIT_DEFAULT = 100
 
+    REQUEST_TIMEOUT = 55
+
+    ASYNC_VIEWS = False
+
+    OBSERVE_WORKERS_PER_REQUEST = 5
+    OBSERVE_WORKERS_PER_TENANT = 10
+
+    SEARCH_POLL_INITIAL_DELAY = 0.25
+    SEARCH_POLL_MAX_DELAY = 3
+    SEARCH_POLL_BACKOFF_FACTOR = 1.5
+    SEARCH_POLL_PROGRESS_BACKOFF_FACTOR = 1.2
+    SEARCH_EARLY_FETCH = True
+
+    SEARCH_SCHEDULER = True
+    SEARCH_SCHEDULER_DIR = "/tmp/sumologic-relay-scheduler"
+    SEARCH_JOBS_PER_TENANT = 20
+    SEARCH_JOBS_RATE = 4
+    SEARCH_JOBS_BURST = 10
+    SEARCH_JOB_LEASE = 120
+    SEARCH_THROTTLE_DELAY = 1
+
+    SEARCH_JOB_REAPER = True
+    SEARCH_JOB_REAPER_MAX_RETRIES = 3
+    SEARCH_JOB_REAPER_RETRY_DELAY = 1
+
+    COALESCE_SEARCHES = True
+    COALESCED_SEARCH_GRACE_TIME = 30
+
+    BATCH_SIGHTING_SEARCH = False
+    SIGHTING_SEARCH_BATCH_SIZE = 20
+    CROWD_STRIKE_LOOKUP_BATCH_SIZE = 100
+
     SUMO_API_ENDPOINT = "https://{host}/api/v1"
+    SUMO_POOL_SIZE = 10
+    SUMO_MAX_RETRIES = 3
+    SUMO_RETRY_BACKOFF_FACTOR = 0.5
+    # longest wait for a single response, within the request deadline
+    SUMO_REQUEST_TIMEOUT = 30
+
+    JWKS_URL = "https://{jwks_host}/.well-known/jwks"
+    JWKS_CACHE_TTL = 60 * 60
+    JWKS_CACHE_MAX_STALE = 24 * 60 * 60
+    JWKS_REFRESH_MIN_INTERVAL = 30
+    JWKS_CACHE_SIZE = 64
+    JWKS_REQUEST_TIMEOUT = 5
+
+    VERIFIED_TOKEN_CACHE_SIZE = 1024
+
+    FAST_JSON = True
+
+    METRICS_DIR = "/tmp/sumologic-relay-metrics"
+    METRICS_FLUSH_INTERVAL = 5
+
+    UWSGI_PRELOAD = True
+
+    CACHE_BACKEND = "uwsgi"
+    UWSGI_CACHE_NAME = "sumologic"
+    # blocksize of the cache in uwsgi.ini, larger values are cached per worker
+    UWSGI_CACHE_BLOCK_SIZE = 4096
+    CROWD_STRIKE_CACHE_SIZE = 10000
+    CROWD_STRIKE_CACHE_TTL = 15 * 60
+    SIGHTING_CACHE_SIZE = 500
+    SIGHTING_CACHE_TTL = 60 * 60
+    SIGHTING_CACHE_OVERLAP = 5 * 60
+
+    MESSAGES_CHUNK_SIZE = 64 * 1024
+    RAW_MESSAGE_MAX_SIZE = 16 * 1024
+
+    SIGHTING_FIELDS = None
+    SIGHTING_FIELDS_BY_SOURCE_CATEGORY = {}
+    SIGHTING_RAW_EXCERPT_SIZE = None
 
     HUMAN_READABLE_OBSERVABLE_TYPES = {
         "certificate_common_name": "certificate common name",
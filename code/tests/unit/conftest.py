@@ -0,0 +1,258 @@
+import io
+import re
+import json
+import time
+from unittest import mock
+from http import HTTPStatus
+from urllib.parse import urlsplit, parse_qs
+
+import jwt
+import httpx
+import pytest
+import requests
+from flask import Flask
+from requests.adapters import HTTPAdapter
+from urllib3 import HTTPResponse
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+from app import app, handle_tr_formatted_error
+from api.errors import TRFormattedError
+from api.json_provider import FastJSONProvider
+from api.singleflight import SingleFlight
+from api.tenant import TenantContext
+
+KID = "02B1174234C29F8EFB69911438F597FF3FFEE6B7"
+JWKS_HOST = "visibility.amp.cisco.com"
+SUMO_HOST = "api.us2.sumologic.com"
+SUMO_API_URL = f"https://{SUMO_HOST}/api/v1"
+
+JOB_PATH = re.compile(r"^/api/v1/search/jobs/(?P<id>[^/]+)(?P<messages>/messages)?$")
+
+
+class FakeSumoLogic:
+    """
+    In-memory stand-in for the Sumo Logic search job API.
+    Sighting searches find the messages set for the quoted values in their query,
+    CrowdStrike lookups find the intel set for them. Every job finds all its messages
+    at once, but is gathering results for the first gathering_polls status checks.
+    Statuses set in failures are returned, in order, instead of calling the API.
+    """
+
+    def __init__(self):
+        self.sightings = {}
+        self.intel = {}
+        self.gathering_polls = 1
+        self.final_state = "DONE GATHERING RESULTS"
+        self.failures = {}
+        self.calls = []
+        self.queries = []
+        self.jobs = {}
+        self.job_count = 0
+
+    def calls_to(self, call):
+        return self.calls.count(call)
+
+    def handle(self, method, path, params, body):
+        match = JOB_PATH.match(path)
+        if path == "/api/v1/search/jobs":
+            call = "create"
+        elif match:
+            call = {"GET": "messages" if match["messages"] else "status", "DELETE": "delete"}[method]
+        elif path == "/api/v1/healthEvents":
+            call = "health"
+        else:
+            return HTTPStatus.NOT_FOUND, {"message": "Not found"}
+
+        self.calls.append(call)
+        if self.failures.get(call):
+            return self.failures[call].pop(0), {"message": f"Injected {call} failure"}
+        if call == "health":
+            return HTTPStatus.OK, {"data": []}
+        if call == "create":
+            return HTTPStatus.ACCEPTED, {"id": self._create_job(body["query"])}
+
+        job = self.jobs.get(match["id"])
+        if job is None:
+            return HTTPStatus.NOT_FOUND, {"message": "Job not found"}
+        if call == "delete":
+            del self.jobs[match["id"]]
+            return HTTPStatus.OK, {"id": match["id"]}
+        if call == "status":
+            job["polls"] += 1
+            done = job["polls"] > self.gathering_polls
+            return HTTPStatus.OK, {
+                "state": self.final_state if done else "GATHERING RESULTS",
+                "messageCount": len(job["messages"]),
+                "recordCount": 0,
+            }
+
+        offset, limit = int(params.get("offset", [0])[0]), int(params.get("limit", [100])[0])
+        return HTTPStatus.OK, {"fields": [], "messages": job["messages"][offset:][:limit]}
+
+    def _create_job(self, query):
+        self.queries.append(query)
+        values = [value for quoted in re.findall(r'"([^"]*)"', query) for value in quoted.split(",")]
+        if "sumo://threat/cs" in query:
+            messages = [
+                {"map": {"observable": value, "raw": json.dumps(self.intel[value])}}
+                for value in values
+                if value in self.intel
+            ]
+        else:
+            messages = [message for value in values for message in self.sightings.get(value, [])]
+
+        self.job_count += 1
+        job_id = f"{self.job_count:016X}"
+        self.jobs[job_id] = {"polls": 0, "messages": messages}
+        return job_id
+
+    def handle_httpx(self, request):
+        body = json.loads(request.content) if request.content else None
+        status, payload = self.handle(request.method, request.url.path, parse_qs(request.url.query.decode()), body)
+        return httpx.Response(status, json=payload)
+
+
+class FakeSumoLogicAdapter(HTTPAdapter):
+    """
+    Transport adapter of a requests session answering every call with the fake API.
+    """
+
+    def __init__(self, sumo):
+        super().__init__()
+        self.sumo = sumo
+
+    def send(self, request, **kwargs):
+        url = urlsplit(request.url)
+        body = json.loads(request.body) if request.body else None
+        status, payload = self.sumo.handle(request.method, url.path, parse_qs(url.query), body)
+        raw = HTTPResponse(
+            body=io.BytesIO(json.dumps(payload).encode()),
+            status=status,
+            headers={"Content-Type": "application/json"},
+            preload_content=False,
+        )
+        return self.build_response(request, raw)
+
+
+@pytest.fixture(autouse=True)
+def app_state(tmp_path, monkeypatch):
+    """
+    Fresh process-wide state for every test, with short polling delays
+    and the scheduler and metrics files kept in the test's own folder.
+    """
+    monkeypatch.setattr("api.cache._caches", {})
+    monkeypatch.setattr("api.utils._verified_tokens", None)
+    monkeypatch.setattr("api.utils._jwks_cache", None)
+    monkeypatch.setattr("api.utils._tenant_semaphores", {})
+    monkeypatch.setattr("api.client._searches_in_flight", SingleFlight())
+    monkeypatch.setattr("api.scheduler._schedulers", {})
+
+    config = {
+        "CACHE_BACKEND": "memory",
+        "SEARCH_JOB_REAPER": False,
+        "SEARCH_POLL_INITIAL_DELAY": 0.001,
+        "SEARCH_POLL_MAX_DELAY": 0.01,
+        "SEARCH_THROTTLE_DELAY": 0.01,
+        "SUMO_RETRY_BACKOFF_FACTOR": 0,
+        "SEARCH_SCHEDULER_DIR": str(tmp_path / "scheduler"),
+        "METRICS_DIR": str(tmp_path / "metrics"),
+    }
+    for key, value in config.items():
+        monkeypatch.setitem(app.config, key, value)
+
+
+@pytest.fixture
+def test_app():
+    return app
+
+
+@pytest.fixture
+def async_app():
+    """
+    App serving the async views, as it is set up with ASYNC_VIEWS.
+    It shares the config of the app, so the tests change both alike.
+    """
+    from api.async_enrich import async_enrich_api
+
+    async_app = Flask("async_app")
+    async_app.config = app.config
+    async_app.json = FastJSONProvider(async_app)
+    async_app.register_blueprint(async_enrich_api)
+    async_app.register_error_handler(TRFormattedError, handle_tr_formatted_error)
+    return async_app
+
+
+@pytest.fixture
+def client():
+    return app.test_client()
+
+
+@pytest.fixture
+def async_client(async_app):
+    return async_app.test_client()
+
+
+@pytest.fixture(scope="session")
+def private_key():
+    return rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+
+@pytest.fixture(scope="session")
+def jwks(private_key):
+    jwk = json.loads(jwt.algorithms.RSAAlgorithm.to_jwk(private_key.public_key()))
+    return {"keys": [{**jwk, "kid": KID, "alg": "RS256", "use": "sig"}]}
+
+
+@pytest.fixture(autouse=True)
+def jwks_endpoint(jwks):
+    with mock.patch("requests.get") as get:
+        get.return_value.json.return_value = jwks
+        yield get
+
+
+@pytest.fixture
+def valid_jwt(private_key):
+    def _make_jwt(key=None, kid=KID, aud="http://localhost", **payload):
+        payload = {
+            "jwks_host": JWKS_HOST,
+            "host": SUMO_HOST,
+            "access_id": "access_id",
+            "access_key": "access_key",
+            "aud": aud,
+            "exp": int(time.time()) + 3600,
+            **payload,
+        }
+        return jwt.encode(
+            {key: value for key, value in payload.items() if value is not None},
+            key or private_key,
+            algorithm="RS256",
+            headers={"kid": kid},
+        )
+
+    return _make_jwt
+
+
+@pytest.fixture
+def auth_headers(valid_jwt):
+    return {"Authorization": f"Bearer {valid_jwt()}"}
+
+
+@pytest.fixture
+def tenant():
+    return TenantContext.from_payload(
+        {"host": SUMO_HOST, "access_id": "access_id", "access_key": "access_key"}, 100, app.config["SUMO_API_ENDPOINT"]
+    )
+
+
+@pytest.fixture
+def sumo(monkeypatch):
+    """
+    Fake Sumo Logic API answering the calls of both the sync and the async client.
+    """
+    sumo = FakeSumoLogic()
+    session = requests.Session()
+    session.mount("https://", FakeSumoLogicAdapter(sumo))
+    monkeypatch.setattr("api.client.get_session", lambda *args: session)
+    monkeypatch.setattr(httpx, "AsyncHTTPTransport", lambda **kwargs: httpx.MockTransport(sumo.handle_httpx))
+    sumo.session = session
+    return sumo
@@ -0,0 +1,139 @@
+import time
+
+OBSERVABLE = {"type": "ip", "value": "1.1.1.1"}
+
+SIGHTING_MESSAGE = {
+    "_raw": "Nov 14 22:13:20 firewall: allow 10.0.0.1 -> 1.1.1.1:443",
+    "_messageid": "-9223372036854775000",
+    "_messagetime": "1700000000000",
+    "_messagecount": "3",
+    "_collector": "collector",
+    "_source": "firewall",
+    "_sourcename": "/var/log/firewall",
+    "_sourcecategory": "network/firewall",
+    "_blockid": "-9223372036854775808",
+    "src_ip": "10.0.0.1",
+    "dest_ip": "1.1.1.1",
+    "action": "allow",
+    "port": "",
+}
+
+EXPECTED_SIGHTING = {
+    "confidence": "High",
+    "count": 3,
+    "data": {
+        "columns": [
+            {"name": "src_ip", "type": "string"},
+            {"name": "dest_ip", "type": "string"},
+            {"name": "action", "type": "string"},
+        ],
+        "rows": [["10.0.0.1", "1.1.1.1", "allow"]],
+    },
+    "description": "```\nNov 14 22:13:20 firewall: allow 10.0.0.1 -> 1.1.1.1:443\n```",
+    "external_ids": ["-9223372036854775000"],
+    "id": "transient:sighting-fd21c4da-868f-5321-ba1d-54eba5ec6a6b",
+    "internal": True,
+    "observables": [{"type": "ip", "value": "1.1.1.1"}],
+    "observed_time": {"start_time": "2023-11-14T22:13:20.000+00:00"},
+    "relations": [
+        {
+            "origin": "firewall",
+            "related": {"type": "ip", "value": "1.1.1.1"},
+            "relation": "Connected_To",
+            "source": {"type": "ip", "value": "10.0.0.1"},
+        }
+    ],
+    "schema_version": "1.1.6",
+    "short_description": "collector received a log from firewall - /var/log/firewall containing the observable",
+    "source": "Sumo Logic",
+    "source_uri": (
+        "https://service.us2.sumologic.com/ui/#/search/create?query=_messageid+%3D+-9223372036854775000"
+        "&startTime=1700000000000&endTime=1700000000001"
+    ),
+    "title": "Log message from last 30 days in Sumo Logic contains observable",
+    "type": "sighting",
+}
+
+CROWD_STRIKE_DATA = {
+    "malicious_confidence": "high",
+    "last_updated": 1700000000,
+    "reports": ["CSIT-17112"],
+}
+
+EXPECTED_JUDGEMENT = {
+    "confidence": "High",
+    "disposition": 2,
+    "disposition_name": "Malicious",
+    "external_references": [
+        {
+            "description": "CrowdStrike Intelligence Report",
+            "external_id": "CSIT-17112",
+            "source_name": "CrowdStrike",
+        }
+    ],
+    "id": "transient:judgement-480eaedf-dfe1-5db0-885a-4a9b9813539f",
+    "observable": {"type": "ip", "value": "1.1.1.1"},
+    "priority": 85,
+    "reason": "Found in CrowdStrike Intelligence",
+    "reason_uri": "https://www.crowdstrike.com/",
+    "schema_version": "1.1.6",
+    "severity": "High",
+    "source": "Sumo Logic",
+    "source_uri": "https://service.us2.sumologic.com/",
+    "tlp": "amber",
+    "type": "judgement",
+    "valid_time": {
+        "end_time": "2023-12-14T22:13:20.000+00:00",
+        "start_time": "2023-11-14T22:13:20.000+00:00",
+    },
+}
+
+EXPECTED_VERDICT = {
+    "disposition": 2,
+    "disposition_name": "Malicious",
+    "judgement_id": "transient:judgement-480eaedf-dfe1-5db0-885a-4a9b9813539f",
+    "observable": {"type": "ip", "value": "1.1.1.1"},
+    "type": "verdict",
+    "valid_time": {
+        "end_time": "2023-12-14T22:13:20.000+00:00",
+        "start_time": "2023-11-14T22:13:20.000+00:00",
+    },
+}
+
+EXPECTED_REFER = [
+    {
+        "categories": ["Search", "SumoLogic"],
+        "description": "Search for this IP in the Sumo Logic console",
+        "id": "ref-sumo-search-ip-1.1.1.1",
+        "title": "Search for this IP",
+        "url": (
+            "https://service.us2.sumologic.com/ui/#/search/create?query=%221.1.1.1%22&startTime=-30d&endTime=now"
+        ),
+    }
+]
+
+
+def sighting_message(value, index=0, age=60):
+    """
+    Message of a search job as Sumo Logic returns it, logged age seconds ago.
+    """
+    message_time = (int(time.time()) - age - index) * 1000
+    return {
+        "map": {
+            "_raw": f"{message_time} event {index} for {value}",
+            "_messageid": str(-9223372036854775000 + index),
+            "_messagetime": str(message_time),
+            "_messagecount": "1",
+            "_collector": "collector",
+            "_source": "source",
+            "_sourcename": "/var/log/messages",
+            "_sourcecategory": "category",
+            "_blockid": "-9223372036854775808",
+            "src_ip": "10.0.0.1",
+            "dest_ip": "10.0.0.2",
+        }
+    }
+
+
+def sighting_messages(value, count, age=60):
+    return [sighting_message(value, index, age) for index in range(count)]
@@ -0,0 +1,215 @@
+import ssl
+import asyncio
+from http import HTTPStatus
+from unittest import mock
+
+import httpx
+import pytest
+from flask import g
+
+from api import async_client
+from api.async_client import AsyncSumoLogicClient, _ThreadedResponse, get_ssl_context
+from api.errors import (
+    CriticalSumoLogicResponseError,
+    SumoLogicConnectionError,
+    SumoLogicSSLError,
+    SumoLogicTimeoutError,
+)
+from api.utils import Deadline
+from tests.unit.payloads_for_tests import CROWD_STRIKE_DATA, sighting_messages
+
+
+@pytest.fixture
+def run(test_app, sumo, tenant):
+    """
+    Run a coroutine of an async client in the context of a request.
+    """
+
+    def _run(call, *args):
+        async def run_client():
+            async with AsyncSumoLogicClient(tenant, Deadline(10)) as client:
+                return await getattr(client, call)(*args)
+
+        return asyncio.run(run_client())
+
+    with test_app.test_request_context():
+        yield _run
+
+
+@pytest.fixture(params=["httpx", "threads"])
+def transport(request, monkeypatch):
+    """
+    Run the tests through httpx, then through the pooled session in worker threads.
+    """
+    if request.param == "threads":
+        monkeypatch.setattr(async_client, "httpx", None)
+    return request.param
+
+
+def test_get_messages_and_crowd_strike_data(run, sumo, transport):
+    sumo.sightings["1.1.1.1"] = sighting_messages("1.1.1.1", 3)
+    sumo.intel["1.1.1.1"] = CROWD_STRIKE_DATA
+
+    messages, crowd_strike_data = run("get_messages_and_crowd_strike_data", "1.1.1.1")
+
+    assert len(messages) == 3
+    assert crowd_strike_data == CROWD_STRIKE_DATA
+    assert sumo.jobs == {}
+
+
+def test_get_messages_with_more_than_can_be_displayed(run, sumo, transport):
+    sumo.sightings["1.1.1.1"] = sighting_messages("1.1.1.1", 101)
+
+    assert len(run("get_messages", "1.1.1.1")) == 100
+    assert [error["code"] for error in g.errors] == ["too-many-messages-warning"]
+
+
+def test_crowd_strike_data_is_cached(run, sumo, transport):
+    sumo.intel["1.1.1.1"] = CROWD_STRIKE_DATA
+
+    assert run("get_crowd_strike_data", "1.1.1.1") == CROWD_STRIKE_DATA
+    assert run("get_crowd_strike_data", "1.1.1.1") == CROWD_STRIKE_DATA
+    assert sumo.calls_to("create") == 1
+
+
+def test_jobs_are_deleted_once_their_messages_are_fetched(run, sumo, transport):
+    run("get_messages", "1.1.1.1")
+
+    assert sumo.calls_to("delete") == 1
+
+
+def test_failed_call(run, sumo, transport):
+    sumo.failures["health"] = [HTTPStatus.UNAUTHORIZED]
+
+    with pytest.raises(CriticalSumoLogicResponseError) as error:
+        run("health")
+
+    assert error.value.message == "Unexpected response from SumoLogic: wrong access_id or access_key"
+
+
+def test_idempotent_calls_are_retried(run, sumo):
+    sumo.failures["status"] = [HTTPStatus.SERVICE_UNAVAILABLE, HTTPStatus.TOO_MANY_REQUESTS]
+
+    assert run("get_messages", "1.1.1.1") == []
+    assert sumo.calls_to("status") == 4
+
+
+def test_search_jobs_are_not_created_again_on_gateway_errors(run, sumo, monkeypatch):
+    monkeypatch.setattr(AsyncSumoLogicClient, "_reap_job", lambda self, search_id: None)
+    sumo.failures["create"] = [HTTPStatus.BAD_GATEWAY]
+
+    with pytest.raises(CriticalSumoLogicResponseError):
+        run("get_messages", "1.1.1.1")
+
+    assert sumo.calls_to("create") == 1
+
+
+@pytest.mark.parametrize(
+    "error, expected",
+    [
+        (httpx.ConnectError("refused"), SumoLogicConnectionError),
+        (httpx.ReadTimeout("timed out"), SumoLogicTimeoutError),
+        (httpx.ConnectError("handshake failed"), SumoLogicSSLError),
+    ],
+)
+def test_transport_errors(run, monkeypatch, error, expected):
+    if expected is SumoLogicSSLError:
+        certificate_error = ssl.SSLCertVerificationError(1, "certificate verify failed")
+        certificate_error.verify_message = "self signed certificate"
+        error.__cause__ = certificate_error
+
+    def fail(request):
+        raise error
+
+    monkeypatch.setattr(httpx, "AsyncHTTPTransport", lambda **kwargs: httpx.MockTransport(fail))
+
+    with pytest.raises(expected) as raised:
+        run("health")
+
+    if expected is SumoLogicSSLError:
+        assert raised.value.message == "Unable to verify SSL certificate: Self signed certificate"
+
+
+def test_search_job_timing_out_is_abandoned(run, sumo, monkeypatch, transport):
+    from requests.exceptions import ReadTimeout
+
+    sumo.sightings["1.1.1.1"] = sighting_messages("1.1.1.1", 1)
+    timeouts = []
+
+    def handle(request):
+        timeouts.append(request.extensions["timeout"]["read"])
+        if request.method == "GET" and not request.url.path.endswith("/messages"):
+            raise httpx.ReadTimeout("timed out")
+        return sumo.handle_httpx(request)
+
+    def request(method, url, *args, **kwargs):
+        timeouts.append(kwargs["timeout"])
+        if method == "GET" and not url.endswith("/messages"):
+            raise ReadTimeout()
+        return send(method, url, *args, **kwargs)
+
+    send = sumo.session.request
+    monkeypatch.setattr(httpx, "AsyncHTTPTransport", lambda **kwargs: httpx.MockTransport(handle))
+    monkeypatch.setattr(sumo.session, "request", request)
+
+    assert run("get_messages", "1.1.1.1") == []
+    assert [error["code"] for error in g.errors] == ["search job did not finish"]
+    assert sumo.calls_to("delete") == 1
+    assert len(timeouts) == 3 and all(9 < timeout <= 10 for timeout in timeouts)
+
+
+def test_messages_not_read_in_time_are_abandoned(run, sumo, monkeypatch):
+    class Stalled(httpx.AsyncByteStream):
+        async def __aiter__(self):
+            raise httpx.ReadTimeout("timed out")
+            yield b""
+
+    def handle(request):
+        if request.url.path.endswith("/messages"):
+            sumo.calls.append("messages")
+            return httpx.Response(HTTPStatus.OK, stream=Stalled())
+        return sumo.handle_httpx(request)
+
+    monkeypatch.setattr(httpx, "AsyncHTTPTransport", lambda **kwargs: httpx.MockTransport(handle))
+
+    assert run("get_messages", "1.1.1.1") == []
+    assert [error["code"] for error in g.errors] == ["search job did not finish"]
+    assert sumo.calls_to("messages") == 1
+    assert sumo.calls_to("delete") == 1
+
+
+def test_threaded_response_not_read_in_time_raises_timeout_error():
+    from requests.exceptions import ConnectionError
+
+    response = _ThreadedResponse(mock.Mock(status_code=HTTPStatus.OK, ok=True))
+    response._response.iter_content.return_value = iter(mock.Mock(side_effect=ConnectionError()), None)
+
+    async def read():
+        return [chunk async for chunk in response.aiter_bytes(1024)]
+
+    with pytest.raises(TimeoutError):
+        asyncio.run(read())
+
+
+def test_ssl_context_is_shared(monkeypatch):
+    monkeypatch.setattr(async_client, "_ssl_context", None)
+
+    assert get_ssl_context() is get_ssl_context()
+
+
+def test_cancelled_leader_lands_its_flight_without_an_outcome(run, monkeypatch):
+    followed = []
+
+    async def cancel(self, search_jobs):
+        # another request joins the flight, then the task group of this one cancels the leader
+        followed.extend(flight for _, flight in self._join_flights(search_jobs)[1])
+        raise asyncio.CancelledError()
+
+    monkeypatch.setattr(AsyncSumoLogicClient, "_execute", cancel)
+
+    with pytest.raises(asyncio.CancelledError):
+        run("get_messages", "1.1.1.1")
+
+    (flight,) = followed
+    assert flight.wait(0)
+    assert AsyncSumoLogicClient._leader_abandoned(flight)
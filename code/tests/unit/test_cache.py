@@ -0,0 +1,171 @@
+import time
+
+import pytest
+
+from api import cache
+from api.cache import LRUCache, Cache, MemoryBackend, UWSGIBackend, MISSING, get_cache, cache_stats
+
+
+class FakeUWSGICache:
+    """
+    Stand-in for the uwsgi caching framework, refusing values over the block size.
+    """
+
+    def __init__(self, block_size):
+        self.block_size = block_size
+        self.values = {}
+
+    def cache_get(self, key, cache_name):
+        return self.values.get((cache_name, key))
+
+    def cache_update(self, key, value, expires, cache_name):
+        if len(value) > self.block_size:
+            return None
+        self.values[(cache_name, key)] = value
+        return True
+
+    def cache_del(self, key, cache_name):
+        self.values.pop((cache_name, key), None)
+
+
+def test_lru_cache_evicts_the_least_recently_used_entry():
+    lru = LRUCache(2)
+    lru.set("a", 1)
+    lru.set("b", 2)
+    assert lru.get("a") == 1
+
+    lru.set("c", 3)
+
+    assert lru.get("b") is None
+    assert lru.get("a") == 1
+    assert lru.get("c") == 3
+    assert len(lru) == 2
+
+
+def test_lru_cache_entries_expire_at_their_own_time():
+    lru = LRUCache(10)
+    lru.set("expired", 1, expires_at=time.time() - 1)
+    lru.set("valid", 2, expires_at=time.time() + 60)
+    lru.set("forever", 3)
+
+    assert lru.get("expired", "default") == "default"
+    assert lru.get("valid") == 2
+    assert lru.get("forever") == 3
+    assert len(lru) == 2
+
+
+def test_lru_cache_entries_expire_after_the_default_ttl(monkeypatch):
+    lru = LRUCache(10, ttl=60)
+    lru.set("key", "value")
+    now = time.time()
+
+    monkeypatch.setattr(time, "time", lambda: now + 59)
+    assert lru.get("key") == "value"
+    monkeypatch.setattr(time, "time", lambda: now + 61)
+    assert lru.get("key") is None
+
+
+def test_lru_cache_delete_and_clear():
+    lru = LRUCache(10)
+    lru.set("a", 1)
+    lru.set("b", 2)
+
+    lru.delete("a")
+    lru.delete("missing")
+    assert lru.get("a") is None
+    assert len(lru) == 1
+
+    lru.clear()
+    assert len(lru) == 0
+
+
+def test_cache_tells_cached_none_from_a_miss():
+    named = Cache("intel", MemoryBackend(10), ttl=60)
+
+    assert named.get("host", "id", "1.1.1.1") is MISSING
+    named.set(None, "host", "id", "1.1.1.1")
+
+    assert named.get("host", "id", "1.1.1.1") is None
+    assert (named.hits, named.misses) == (1, 1)
+
+
+def test_cache_keys_are_separated_per_part():
+    named = Cache("intel", MemoryBackend(10), ttl=60)
+    named.set("first", "host", "id1")
+
+    assert named.get("host", "id1") == "first"
+    assert named.get("hosti", "d1") is MISSING
+    assert named.key("host", "id1").startswith("intel:")
+
+
+def test_cache_entries_expire_after_its_ttl(monkeypatch):
+    named = Cache("intel", MemoryBackend(10), ttl=60)
+    named.set("value", "key")
+    now = time.time()
+
+    monkeypatch.setattr(time, "time", lambda: now + 61)
+
+    assert named.get("key") is MISSING
+
+
+def test_uwsgi_backend_shares_values_that_fit_a_block(monkeypatch):
+    uwsgi = FakeUWSGICache(block_size=64)
+    monkeypatch.setattr(cache, "uwsgi", uwsgi)
+    backend = UWSGIBackend("sumologic", 64, maxsize=10)
+
+    backend.set("small", {"malicious_confidence": "high"}, 60)
+
+    assert uwsgi.values[("sumologic", "small")] == b'{"malicious_confidence": "high"}'
+    assert backend.get("small") == {"malicious_confidence": "high"}
+
+
+def test_uwsgi_backend_keeps_larger_values_in_the_worker(monkeypatch):
+    uwsgi = FakeUWSGICache(block_size=64)
+    monkeypatch.setattr(cache, "uwsgi", uwsgi)
+    backend = UWSGIBackend("sumologic", 64, maxsize=10)
+    uwsgi.values[("sumologic", "large")] = b'"stale"'
+
+    backend.set("large", {"reports": ["x" * 100]}, 60)
+
+    assert ("sumologic", "large") not in uwsgi.values
+    assert backend.get("large") == {"reports": ["x" * 100]}
+    assert backend.get("missing") is MISSING
+
+
+def test_uwsgi_backend_keeps_refused_values_in_the_worker(monkeypatch):
+    uwsgi = FakeUWSGICache(block_size=8)
+    monkeypatch.setattr(cache, "uwsgi", uwsgi)
+    backend = UWSGIBackend("sumologic", 64, maxsize=10)
+
+    backend.set("key", "refused value", 60)
+
+    assert backend.get("key") == "refused value"
+
+
+@pytest.mark.parametrize(
+    "backend, uwsgi, shared, expected",
+    [
+        ("uwsgi", FakeUWSGICache(4096), True, UWSGIBackend),
+        ("uwsgi", FakeUWSGICache(4096), False, MemoryBackend),
+        ("uwsgi", None, True, MemoryBackend),
+        ("memory", FakeUWSGICache(4096), True, MemoryBackend),
+    ],
+)
+def test_get_cache_chooses_the_backend(test_app, monkeypatch, backend, uwsgi, shared, expected):
+    monkeypatch.setitem(test_app.config, "CACHE_BACKEND", backend)
+    monkeypatch.setattr(cache, "uwsgi", uwsgi)
+
+    with test_app.app_context():
+        named = get_cache("intel", 10, 60, shared=shared)
+
+    assert isinstance(named.backend, expected)
+
+
+def test_get_cache_returns_the_same_cache_per_name(test_app):
+    with test_app.app_context():
+        named = get_cache("intel", 10, 60)
+        named.get("key")
+
+        assert get_cache("intel", 10, 60) is named
+        assert get_cache("sightings", 10, 60) is not named
+        assert cache_stats() == {"intel": {"hits": 0, "misses": 1}, "sightings": {"hits": 0, "misses": 0}}
@@ -0,0 +1,509 @@
+import asyncio
+import threading
+from http import HTTPStatus
+
+import pytest
+from flask import g
+
+from api import client as sumo_client
+from api.client import SumoLogicClient, SearchJob, keyword_match
+from api.errors import (
+    CriticalSumoLogicResponseError,
+    SearchJobWrongStateError,
+    SumoLogicConnectionError,
+)
+from api.projection import FieldProjection
+from api.utils import Deadline
+from tests.unit.payloads_for_tests import CROWD_STRIKE_DATA, sighting_message, sighting_messages
+
+
+@pytest.fixture
+def request_context(test_app):
+    with test_app.test_request_context() as context:
+        yield context
+
+
+@pytest.fixture
+def sumo_logic(request_context, sumo, tenant):
+    return SumoLogicClient(tenant, Deadline(10))
+
+
+def warnings():
+    return [error["code"] for error in g.get("errors", [])]
+
+
+def batch_message(*observables, unclear=()):
+    return {"map": {"_raw": " ".join(observables)}, "observables": list(observables), "unclear": list(unclear)}
+
+
+def finished_batch_search(sumo_logic, observables, message_count):
+    search_job = sumo_logic._messages_batch_search(observables)
+    search_job.status = {"messageCount": message_count}
+    search_job.finished = True
+    search_job.to_time = 1_700_000_000_000
+    return search_job
+
+
+@pytest.mark.parametrize(
+    "text, keyword, expected",
+    [
+        ("allow 10.0.0.1 -> 1.1.1.1:443", "1.1.1.1", True),
+        ("allow 10.0.0.1 -> 11.1.1.1:443", "1.1.1.1", False),
+        ("allow 10.0.0.1 -> 1.1.1.10:443", "1.1.1.1", False),
+        ("user=admin@example.com", "example.com", True),
+        ("host=evil.example.com", "example.com", True),
+        ("host=notexample.com", "example.com", False),
+        ("file=report_1.1.1.1.log", "1.1.1.1", None),
+        ("src_ip=1.1.1.1_", "1.1.1.1", None),
+        ("Login From EVIL.com", "evil.COM", True),
+        ("query (a+b)*", "(a+b)*", True),
+    ],
+)
+def test_keyword_match(text, keyword, expected):
+    assert keyword_match(text.casefold(), keyword) is expected
+
+
+def test_trim_message_keeps_the_fields_the_mapping_uses(request_context, monkeypatch, test_app):
+    monkeypatch.setitem(test_app.config, "RAW_MESSAGE_MAX_SIZE", 10)
+    message = sighting_message("1.1.1.1")
+
+    trimmed = SumoLogicClient._trim_message(message)
+
+    assert set(trimmed) == {"map"}
+    assert set(trimmed["map"]) == {
+        "_raw",
+        "_messageid",
+        "_messagetime",
+        "_messagecount",
+        "_collector",
+        "_source",
+        "_sourcename",
+        "src_ip",
+        "dest_ip",
+    }
+    assert trimmed["map"]["_raw"] == f"{message['map']['_raw'][:10]}..."
+    assert message["map"]["_raw"].endswith("1.1.1.1")
+
+
+def test_trim_message_records_the_observables_of_batch_searches(request_context, monkeypatch, test_app):
+    monkeypatch.setitem(test_app.config, "RAW_MESSAGE_MAX_SIZE", 10)
+    message = {"map": {"_raw": "from 1.1.1.1 to file_2.2.2.2 and 33.3.3.3"}}
+
+    trimmed = SumoLogicClient._trim_message(message, ["1.1.1.1", "2.2.2.2", "3.3.3.3"])
+
+    assert trimmed["observables"] == ["1.1.1.1"]
+    assert trimmed["unclear"] == ["2.2.2.2"]
+    assert trimmed["map"]["_raw"] == "from 1.1.1..."
+
+
+def test_trim_message_applies_the_projection(request_context):
+    projection = FieldProjection(["action"], {"network/*": ["port"]}, raw_excerpt_size=8)
+    message = {
+        "map": {
+            "raw_excerpt": "12345678",
+            "_messageid": "1",
+            "_sourcecategory": "network/firewall",
+            "action": "allow",
+            "Port": "443",
+            "user": "admin",
+        }
+    }
+
+    trimmed = SumoLogicClient._trim_message(message, projection=projection)
+
+    assert trimmed["map"] == {"_raw": "12345678...", "_messageid": "1", "action": "allow", "Port": "443"}
+    message["map"]["raw_excerpt"] = "1234"
+    assert SumoLogicClient._trim_message(message, projection=projection)["map"]["_raw"] == "1234"
+
+
+def test_assign_messages_splits_them_between_the_observables(sumo_logic):
+    observables = ["1.1.1.1", "2.2.2.2", "3.3.3.3"]
+    messages = [batch_message("1.1.1.1"), batch_message("1.1.1.1", "2.2.2.2"), batch_message("2.2.2.2")]
+    search_job = finished_batch_search(sumo_logic, observables, len(messages))
+
+    assigned, incomplete = sumo_logic._assign_messages(observables, search_job, messages)
+
+    assert assigned == {
+        "1.1.1.1": messages[:2],
+        "2.2.2.2": messages[1:],
+        "3.3.3.3": [],
+    }
+    assert incomplete == []
+    assert sumo_logic._cached_sightings(observables) == {
+        "1.1.1.1": {"messages": messages[:2], "to": search_job.to_time},
+        "2.2.2.2": {"messages": messages[1:], "to": search_job.to_time},
+        "3.3.3.3": {"messages": [], "to": search_job.to_time},
+    }
+
+
+def test_assign_messages_searches_again_observables_found_ambiguously(sumo_logic):
+    observables = ["1.1.1.1", "2.2.2.2"]
+    messages = [batch_message("1.1.1.1"), batch_message(unclear=["2.2.2.2"])]
+    search_job = finished_batch_search(sumo_logic, observables, len(messages))
+
+    assigned, incomplete = sumo_logic._assign_messages(observables, search_job, messages)
+
+    assert assigned["1.1.1.1"] == messages[:1]
+    assert incomplete == ["2.2.2.2"]
+    assert list(sumo_logic._cached_sightings(observables)) == ["1.1.1.1"]
+
+
+def test_assign_messages_of_a_saturated_batch(sumo_logic):
+    observables = ["1.1.1.1", "2.2.2.2"]
+    messages = [batch_message("1.1.1.1") for _ in range(150)] + [batch_message("2.2.2.2") for _ in range(52)]
+    search_job = finished_batch_search(sumo_logic, observables, 202)
+    assert search_job.messages_limit == 202
+
+    assigned, incomplete = sumo_logic._assign_messages(observables, search_job, messages)
+
+    assert incomplete == ["2.2.2.2"]
+    assert len(assigned["1.1.1.1"]) == 100
+    assert warnings() == ["too-many-messages-warning"]
+    assert len(sumo_logic._cached_sightings(observables)["1.1.1.1"]["messages"]) == 101
+
+
+def test_assign_messages_of_an_unfinished_batch_are_not_cached(sumo_logic):
+    search_job = finished_batch_search(sumo_logic, ["1.1.1.1"], 1)
+    search_job.finished = False
+
+    assigned, _ = sumo_logic._assign_messages(["1.1.1.1"], search_job, [batch_message("1.1.1.1")])
+
+    assert len(assigned["1.1.1.1"]) == 1
+    assert sumo_logic._cached_sightings(["1.1.1.1"]) == {}
+
+
+def test_merge_sightings_puts_new_messages_first_without_duplicates(sumo_logic):
+    cached = {"messages": sighting_messages("1.1.1.1", 3, age=600), "to": 0}
+    new = [sighting_message("1.1.1.1", 10, age=60), *cached["messages"][:1]]
+    to_time = int(new[0]["map"]["_messagetime"]) + 1000
+
+    merged = sumo_logic._merge_sightings(cached, new, to_time)
+
+    assert merged == [new[0], *cached["messages"]]
+
+
+def test_merge_sightings_drops_messages_older_than_30_days(sumo_logic):
+    cached = {"messages": [sighting_message("1.1.1.1", age=31 * 24 * 3600)], "to": 0}
+    new = [sighting_message("1.1.1.1", 1)]
+
+    merged = sumo_logic._merge_sightings(cached, new, int(new[0]["map"]["_messagetime"]))
+
+    assert merged == new
+
+
+def test_merge_sightings_of_a_saturated_search_that_aged_out_needs_a_new_search(sumo_logic):
+    old = sighting_messages("1.1.1.1", 101, age=31 * 24 * 3600)
+    cached = {"messages": [sighting_message("1.1.1.1", 200), *old[1:]], "to": 0}
+
+    assert sumo_logic._merge_sightings(cached, [], int(cached["messages"][0]["map"]["_messagetime"])) is None
+
+
+def test_crowd_strike_lookups_are_bulked(sumo_logic, monkeypatch, test_app):
+    monkeypatch.setitem(test_app.config, "CROWD_STRIKE_LOOKUP_BATCH_SIZE", 2)
+
+    search_jobs = sumo_logic._crowd_strike_bulk_searches(["a", "b", "c", "a", "d,e", 'f"'])
+
+    assert [search_job.observables for search_job in search_jobs] == [["a", "b"], ["d,e"], ['f"'], ["c"]]
+    assert '"a,b" as observables' in search_jobs[0].search_query
+
+
+def test_get_messages_and_crowd_strike_data(sumo_logic, sumo):
+    sumo.sightings["1.1.1.1"] = sighting_messages("1.1.1.1", 3)
+    sumo.intel["1.1.1.1"] = CROWD_STRIKE_DATA
+
+    messages, crowd_strike_data = sumo_logic.get_messages_and_crowd_strike_data("1.1.1.1")
+
+    assert [message["map"]["_messageid"] for message in messages] == [
+        message["map"]["_messageid"] for message in sumo.sightings["1.1.1.1"]
+    ]
+    assert crowd_strike_data == CROWD_STRIKE_DATA
+    assert (sumo.calls_to("create"), sumo.calls_to("status"), sumo.calls_to("delete")) == (2, 4, 2)
+    assert sumo.jobs == {}
+    assert warnings() == []
+
+
+def test_results_are_cached_for_the_tenant(sumo_logic, sumo, tenant):
+    sumo.sightings["1.1.1.1"] = sighting_messages("1.1.1.1", 2, age=600)
+    sumo_logic.get_messages_and_crowd_strike_data("1.1.1.1")
+    sumo.sightings["1.1.1.1"] = [sighting_message("1.1.1.1", 5), *sumo.sightings["1.1.1.1"][:1]]
+    sumo.intel["1.1.1.1"] = CROWD_STRIKE_DATA
+
+    messages, crowd_strike_data = sumo_logic.get_messages_and_crowd_strike_data("1.1.1.1")
+
+    assert [message["map"]["_messageid"] for message in messages] == [
+        str(-9223372036854775000 + index) for index in (5, 0, 1)
+    ]
+    assert crowd_strike_data is None
+    assert sumo.calls_to("create") == 3
+
+    other_tenant = SumoLogicClient(tenant._replace(access_id="other"), Deadline(10))
+    assert other_tenant.get_crowd_strike_data("1.1.1.1") == CROWD_STRIKE_DATA
+
+
+def test_more_messages_than_can_be_displayed(sumo_logic, sumo):
+    sumo.sightings["1.1.1.1"] = sighting_messages("1.1.1.1", 101)
+
+    messages = sumo_logic.get_messages("1.1.1.1")
+
+    assert len(messages) == 100
+    assert warnings() == ["too-many-messages-warning"]
+    assert sumo.calls_to("status") == 1
+
+
+def test_messages_are_fetched_as_soon_as_enough_were_found(sumo_logic, sumo):
+    sumo.gathering_polls = 100
+    sumo.sightings["1.1.1.1"] = sighting_messages("1.1.1.1", 101)[::-1]
+
+    messages = sumo_logic.get_messages("1.1.1.1")
+
+    assert [message["map"]["_messageid"] for message in messages[:2]] == [
+        str(-9223372036854775000 + index) for index in (0, 1)
+    ]
+    assert sumo.calls_to("status") == 1
+    assert sumo.jobs == {}
+
+
+def test_messages_are_not_fetched_early_when_disabled(sumo_logic, sumo, monkeypatch, test_app):
+    monkeypatch.setitem(test_app.config, "SEARCH_EARLY_FETCH", False)
+    sumo.gathering_polls = 2
+    sumo.sightings["1.1.1.1"] = sighting_messages("1.1.1.1", 101)
+
+    assert len(sumo_logic.get_messages("1.1.1.1")) == 100
+    assert sumo.calls_to("status") == 3
+
+
+def test_throttled_search_is_created_again(sumo_logic, sumo):
+    sumo.failures["create"] = [HTTPStatus.TOO_MANY_REQUESTS]
+    sumo.intel["1.1.1.1"] = CROWD_STRIKE_DATA
+
+    assert sumo_logic.get_crowd_strike_data("1.1.1.1") == CROWD_STRIKE_DATA
+    assert sumo.calls_to("create") == 2
+
+
+def test_failed_status_check_is_raised_and_the_job_reaped(sumo_logic, sumo, monkeypatch):
+    reaped = []
+    monkeypatch.setattr(SumoLogicClient, "_reap_job", lambda self, search_id: reaped.append(search_id))
+    sumo.failures["status"] = [HTTPStatus.UNAUTHORIZED]
+
+    with pytest.raises(CriticalSumoLogicResponseError) as error:
+        sumo_logic.get_messages("1.1.1.1")
+
+    assert error.value.message == "Unexpected response from SumoLogic: wrong access_id or access_key"
+    assert reaped == list(sumo.jobs)
+
+
+def test_cancelled_search_job(sumo_logic, sumo, monkeypatch):
+    monkeypatch.setattr(SumoLogicClient, "_reap_job", lambda self, search_id: None)
+    sumo.gathering_polls = 0
+    sumo.final_state = "CANCELLED"
+
+    with pytest.raises(SearchJobWrongStateError):
+        sumo_logic.get_messages("1.1.1.1")
+
+
+def test_search_jobs_past_the_deadline_are_abandoned(request_context, sumo, tenant):
+    sumo_logic = SumoLogicClient(tenant, Deadline(0))
+
+    messages, crowd_strike_data = sumo_logic.get_messages_and_crowd_strike_data("1.1.1.1")
+
+    assert (messages, crowd_strike_data) == ([], None)
+    assert warnings() == ["search job did not finish", "search job did not finish"]
+    assert sumo.calls == []
+
+
+def test_connection_error(sumo_logic, sumo, monkeypatch):
+    from requests.exceptions import ConnectionError
+
+    def refuse(*args, **kwargs):
+        raise ConnectionError()
+
+    monkeypatch.setattr(sumo.session, "request", refuse)
+
+    with pytest.raises(SumoLogicConnectionError):
+        sumo_logic.health()
+
+
+def time_out(sumo, monkeypatch, call, after=0):
+    """
+    Make the calls of the kind given time out in the pooled session, after letting some through.
+    """
+    from requests.exceptions import ReadTimeout
+
+    send = sumo.session.request
+    timeouts = []
+
+    def request(method, url, *args, **kwargs):
+        kind = {"POST": "create", "DELETE": "delete"}.get(method) or ("messages" if "/messages" in url else "status")
+        timeouts.append(kwargs["timeout"])
+        if kind == call and sumo.calls_to(call) >= after:
+            raise ReadTimeout()
+        return send(method, url, *args, **kwargs)
+
+    monkeypatch.setattr(sumo.session, "request", request)
+    return timeouts
+
+
+def test_calls_wait_at_most_the_time_left(sumo_logic, sumo, monkeypatch):
+    sumo.sightings["1.1.1.1"] = sighting_messages("1.1.1.1", 1)
+    timeouts = time_out(sumo, monkeypatch, None)
+
+    sumo_logic.get_messages("1.1.1.1")
+
+    assert len(timeouts) == len(sumo.calls)
+    assert all(9 < timeout <= 10 for timeout in timeouts)
+
+
+def test_calls_wait_at_most_the_request_timeout(sumo_logic, sumo, monkeypatch, test_app):
+    monkeypatch.setitem(test_app.config, "SUMO_REQUEST_TIMEOUT", 2)
+    timeouts = time_out(sumo, monkeypatch, None)
+
+    sumo_logic.get_messages("1.1.1.1")
+
+    assert timeouts == [2] * len(sumo.calls)
+
+
+@pytest.mark.parametrize(
+    "call, after, deleted",
+    [("create", 0, 0), ("status", 0, 1), ("status", 1, 1), ("messages", 0, 1)],
+)
+def test_search_job_timing_out_is_abandoned(sumo_logic, sumo, monkeypatch, call, after, deleted):
+    sumo.sightings["1.1.1.1"] = sighting_messages("1.1.1.1", 1)
+    time_out(sumo, monkeypatch, call, after)
+
+    assert sumo_logic.get_messages("1.1.1.1") == []
+    assert warnings() == ["search job did not finish"]
+    assert sumo.calls_to("delete") == deleted
+    assert not sumo.jobs or not deleted
+
+
+def test_search_job_not_deleted_in_time_is_reaped(sumo_logic, sumo, monkeypatch):
+    sumo.sightings["1.1.1.1"] = sighting_messages("1.1.1.1", 1)
+    time_out(sumo, monkeypatch, "delete")
+    reaped = []
+    monkeypatch.setattr(SumoLogicClient, "_reap_job", lambda self, search_id: reaped.append(search_id))
+
+    assert len(sumo_logic.get_messages("1.1.1.1")) == 1
+    assert reaped == ["0000000000000001"]
+    assert warnings() == []
+
+
+def test_batch_search_assigns_messages_back_to_observables(sumo_logic, sumo, monkeypatch, test_app):
+    monkeypatch.setitem(test_app.config, "SIGHTING_SEARCH_BATCH_SIZE", 3)
+    sumo.sightings = {
+        "1.1.1.1": [sighting_message("1.1.1.1")],
+        "2.2.2.2": [sighting_message("file_2.2.2.2", 1)],
+        "3.3.3.3": [],
+    }
+    sumo.intel["3.3.3.3"] = CROWD_STRIKE_DATA
+
+    results = sumo_logic.get_messages_and_crowd_strike_data_batch(["1.1.1.1", "2.2.2.2", "3.3.3.3"])
+
+    assert [[message["map"]["_messageid"] for message in messages] for messages, _ in results] == [
+        [sighting_message("1.1.1.1")["map"]["_messageid"]],
+        [sighting_message("2.2.2.2", 1)["map"]["_messageid"]],
+        [],
+    ]
+    assert [crowd_strike_data for _, crowd_strike_data in results] == [None, None, CROWD_STRIKE_DATA]
+    assert sumo.queries[0].startswith('("1.1.1.1" OR "2.2.2.2" OR "3.3.3.3") | limit 303')
+    assert sumo.queries[-1].startswith('"2.2.2.2" | limit 101')
+
+
+def land_in_background(flights, key, flight, result):
+    timer = threading.Timer(0.05, flights.land, [key, flight], {"result": result})
+    timer.start()
+    return timer
+
+
+def test_identical_search_in_flight_is_followed(sumo_logic, sumo):
+    search_job = sumo_logic._messages_search("1.1.1.1")
+    key = sumo_logic._flight_key(search_job)
+    flight, _ = sumo_client._searches_in_flight.join(key)
+    leader_job = sumo_logic._messages_search("1.1.1.1")
+    leader_job.status, leader_job.finished = {"messageCount": 1}, True
+
+    land_in_background(sumo_client._searches_in_flight, key, flight, (leader_job, ["leader message"]))
+
+    assert sumo_logic._get_data(search_job) == [["leader message"]]
+    assert search_job.finished
+    assert sumo.calls == []
+
+
+def test_search_led_by_an_abandoned_job_is_run_again(sumo_logic, sumo):
+    sumo.sightings["1.1.1.1"] = [sighting_message("1.1.1.1")]
+    search_job = sumo_logic._messages_search("1.1.1.1")
+    key = sumo_logic._flight_key(search_job)
+    flight, _ = sumo_client._searches_in_flight.join(key)
+    leader_job = sumo_logic._messages_search("1.1.1.1")
+    leader_job.abandoned = True
+
+    land_in_background(sumo_client._searches_in_flight, key, flight, (leader_job, []))
+
+    (messages,) = sumo_logic._get_data(search_job)
+    assert len(messages) == 1
+    assert sumo.calls_to("create") == 1
+
+
+def test_search_led_by_a_cancelled_job_is_run_again(sumo_logic, sumo):
+    sumo.sightings["1.1.1.1"] = [sighting_message("1.1.1.1")]
+    search_job = sumo_logic._messages_search("1.1.1.1")
+    key = sumo_logic._flight_key(search_job)
+    flight, _ = sumo_client._searches_in_flight.join(key)
+
+    land_in_background(sumo_client._searches_in_flight, key, flight, None)
+
+    (messages,) = sumo_logic._get_data(search_job)
+    assert len(messages) == 1
+    assert sumo.calls_to("create") == 1
+
+
+@pytest.mark.parametrize(
+    "error, shared",
+    [(ValueError("failed"), True), (asyncio.CancelledError(), False), (KeyboardInterrupt(), False)],
+)
+def test_leaders_share_only_the_exceptions_they_failed_with(sumo_logic, monkeypatch, error, shared):
+    search_job = sumo_logic._messages_search("1.1.1.1")
+    flights = []
+
+    def fail(search_jobs):
+        flights.append(sumo_client._searches_in_flight.join(sumo_logic._flight_key(search_job))[0])
+        raise error
+
+    monkeypatch.setattr(sumo_logic, "_execute", fail)
+
+    with pytest.raises(type(error)):
+        sumo_logic._get_data(search_job)
+
+    (flight,) = flights
+    assert flight.wait(0)
+    assert flight.error is (error if shared else None)
+
+
+def test_searches_are_not_coalesced_when_disabled(sumo_logic, sumo, monkeypatch, test_app):
+    monkeypatch.setitem(test_app.config, "COALESCE_SEARCHES", False)
+    search_job = sumo_logic._messages_search("1.1.1.1")
+    sumo_client._searches_in_flight.join(sumo_logic._flight_key(search_job))
+
+    assert sumo_logic._get_data(search_job) == [[]]
+    assert sumo.calls_to("create") == 1
+
+
+def test_jobs_are_deleted_by_the_reaper(sumo_logic, sumo, monkeypatch, test_app):
+    monkeypatch.setitem(test_app.config, "SEARCH_JOB_REAPER", True)
+    deleted = []
+    monkeypatch.setattr(
+        "api.client.get_reaper",
+        lambda *args: type("Reaper", (), {"delete": lambda self, session, url, *args: deleted.append(url)})(),
+    )
+
+    sumo_logic.get_messages("1.1.1.1")
+
+    assert deleted == [f"{sumo_logic._url}/search/jobs/0000000000000001"]
+    assert sumo.calls_to("delete") == 0
+
+
+def test_search_job_defaults():
+    search_job = SearchJob("1.1.1.1", "Sumo Logic", '"1.1.1.1"', 1000)
+
+    assert search_job.observables == ["1.1.1.1"]
+    assert search_job.warn_on_more_messages
+    assert not (search_job.finished or search_job.abandoned or search_job.demultiplex)
@@ -0,0 +1,170 @@
+import json
+from http import HTTPStatus
+
+import pytest
+
+from tests.unit.payloads_for_tests import (
+    OBSERVABLE,
+    SIGHTING_MESSAGE,
+    CROWD_STRIKE_DATA,
+    EXPECTED_SIGHTING,
+    EXPECTED_JUDGEMENT,
+    EXPECTED_VERDICT,
+    EXPECTED_REFER,
+    sighting_messages,
+)
+
+OTHER_OBSERVABLE = {"type": "domain", "value": "example.com"}
+
+
+@pytest.fixture(params=["client", "async_client"])
+def enrich_client(request):
+    """
+    Test client of the app serving the sync views, then of the one serving the async views.
+    """
+    return request.getfixturevalue(request.param)
+
+
+def ndjson(response):
+    return [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+
+def test_observe(enrich_client, sumo, auth_headers):
+    sumo.sightings[OBSERVABLE["value"]] = [{"map": SIGHTING_MESSAGE}]
+    sumo.intel[OBSERVABLE["value"]] = CROWD_STRIKE_DATA
+
+    response = enrich_client.post("/observe/observables", headers=auth_headers, json=[OBSERVABLE])
+
+    assert response.status_code == HTTPStatus.OK
+    assert response.get_json() == {
+        "data": {
+            "sightings": {"count": 1, "docs": [EXPECTED_SIGHTING]},
+            "judgements": {"count": 1, "docs": [EXPECTED_JUDGEMENT]},
+            "verdicts": {"count": 1, "docs": [EXPECTED_VERDICT]},
+        }
+    }
+
+
+def test_observe_many_observables_in_order(enrich_client, sumo, auth_headers):
+    sumo.sightings = {"1.1.1.1": sighting_messages("1.1.1.1", 2), "example.com": sighting_messages("example.com", 3)}
+
+    response = enrich_client.post("/observe/observables", headers=auth_headers, json=[OBSERVABLE, OTHER_OBSERVABLE])
+
+    sightings = response.get_json()["data"]["sightings"]
+    assert sightings["count"] == 5
+    assert [doc["observables"] for doc in sightings["docs"]] == [[OBSERVABLE]] * 2 + [[OTHER_OBSERVABLE]] * 3
+
+
+def test_observe_nothing_found(enrich_client, sumo, auth_headers):
+    response = enrich_client.post("/observe/observables", headers=auth_headers, json=[OBSERVABLE])
+
+    assert response.get_json() == {"data": {}}
+
+
+def test_observe_with_more_messages_than_can_be_displayed(enrich_client, sumo, auth_headers):
+    sumo.sightings[OBSERVABLE["value"]] = sighting_messages(OBSERVABLE["value"], 101)
+
+    response = enrich_client.post("/observe/observables", headers=auth_headers, json=[OBSERVABLE])
+
+    result = response.get_json()
+    assert result["data"]["sightings"]["count"] == 100
+    assert [error["code"] for error in result["errors"]] == ["too-many-messages-warning"]
+
+
+def test_observe_streamed(enrich_client, sumo, auth_headers):
+    sumo.sightings[OBSERVABLE["value"]] = [{"map": SIGHTING_MESSAGE}]
+
+    response = enrich_client.post(
+        "/observe/observables?stream=true", headers=auth_headers, json=[OBSERVABLE, OTHER_OBSERVABLE]
+    )
+
+    assert response.mimetype == "application/x-ndjson"
+    assert ndjson(response) == [
+        {"observable": OBSERVABLE, "data": {"sightings": {"count": 1, "docs": [EXPECTED_SIGHTING]}}},
+        {"observable": OTHER_OBSERVABLE, "data": {}},
+        {"errors": []},
+    ]
+
+
+def test_observe_streamed_ends_with_the_error(enrich_client, sumo, auth_headers):
+    sumo.failures["create"] = [HTTPStatus.UNAUTHORIZED] * 4
+
+    response = enrich_client.post("/observe/observables?stream=true", headers=auth_headers, json=[OBSERVABLE])
+
+    assert ndjson(response) == [
+        {
+            "errors": [
+                {
+                    "code": "Unauthorized",
+                    "message": "Unexpected response from SumoLogic: wrong access_id or access_key",
+                    "type": "fatal",
+                }
+            ]
+        }
+    ]
+
+
+def test_observe_in_batches(enrich_client, sumo, auth_headers, test_app, monkeypatch):
+    monkeypatch.setitem(test_app.config, "BATCH_SIGHTING_SEARCH", True)
+    sumo.sightings = {"1.1.1.1": sighting_messages("1.1.1.1", 2), "example.com": sighting_messages("example.com", 1)}
+    sumo.intel["example.com"] = CROWD_STRIKE_DATA
+
+    response = enrich_client.post("/observe/observables", headers=auth_headers, json=[OBSERVABLE, OTHER_OBSERVABLE])
+
+    data = response.get_json()["data"]
+    assert [doc["observables"] for doc in data["sightings"]["docs"]] == [[OBSERVABLE]] * 2 + [[OTHER_OBSERVABLE]]
+    assert [doc["observable"] for doc in data["verdicts"]["docs"]] == [OTHER_OBSERVABLE]
+    assert sumo.calls_to("create") == 2
+
+
+def test_observe_past_the_request_timeout(enrich_client, sumo, auth_headers):
+    response = enrich_client.post(
+        "/observe/observables", headers={**auth_headers, "X-Request-Timeout": "0"}, json=[OBSERVABLE]
+    )
+
+    assert [error["code"] for error in response.get_json()["errors"]] == ["search job did not finish"] * 2
+    assert sumo.calls == []
+
+
+def test_deliberate(enrich_client, sumo, auth_headers):
+    sumo.intel[OBSERVABLE["value"]] = CROWD_STRIKE_DATA
+
+    response = enrich_client.post("/deliberate/observables", headers=auth_headers, json=[OBSERVABLE, OTHER_OBSERVABLE])
+
+    expected_verdict = {key: value for key, value in EXPECTED_VERDICT.items() if key != "judgement_id"}
+    assert response.get_json() == {"data": {"verdicts": {"count": 1, "docs": [expected_verdict]}}}
+    assert sumo.calls_to("create") == 1
+
+
+def test_refer(enrich_client, auth_headers):
+    response = enrich_client.post("/refer/observables", headers=auth_headers, json=[OBSERVABLE])
+
+    assert response.get_json() == {"data": EXPECTED_REFER}
+
+
+@pytest.mark.parametrize(
+    "payload, message",
+    [
+        ([{"type": "ip"}], "{0: {'value': ['Missing data for required field.']}}"),
+        ([{"type": "", "value": "1.1.1.1"}], "{0: {'type': ['Field may not be blank.']}}"),
+        ({"type": "ip", "value": "1.1.1.1"}, "{'_schema': ['Invalid input type.']}"),
+    ],
+)
+def test_observe_invalid_observables(enrich_client, auth_headers, payload, message):
+    response = enrich_client.post("/observe/observables", headers=auth_headers, json=payload)
+
+    assert response.get_json() == {"errors": [{"code": "invalid argument", "message": message, "type": "fatal"}]}
+
+
+def test_observe_and_deliberate_with_a_projection(enrich_client, sumo, auth_headers, test_app, monkeypatch):
+    monkeypatch.setitem(test_app.config, "SIGHTING_FIELDS", ["src_ip"])
+    sumo.sightings[OBSERVABLE["value"]] = [{"map": SIGHTING_MESSAGE}]
+    sumo.intel[OBSERVABLE["value"]] = CROWD_STRIKE_DATA
+
+    observed = enrich_client.post("/observe/observables", headers=auth_headers, json=[OBSERVABLE]).get_json()
+    deliberated = enrich_client.post("/deliberate/observables", headers=auth_headers, json=[OBSERVABLE]).get_json()
+
+    assert observed["data"]["sightings"]["docs"][0]["data"]["rows"] == [["10.0.0.1", "1.1.1.1"]]
+    assert observed["data"]["judgements"]["docs"] == [EXPECTED_JUDGEMENT]
+    assert observed["data"]["verdicts"]["docs"] == [EXPECTED_VERDICT]
+    assert deliberated["data"]["verdicts"]["count"] == 1
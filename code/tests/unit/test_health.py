@@ -0,0 +1,113 @@
+from http import HTTPStatus
+from json import JSONDecodeError
+
+import pytest
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+from api.utils import (
+    NO_AUTH_HEADER,
+    WRONG_AUTH_TYPE,
+    WRONG_PAYLOAD_STRUCTURE,
+    WRONG_JWT_STRUCTURE,
+    WRONG_AUDIENCE,
+    KID_NOT_FOUND,
+    WRONG_KEY,
+    JWKS_HOST_MISSING,
+    WRONG_JWKS_HOST,
+)
+
+
+def authorization_error(message):
+    return {"errors": [{"code": "authorization error", "message": f"Authorization failed: {message}", "type": "fatal"}]}
+
+
+def test_health(client, sumo, auth_headers):
+    response = client.post("/health", headers=auth_headers)
+
+    assert response.status_code == HTTPStatus.OK
+    assert response.get_json() == {"data": {"status": "ok"}}
+    assert sumo.calls == ["health"]
+    assert "total;dur=" in response.headers["Server-Timing"]
+
+
+def test_health_with_wrong_credentials(client, sumo, auth_headers):
+    sumo.failures["health"] = [HTTPStatus.UNAUTHORIZED]
+
+    response = client.post("/health", headers=auth_headers)
+
+    assert response.get_json() == {
+        "errors": [
+            {
+                "code": "Unauthorized",
+                "message": "Unexpected response from SumoLogic: wrong access_id or access_key",
+                "type": "fatal",
+            }
+        ]
+    }
+
+
+def test_health_with_an_unknown_api_endpoint(client, sumo, auth_headers, test_app, monkeypatch):
+    monkeypatch.setitem(test_app.config, "SUMO_API_ENDPOINT", "https://{host}/api/v2")
+
+    response = client.post("/health", headers=auth_headers)
+
+    assert response.get_json()["errors"][0]["message"] == (
+        "Unexpected response from SumoLogic: URL https://api.us2.sumologic.com/api/v2/healthEvents is not found"
+    )
+
+
+@pytest.mark.parametrize(
+    "headers, message",
+    [
+        ({}, NO_AUTH_HEADER),
+        ({"Authorization": "Basic token"}, WRONG_AUTH_TYPE),
+        ({"Authorization": "Bearer not.a.jwt"}, WRONG_JWT_STRUCTURE),
+    ],
+)
+def test_health_with_a_wrong_authorization_header(client, headers, message):
+    response = client.post("/health", headers=headers)
+
+    assert response.get_json() == authorization_error(message)
+
+
+@pytest.mark.parametrize(
+    "claims, message",
+    [
+        ({"jwks_host": None}, JWKS_HOST_MISSING),
+        ({"access_key": None}, WRONG_PAYLOAD_STRUCTURE),
+        ({"aud": "http://other"}, WRONG_AUDIENCE),
+        ({"aud": None}, WRONG_PAYLOAD_STRUCTURE),
+        ({"kid": "unknown"}, KID_NOT_FOUND),
+        ({"key": rsa.generate_private_key(public_exponent=65537, key_size=2048)}, WRONG_KEY),
+    ],
+)
+def test_health_with_a_wrong_jwt(client, valid_jwt, claims, message):
+    response = client.post("/health", headers={"Authorization": f"Bearer {valid_jwt(**claims)}"})
+
+    assert response.get_json() == authorization_error(message)
+
+
+def test_health_with_a_wrong_jwks_host(client, valid_jwt, jwks_endpoint):
+    jwks_endpoint.return_value.json.side_effect = JSONDecodeError("Expecting value", "<html>", 0)
+
+    response = client.post("/health", headers={"Authorization": f"Bearer {valid_jwt()}"})
+
+    assert response.get_json() == authorization_error(WRONG_JWKS_HOST)
+
+
+def test_health_with_a_jwks_host_not_answering_in_time(client, valid_jwt, jwks_endpoint):
+    from requests.exceptions import ReadTimeout
+
+    jwks_endpoint.side_effect = ReadTimeout()
+
+    response = client.post("/health", headers={"Authorization": f"Bearer {valid_jwt()}"})
+
+    assert response.get_json() == authorization_error(WRONG_JWKS_HOST)
+
+
+def test_verified_tokens_are_not_verified_again(client, sumo, auth_headers, jwks_endpoint, monkeypatch):
+    assert client.post("/health", headers=auth_headers).status_code == HTTPStatus.OK
+
+    monkeypatch.setattr("jwt.decode", lambda *args, **kwargs: pytest.fail("token verified again"))
+    assert client.post("/health", headers=auth_headers).get_json() == {"data": {"status": "ok"}}
+    assert jwks_endpoint.call_count == 1
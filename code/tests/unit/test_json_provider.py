@@ -0,0 +1,60 @@
+import math
+import datetime
+from unittest import mock
+
+import pytest
+from flask.json.provider import DefaultJSONProvider
+
+from api import json_provider
+from api.json_provider import FastJSONProvider
+from tests.unit.payloads_for_tests import EXPECTED_SIGHTING
+
+
+@pytest.fixture
+def providers(test_app):
+    return FastJSONProvider(test_app), DefaultJSONProvider(test_app)
+
+
+@pytest.mark.parametrize(
+    "obj",
+    [
+        {"data": {"sightings": {"count": 1, "docs": [EXPECTED_SIGHTING]}}},
+        {"message": "café ☃ \U0001f600"},
+        {"control": "\x7f\x00"},
+        {"time": datetime.datetime(2023, 11, 14, 22, 13, 20)},
+        {"big": 2**70},
+    ],
+)
+def test_dumps_same_bytes_as_the_stdlib(providers, obj):
+    fast, default = providers
+
+    assert fast.dumps(obj, separators=(",", ":")) == default.dumps(obj, separators=(",", ":"))
+
+
+def test_dumps_with_other_formatting_uses_the_stdlib(providers):
+    fast, default = providers
+
+    assert fast.dumps({"a": [1]}, indent=2) == default.dumps({"a": [1]}, indent=2)
+
+
+def test_dumps_without_orjson(providers, monkeypatch):
+    monkeypatch.setattr(json_provider, "orjson", None)
+    fast, default = providers
+
+    assert fast.dumps({"b": 1, "a": 2}, separators=(",", ":")) == '{"a":2,"b":1}'
+
+
+def test_loads(providers):
+    fast, _ = providers
+
+    assert fast.loads('{"a": [1, "b"]}') == {"a": [1, "b"]}
+    assert math.isnan(fast.loads('{"a": NaN}')["a"])
+    with pytest.raises(ValueError):
+        fast.loads("{")
+
+
+def test_loads_with_options_uses_the_stdlib(providers):
+    fast, _ = providers
+    parse_int = mock.Mock(return_value=0)
+
+    assert fast.loads("[1]", parse_int=parse_int) == [0]
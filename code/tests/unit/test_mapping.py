@@ -0,0 +1,70 @@
+import pytest
+
+from api.mapping import Sighting, Judgement, Verdict, time_format, quote_number
+from tests.unit.payloads_for_tests import (
+    OBSERVABLE,
+    SIGHTING_MESSAGE,
+    CROWD_STRIKE_DATA,
+    EXPECTED_SIGHTING,
+    EXPECTED_JUDGEMENT,
+    EXPECTED_VERDICT,
+)
+
+
+@pytest.fixture
+def app_context(test_app):
+    with test_app.app_context():
+        yield
+
+
+def test_sighting(tenant):
+    assert Sighting(tenant).extract(SIGHTING_MESSAGE, OBSERVABLE) == EXPECTED_SIGHTING
+
+
+def test_sightings_of_a_page_of_messages(tenant):
+    sightings = Sighting(tenant).extract_many([SIGHTING_MESSAGE, SIGHTING_MESSAGE], OBSERVABLE)
+
+    assert sightings == [EXPECTED_SIGHTING, EXPECTED_SIGHTING]
+    assert sightings[0]["observables"][0] is not OBSERVABLE
+    assert sightings[0]["observables"][0] is not sightings[1]["observables"][0]
+
+
+def test_sighting_without_relations(tenant):
+    message = {**SIGHTING_MESSAGE, "dest_ip": "", "_messagecount": None}
+
+    sighting = Sighting(tenant).extract(message, OBSERVABLE)
+
+    assert "relations" not in sighting
+    assert sighting["count"] == 1
+
+
+def test_judgement(tenant, app_context):
+    assert Judgement(tenant).extract(CROWD_STRIKE_DATA, OBSERVABLE) == EXPECTED_JUDGEMENT
+
+
+def test_verdict(app_context):
+    assert Verdict().extract(CROWD_STRIKE_DATA, OBSERVABLE, EXPECTED_JUDGEMENT["id"]) == EXPECTED_VERDICT
+
+
+def test_verdict_of_an_observable_valid_forever(app_context):
+    verdict = Verdict().extract(CROWD_STRIKE_DATA, {"type": "sha256", "value": "0" * 64})
+
+    assert verdict["valid_time"]["end_time"] == "2525-01-01T00:00:00.000+00:00"
+    assert "judgement_id" not in verdict
+
+
+def test_time_format():
+    assert time_format(1700000000.5) == "2023-11-14T22:13:20.500+00:00"
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    [
+        ("-9223372036854775000", "-9223372036854775000"),
+        (1700000000000, "1700000000000"),
+        ("1 = 1", "1+%3D+1"),
+        ("-", "-"),
+    ],
+)
+def test_quote_number(value, expected):
+    assert quote_number(value) == expected
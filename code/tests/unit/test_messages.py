@@ -0,0 +1,96 @@
+import json
+import asyncio
+from json import JSONDecodeError
+
+import pytest
+
+from api.messages import MessagesParser, iter_messages, aiter_messages
+
+MESSAGES = [
+    {"map": {"_raw": "plain", "_messagetime": "1700000000000", "count": 12345}},
+    {"map": {"_raw": "multi-byte: é 日本 🚀", "nested": {"list": [1, 2.5, -3e2, True, None]}}},
+    {"map": {"_raw": 'escaped \\" quotes ]}, and brackets [{', "number": -0.125}},
+]
+BODY = json.dumps({"fields": [{"name": "_raw", "fieldType": "string"}], "messages": MESSAGES}).encode()
+
+
+def parse(chunks):
+    parser = MessagesParser()
+    messages = []
+    for chunk in chunks:
+        messages.extend(parser.feed(chunk))
+    messages.extend(parser.close())
+    return messages
+
+
+def test_messages_are_parsed_whatever_the_chunk_boundary():
+    for split in range(len(BODY) + 1):
+        assert parse([BODY[:split], BODY[split:]]) == MESSAGES, split
+
+
+def test_messages_are_parsed_byte_by_byte():
+    assert parse([BODY[index:][:1] for index in range(len(BODY))]) == MESSAGES
+
+
+def test_messages_are_returned_by_the_chunk_completing_them():
+    parser = MessagesParser()
+    split = BODY.index(b"}}") + 3
+
+    assert parser.feed(BODY[:split]) == [MESSAGES[0]]
+    assert parser.feed(BODY[split:-2]) == [MESSAGES[1]]
+    assert parser.feed(BODY[-2:]) + parser.close() == [MESSAGES[2]]
+
+
+def test_numbers_cut_by_a_chunk_are_not_returned_early():
+    parser = MessagesParser()
+
+    assert parser.feed(b'{"messages": [12') == []
+    assert parser.feed(b"34, 5") == [1234]
+    assert parser.feed(b"6]}") == [56]
+    assert parser.close() == []
+
+
+@pytest.mark.parametrize(
+    "body, expected",
+    [
+        (b'{"messages": []}', []),
+        (b"{}", []),
+        (b' \n{ "fields": [], "messages" : [ {"a": 1} ] , "extra": {"messages": [2]} } \n', [{"a": 1}]),
+        (b'{"messages": [{"a": 1}], "fields": []}', [{"a": 1}]),
+    ],
+)
+def test_messages_key_is_found_among_the_other_keys(body, expected):
+    assert parse([body]) == expected
+
+
+@pytest.mark.parametrize(
+    "body",
+    [
+        b'{"messages": [{"a": 1}',
+        b'{"messages": [{"a": 1}]}}',
+        b'["messages"]',
+        b'{"messages": [{"a": 1} {"b": 2}]}',
+        b'{"messages": [{"a": tru}]}',
+        b"",
+    ],
+)
+def test_invalid_bodies_raise_a_decode_error(body):
+    with pytest.raises(JSONDecodeError):
+        parse([body[:5], body[5:]])
+
+
+def test_iter_messages_yields_the_messages_of_all_chunks():
+    chunks = [BODY[start:][:7] for start in range(0, len(BODY), 7)]
+
+    assert list(iter_messages(chunks)) == MESSAGES
+
+
+def test_aiter_messages_yields_the_messages_of_all_chunks():
+    async def chunks():
+        for start in range(0, len(BODY), 7):
+            yield BODY[start:][:7]
+
+    async def collect():
+        return [message async for message in aiter_messages(chunks())]
+
+    assert asyncio.run(collect()) == MESSAGES
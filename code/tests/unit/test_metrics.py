@@ -0,0 +1,115 @@
+import os
+import json
+
+import pytest
+
+from api import instrumentation
+from api.instrumentation import BUCKETS, observe, count, timed, render_metrics, write_snapshot
+
+
+@pytest.fixture(autouse=True)
+def metrics(monkeypatch):
+    monkeypatch.setattr(instrumentation, "_histograms", {})
+    monkeypatch.setattr(instrumentation, "_counters", {})
+    monkeypatch.setattr(instrumentation, "_last_flush", 0.0)
+    monkeypatch.setattr(instrumentation, "_snapshot_pid", None)
+
+
+def write_worker_snapshot(directory, name, value):
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, name), "w") as file:
+        json.dump({"histograms": [], "counters": [["relay_search_jobs_total", [], value]]}, file)
+
+
+def test_observe_counts_the_duration_in_its_bucket():
+    observe("relay_stage_seconds", 0.02, stage="search")
+    observe("relay_stage_seconds", 100, stage="search")
+
+    histogram = instrumentation._histograms[("relay_stage_seconds", (("stage", "search"),))]
+    assert histogram["buckets"][BUCKETS.index(0.025)] == 1
+    assert histogram["buckets"][-1] == 1
+    assert histogram["count"] == 2
+    assert histogram["sum"] == 100.02
+
+
+def test_timed_adds_the_stage_to_the_request_timings(test_app):
+    with test_app.test_request_context():
+        with timed("search"):
+            pass
+        with timed("search"):
+            pass
+
+        assert list(instrumentation.g.timings) == ["search"]
+    assert instrumentation._histograms[("relay_stage_seconds", (("stage", "search"),))]["count"] == 2
+
+
+def test_render_metrics_in_the_prometheus_format(test_app):
+    observe("relay_request_seconds", 0.003, endpoint="/health")
+    count("relay_search_jobs_total", 2, status="done")
+
+    with test_app.app_context():
+        lines = render_metrics().splitlines()
+
+    assert "# TYPE relay_request_seconds histogram" in lines
+    assert 'relay_request_seconds_bucket{endpoint="/health",le="0.005"} 1' in lines
+    assert 'relay_request_seconds_bucket{endpoint="/health",le="+Inf"} 1' in lines
+    assert 'relay_request_seconds_count{endpoint="/health"} 1' in lines
+    assert "# TYPE relay_search_jobs_total counter" in lines
+    assert 'relay_search_jobs_total{status="done"} 2' in lines
+
+
+def test_render_metrics_sums_the_snapshots_of_all_workers(test_app):
+    count("relay_search_jobs_total", 2)
+    os.makedirs(test_app.config["METRICS_DIR"])
+    with test_app.app_context():
+        snapshot = {"histograms": [], "counters": [["relay_search_jobs_total", [], 3]]}
+        with open(f'{test_app.config["METRICS_DIR"]}/1.json', "w") as file:
+            json.dump(snapshot, file)
+        with open(f'{test_app.config["METRICS_DIR"]}/2.json', "w") as file:
+            file.write("{")
+
+        assert "relay_search_jobs_total 5" in render_metrics().splitlines()
+
+
+def test_snapshot_is_written_by_the_worker_process(test_app):
+    with test_app.app_context():
+        write_snapshot()
+
+    assert instrumentation._last_flush > 0
+
+
+def test_snapshots_of_exited_workers_are_folded_into_the_retired_snapshot(test_app, monkeypatch):
+    directory = test_app.config["METRICS_DIR"]
+    monkeypatch.setattr(instrumentation, "_is_running", lambda pid: pid == os.getpid())
+    write_worker_snapshot(directory, "100.json", 3)
+    write_worker_snapshot(directory, "200.json", 4)
+    count("relay_search_jobs_total", 2)
+
+    with test_app.app_context():
+        assert "relay_search_jobs_total 9" in render_metrics().splitlines()
+        assert "relay_search_jobs_total 9" in render_metrics().splitlines()
+
+    assert sorted(name for name in os.listdir(directory) if name.endswith(".json")) == [
+        f"{os.getpid()}.json",
+        "retired.json",
+    ]
+
+
+def test_snapshot_left_by_an_exited_worker_with_the_same_pid_is_not_overwritten(test_app):
+    write_worker_snapshot(test_app.config["METRICS_DIR"], f"{os.getpid()}.json", 3)
+    count("relay_search_jobs_total", 2)
+
+    with test_app.app_context():
+        write_snapshot()
+        write_snapshot()
+
+        assert "relay_search_jobs_total 5" in render_metrics().splitlines()
+
+
+def test_metrics_endpoint(client):
+    client.get("/watchdog", headers={"Health-Check": "test"})
+
+    response = client.get("/metrics")
+
+    assert response.mimetype == "text/plain"
+    assert 'relay_request_seconds_count{endpoint="/watchdog"} 1' in response.get_data(as_text=True)
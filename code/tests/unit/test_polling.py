@@ -0,0 +1,53 @@
+import pytest
+
+from api import polling
+from api.polling import PollSchedule, poll_stats
+
+
+def test_delay_backs_off_while_the_job_makes_no_progress():
+    schedule = PollSchedule(0.25, 3, 2, progress_backoff_factor=1.2)
+    status = {"messageCount": 0, "recordCount": 0}
+
+    delays = [schedule.next_delay(schedule.record_poll(status, 0)) for _ in range(6)]
+
+    assert delays == [0.25, 0.5, 1, 2, 3, 3]
+
+
+def test_delay_backs_off_gently_while_the_job_makes_progress():
+    schedule = PollSchedule(1, 3, 2, progress_backoff_factor=1.5)
+
+    delays = [
+        schedule.next_delay(schedule.record_poll({"messageCount": count, "recordCount": 0}, 0)) for count in range(6)
+    ]
+
+    assert delays == [1, 2, 3, 3, 3, 3]
+    assert PollSchedule(1, 10, 2, 1.5).next_delay(True) == 1
+
+
+def test_progress_is_measured_by_messages_and_records():
+    schedule = PollSchedule(1, 100, 2, progress_backoff_factor=1)
+
+    assert not schedule.record_poll({"messageCount": 1, "recordCount": 0}, 0)
+    assert not schedule.record_poll({"messageCount": 1, "recordCount": 0}, 0)
+    assert schedule.record_poll({"messageCount": 1, "recordCount": 5}, 0)
+    assert schedule.record_poll({"messageCount": 2, "recordCount": 5}, 0)
+    assert schedule.record_poll({}, 0)
+
+
+def test_delay_without_a_progress_factor_stays_put_on_progress():
+    schedule = PollSchedule(0.5, 3, 2)
+
+    assert [schedule.next_delay(True) for _ in range(3)] == [0.5, 0.5, 0.5]
+
+
+def test_finished_schedules_add_up_in_the_poll_stats(monkeypatch):
+    monkeypatch.setattr(polling, "_poll_stats", {"jobs": 0, "polls": 0, "slept": 0.0, "wasted": 0.0})
+    schedule = PollSchedule(0.25, 3, 2)
+    for waited in (0, 0.25, 0.5):
+        schedule.record_poll({"messageCount": 0}, waited)
+
+    schedule.finish()
+    schedule.finish()
+
+    assert poll_stats() == {"jobs": 2, "polls": 6, "slept": 1.5, "wasted": 1.0}
+    assert schedule.last_wait == pytest.approx(0.5)
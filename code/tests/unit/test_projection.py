@@ -0,0 +1,75 @@
+import pytest
+
+from api.projection import FieldProjection, quote_field
+
+MESSAGE_FIELDS = "_collector, _messagecount, _messageid, _messagetime, _raw, _source, _sourcename"
+EXCERPT_MESSAGE_FIELDS = "_collector, _messagecount, _messageid, _messagetime, _source, _sourcename"
+
+
+@pytest.mark.parametrize(
+    "name, expected",
+    [("src_ip", "src_ip"), ("_raw", "_raw"), ("Field1", "Field1"), ("user-agent", '%"user-agent"'), ("1st", '%"1st"')],
+)
+def test_quote_field(name, expected):
+    assert quote_field(name) == expected
+
+
+def test_clause_keeps_the_projected_fields_and_the_ones_the_mapping_reads():
+    projection = FieldProjection(["action", "user-agent", "src_ip"], {})
+
+    assert projection.clause() == f' | fields {MESSAGE_FIELDS}, dest_ip, src_ip, action, %"user-agent"'
+
+
+def test_clause_adds_the_source_category_fields():
+    projection = FieldProjection(["action"], {"network/*": ["port", "action"], "auth": ["user"]})
+
+    assert projection.clause() == (f" | fields {MESSAGE_FIELDS}, dest_ip, src_ip, _sourcecategory, action, port, user")
+
+
+def test_clause_cuts_an_excerpt_of_raw():
+    projection = FieldProjection(["action"], {}, raw_excerpt_size=256)
+
+    assert projection.clause() == (
+        f" | substring(_raw, 0, 256) as raw_excerpt | fields {EXCERPT_MESSAGE_FIELDS}, dest_ip, src_ip, raw_excerpt,"
+        " action"
+    )
+
+
+def test_clause_without_raw_excerpt_keeps_the_whole_raw():
+    projection = FieldProjection(["action"], {}, raw_excerpt_size=256)
+
+    assert projection.clause(raw_excerpt=False) == f" | fields {MESSAGE_FIELDS}, dest_ip, src_ip, action"
+
+
+def test_data_fields_match_source_categories_without_regard_to_case():
+    projection = FieldProjection(["Action"], {"Network/*": ["Port"], "auth": ["user"]})
+
+    assert projection.data_fields("network/Firewall") == {"action", "port", "src_ip", "dest_ip"}
+    assert projection.data_fields("AUTH") == {"action", "user", "src_ip", "dest_ip"}
+    assert projection.data_fields(None) == {"action", "src_ip", "dest_ip"}
+    assert projection.data_fields("network/firewall") is projection.data_fields("NETWORK/FIREWALL")
+
+
+@pytest.mark.parametrize(
+    "fields, fields_by_source_category, raw_excerpt_size, expected",
+    [
+        (None, {}, None, None),
+        (None, {}, 256, None),
+        ([], {}, None, []),
+        (None, {"auth": ["user"]}, None, []),
+    ],
+)
+def test_from_config(fields, fields_by_source_category, raw_excerpt_size, expected):
+    projection = FieldProjection.from_config(
+        {
+            "SIGHTING_FIELDS": fields,
+            "SIGHTING_FIELDS_BY_SOURCE_CATEGORY": fields_by_source_category,
+            "SIGHTING_RAW_EXCERPT_SIZE": raw_excerpt_size,
+        }
+    )
+
+    if expected is None:
+        assert projection is None
+    else:
+        assert projection.data_fields("other") == {"src_ip", "dest_ip"}
+        assert projection.raw_excerpt_size == raw_excerpt_size
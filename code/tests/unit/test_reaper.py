@@ -0,0 +1,98 @@
+import time
+import logging
+from unittest import mock
+from http import HTTPStatus
+
+import pytest
+
+from api import reaper
+from api.reaper import JobReaper, get_reaper
+
+URL = "https://api.us2.sumologic.com/api/v1/search/jobs/0000000000000001"
+
+
+def response(status_code):
+    return mock.Mock(status_code=status_code, ok=status_code < 400)
+
+
+def wait_until(condition, timeout=2):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.005)
+    return condition()
+
+
+@pytest.fixture
+def session():
+    return mock.Mock()
+
+
+@pytest.fixture
+def logger():
+    return mock.Mock(spec=logging.Logger)
+
+
+def test_jobs_are_deleted_in_the_background(session, logger):
+    session.delete.return_value = response(HTTPStatus.OK)
+    job_reaper = JobReaper(3, 0.001, logger, timeout=5)
+
+    job_reaper.delete(session, URL, ("id", "key"), {"User-Agent": "relay"}, cookies="jar")
+
+    assert wait_until(lambda: not job_reaper.pending())
+    session.delete.assert_called_once_with(
+        URL, auth=("id", "key"), headers={"User-Agent": "relay"}, cookies="jar", timeout=5
+    )
+
+
+def test_jobs_already_gone_are_not_deleted_again(session, logger):
+    session.delete.return_value = response(HTTPStatus.NOT_FOUND)
+    job_reaper = JobReaper(3, 0.001, logger)
+
+    job_reaper.delete(session, URL, None, {})
+
+    assert wait_until(lambda: not job_reaper.pending())
+    assert session.delete.call_count == 1
+
+
+def test_failed_deletions_are_retried(session, logger):
+    session.delete.side_effect = [ConnectionError(), response(HTTPStatus.SERVICE_UNAVAILABLE), response(HTTPStatus.OK)]
+    job_reaper = JobReaper(3, 0.001, logger)
+
+    job_reaper.delete(session, URL, None, {})
+
+    assert wait_until(lambda: session.delete.call_count == 3 and not job_reaper.pending())
+    logger.exception.assert_called_once()
+
+
+def test_deletion_is_given_up_after_the_retries(session, logger):
+    session.delete.return_value = response(HTTPStatus.SERVICE_UNAVAILABLE)
+    job_reaper = JobReaper(2, 0.001, logger)
+
+    job_reaper.delete(session, URL, None, {})
+
+    assert wait_until(lambda: not job_reaper.pending())
+    assert session.delete.call_count == 3
+    logger.error.assert_called_once_with(f"Giving up deleting search job {URL}")
+
+
+def test_sweep_deletes_the_pending_jobs_right_away(session, logger):
+    session.delete.return_value = response(HTTPStatus.SERVICE_UNAVAILABLE)
+    job_reaper = JobReaper(1, 60, logger)
+    job_reaper.delete(session, URL, None, {})
+    assert wait_until(lambda: session.delete.call_count == 1)
+
+    session.delete.return_value = response(HTTPStatus.OK)
+    job_reaper.sweep()
+
+    assert job_reaper.pending() == []
+    assert session.delete.call_count == 2
+
+
+def test_get_reaper_is_shared_by_the_worker_process(logger, monkeypatch):
+    monkeypatch.setattr(reaper, "_reapers", {})
+    monkeypatch.setattr(reaper.atexit, "register", mock.Mock())
+
+    job_reaper = get_reaper(3, 1, logger)
+
+    assert get_reaper(3, 1, logger) is job_reaper
+    reaper.atexit.register.assert_called_once_with(job_reaper.sweep)
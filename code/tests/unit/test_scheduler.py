@@ -0,0 +1,195 @@
+import pytest
+
+from api import scheduler
+from api.scheduler import (
+    Ticket,
+    SearchJobScheduler,
+    UnlimitedScheduler,
+    get_scheduler,
+    PRIORITY_DELIBERATE,
+    PRIORITY_OBSERVE,
+    RETRY_INTERVAL,
+    WAITER_TIMEOUT,
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1_700_000_000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(scheduler, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def state_path(tmp_path):
+    return str(tmp_path / "tenant.json")
+
+
+def make_scheduler(path, max_jobs=10, rate=2, burst=3, lease=60):
+    return SearchJobScheduler(path, max_jobs, rate, burst, lease)
+
+
+def test_token_bucket_admits_a_burst_then_paces_jobs_at_its_rate(clock, state_path):
+    jobs = make_scheduler(state_path)
+    tickets = [Ticket(PRIORITY_OBSERVE) for _ in range(4)]
+
+    assert [jobs.try_acquire(ticket) for ticket in tickets[:3]] == [0, 0, 0]
+    assert jobs.try_acquire(tickets[3]) == pytest.approx(0.5)
+
+    clock.now += 0.5
+    assert jobs.try_acquire(tickets[3]) == 0
+    assert all(ticket.admitted for ticket in tickets)
+
+
+def test_token_bucket_refills_up_to_the_burst(clock, state_path):
+    jobs = make_scheduler(state_path)
+    for _ in range(3):
+        jobs.try_acquire(Ticket(PRIORITY_OBSERVE))
+
+    clock.now += 60
+    waits = [jobs.try_acquire(Ticket(PRIORITY_OBSERVE)) for _ in range(4)]
+
+    assert waits[:3] == [0, 0, 0]
+    assert waits[3] > 0
+
+
+def test_waiting_jobs_are_told_when_their_token_comes(clock, state_path):
+    jobs = make_scheduler(state_path, rate=1, burst=1)
+    jobs.try_acquire(Ticket(PRIORITY_OBSERVE))
+
+    first, second = Ticket(PRIORITY_OBSERVE), Ticket(PRIORITY_OBSERVE)
+    clock.now += 0.001
+    second.since = clock.now
+
+    assert jobs.try_acquire(first) == pytest.approx(0.999)
+    assert jobs.try_acquire(second) == pytest.approx(1.999)
+
+
+def test_jobs_wait_for_a_free_slot(clock, state_path):
+    jobs = make_scheduler(state_path, max_jobs=1)
+    running, waiting = Ticket(PRIORITY_OBSERVE), Ticket(PRIORITY_OBSERVE)
+    jobs.try_acquire(running)
+
+    assert jobs.try_acquire(waiting) == RETRY_INTERVAL
+    jobs.release(running)
+    assert jobs.try_acquire(waiting) == 0
+    assert not running.admitted
+
+
+def test_deliberate_jobs_go_before_observe_jobs(clock, state_path):
+    jobs = make_scheduler(state_path, max_jobs=1)
+    running = Ticket(PRIORITY_OBSERVE)
+    jobs.try_acquire(running)
+
+    observe = Ticket(PRIORITY_OBSERVE)
+    clock.now += 1
+    deliberate = Ticket(PRIORITY_DELIBERATE)
+    deliberate.since = clock.now
+    jobs.try_acquire(observe)
+    jobs.try_acquire(deliberate)
+    jobs.release(running)
+
+    assert jobs.try_acquire(observe) > 0
+    assert jobs.try_acquire(deliberate) == 0
+    jobs.release(deliberate)
+    assert jobs.try_acquire(observe) == 0
+
+
+def test_waiters_that_stopped_asking_do_not_hold_back_the_queue(clock, state_path):
+    jobs = make_scheduler(state_path, max_jobs=1)
+    running = Ticket(PRIORITY_OBSERVE)
+    jobs.try_acquire(running)
+    gone = Ticket(PRIORITY_DELIBERATE)
+    jobs.try_acquire(gone)
+    jobs.release(running)
+
+    clock.now += WAITER_TIMEOUT + 1
+    assert jobs.try_acquire(Ticket(PRIORITY_OBSERVE)) == 0
+
+
+def test_cancelled_waiters_do_not_hold_back_the_queue(clock, state_path):
+    jobs = make_scheduler(state_path, max_jobs=1)
+    running = Ticket(PRIORITY_OBSERVE)
+    jobs.try_acquire(running)
+    cancelled = Ticket(PRIORITY_DELIBERATE)
+    jobs.try_acquire(cancelled)
+    jobs.cancel(cancelled)
+    jobs.cancel(running)
+    jobs.release(running)
+
+    assert jobs.try_acquire(Ticket(PRIORITY_OBSERVE)) == 0
+
+
+def test_slots_expire_after_the_lease(clock, state_path):
+    jobs = make_scheduler(state_path, max_jobs=1, lease=60)
+    jobs.try_acquire(Ticket(PRIORITY_OBSERVE))
+    waiting = Ticket(PRIORITY_OBSERVE)
+
+    assert jobs.try_acquire(waiting) == RETRY_INTERVAL
+    clock.now += 61
+    assert jobs.try_acquire(waiting) == 0
+
+
+def test_throttle_holds_back_every_job_and_empties_the_bucket(clock, state_path):
+    jobs = make_scheduler(state_path)
+    jobs.throttle(5)
+
+    assert jobs.try_acquire(Ticket(PRIORITY_DELIBERATE)) == 5
+    clock.now += 5
+    assert jobs.try_acquire(Ticket(PRIORITY_DELIBERATE)) == 0
+
+    jobs.throttle(0.1)
+    clock.now += 0.1
+    assert jobs.try_acquire(Ticket(PRIORITY_DELIBERATE)) == pytest.approx(0.4)
+
+
+def test_state_is_shared_by_the_schedulers_of_every_process(clock, state_path):
+    first, second = make_scheduler(state_path, max_jobs=1), make_scheduler(state_path, max_jobs=1)
+    ticket = Ticket(PRIORITY_OBSERVE)
+    first.try_acquire(ticket)
+
+    assert second.try_acquire(Ticket(PRIORITY_OBSERVE)) == RETRY_INTERVAL
+    first.release(ticket)
+    assert second.try_acquire(Ticket(PRIORITY_OBSERVE)) == 0
+
+
+def test_releasing_a_ticket_that_was_not_admitted_does_nothing(clock, state_path):
+    jobs = make_scheduler(state_path, max_jobs=1)
+    running = Ticket(PRIORITY_OBSERVE)
+    jobs.try_acquire(running)
+
+    jobs.release(Ticket(PRIORITY_OBSERVE))
+
+    assert jobs.try_acquire(Ticket(PRIORITY_OBSERVE)) == RETRY_INTERVAL
+
+
+def test_unlimited_scheduler_admits_every_job():
+    jobs = UnlimitedScheduler()
+    ticket = Ticket(PRIORITY_OBSERVE)
+
+    assert jobs.try_acquire(ticket) == 0
+    jobs.throttle(5)
+    jobs.cancel(ticket)
+    assert ticket.admitted
+    jobs.release(ticket)
+    assert not ticket.admitted
+
+
+def test_get_scheduler_is_shared_per_tenant(test_app, monkeypatch):
+    with test_app.app_context():
+        jobs = get_scheduler("host", "access_id")
+
+        assert isinstance(jobs, SearchJobScheduler)
+        assert get_scheduler("host", "access_id") is jobs
+        assert get_scheduler("host", "other_access_id") is not jobs
+
+        monkeypatch.setitem(test_app.config, "SEARCH_SCHEDULER", False)
+        assert isinstance(get_scheduler("host", "access_id"), UnlimitedScheduler)
@@ -0,0 +1,36 @@
+import pytest
+
+from api import session
+from api.session import get_session, session_stats
+
+
+@pytest.fixture(autouse=True)
+def sessions(monkeypatch):
+    monkeypatch.setattr(session, "_sessions", {})
+
+
+def test_session_is_shared_per_host():
+    shared = get_session("api.us2.sumologic.com", 10, 3, 0.5)
+
+    assert get_session("api.us2.sumologic.com", 10, 3, 0.5) is shared
+    assert get_session("api.eu.sumologic.com", 10, 3, 0.5) is not shared
+
+
+def test_session_retries_only_idempotent_calls():
+    retry = get_session("api.us2.sumologic.com", 10, 3, 0.5).get_adapter("https://api.us2.sumologic.com").max_retries
+
+    assert retry.total == 3
+    assert retry.allowed_methods == {"GET", "DELETE"}
+    assert set(retry.status_forcelist) == {429, 502, 503, 504}
+
+
+def test_session_keeps_no_cookies_of_any_tenant():
+    policy = get_session("api.us2.sumologic.com", 10, 3, 0.5).cookies.get_policy()
+
+    assert policy.is_not_allowed("api.us2.sumologic.com")
+
+
+def test_session_stats_count_the_requests_and_connections_per_host():
+    get_session("api.us2.sumologic.com", 10, 3, 0.5)
+
+    assert session_stats() == {"api.us2.sumologic.com": {"requests": 0, "connections": 0}}
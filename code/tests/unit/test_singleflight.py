@@ -0,0 +1,78 @@
+import threading
+
+import pytest
+
+from api.singleflight import SingleFlight
+
+
+def test_first_caller_leads_and_followers_share_its_flight():
+    flights = SingleFlight()
+
+    flight, leader = flights.join("key")
+    joined, follower_leads = flights.join("key")
+    other, other_leads = flights.join("other key")
+
+    assert leader and not follower_leads and other_leads
+    assert joined is flight
+    assert other is not flight
+
+
+def test_followers_get_the_result_of_the_leader():
+    flights = SingleFlight()
+    flight, _ = flights.join("key")
+    results = []
+
+    def follow(joined):
+        assert joined.wait(5)
+        results.append(joined.outcome())
+
+    followers = [threading.Thread(target=follow, args=[flights.join("key")[0]]) for _ in range(3)]
+    for follower in followers:
+        follower.start()
+    flights.land("key", flight, result="messages")
+    for follower in followers:
+        follower.join()
+
+    assert results == ["messages"] * 3
+
+
+def test_followers_get_the_error_of_the_leader():
+    flights = SingleFlight()
+    flight, _ = flights.join("key")
+    joined, _ = flights.join("key")
+
+    flights.land("key", flight, error=ValueError("failed"))
+
+    assert joined.wait(0)
+    with pytest.raises(ValueError, match="failed"):
+        joined.outcome()
+
+
+def test_wait_times_out_while_the_flight_is_in_the_air():
+    flights = SingleFlight()
+    flights.join("key")
+    joined, _ = flights.join("key")
+
+    assert not joined.wait(0.01)
+
+
+def test_landed_flight_is_not_joined_again():
+    flights = SingleFlight()
+    flight, _ = flights.join("key")
+    flights.land("key", flight, result="old")
+
+    next_flight, leader = flights.join("key")
+
+    assert leader
+    assert next_flight is not flight
+
+
+def test_landing_a_replaced_flight_keeps_the_new_one():
+    flights = SingleFlight()
+    old_flight, _ = flights.join("key")
+    flights.land("key", old_flight, result="old")
+    new_flight, _ = flights.join("key")
+
+    flights.land("key", old_flight, result="old")
+
+    assert flights.join("key") == (new_flight, False)
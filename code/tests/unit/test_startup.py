@@ -0,0 +1,79 @@
+import gc
+import logging
+from unittest import mock
+
+import pytest
+
+from api import startup
+from api.startup import StartupReport, preload, freeze, process_age, in_uwsgi_master, log_report
+
+
+def test_startup_report(monkeypatch):
+    monkeypatch.setattr(startup, "process_age", lambda: 0.1)
+    report = StartupReport()
+    report.phases = {"config": 0.002, "preload": 0.05}
+    report.preloaded = {"requests": 0.03, "jwt": 0.02}
+    report.frozen = 1000
+
+    assert report.total == pytest.approx(0.152)
+    assert str(report) == (
+        "App loaded in 152.0 ms: imports 100.0 ms, config 2.0 ms, "
+        "preload 50.0 ms (requests 30.0 ms, jwt 20.0 ms), 1000 objects frozen"
+    )
+
+
+def test_startup_report_without_the_process_age(monkeypatch):
+    monkeypatch.setattr(startup, "process_age", lambda: None)
+    report = StartupReport()
+
+    report.mark("config")
+    report.mark("config")
+
+    assert list(report.phases) == ["config"]
+    assert str(report).startswith("App loaded in ")
+    assert "imports" not in str(report)
+
+
+def test_process_age():
+    age = process_age()
+
+    assert age is None or age >= 0
+
+
+def test_process_age_without_proc(monkeypatch):
+    monkeypatch.setattr("builtins.open", mock.Mock(side_effect=OSError))
+
+    assert process_age() is None
+
+
+def test_in_uwsgi_master(monkeypatch):
+    monkeypatch.setattr(startup, "uwsgi", None)
+    assert not in_uwsgi_master()
+
+    monkeypatch.setattr(startup, "uwsgi", mock.Mock(worker_id=lambda: 0))
+    assert in_uwsgi_master()
+
+
+def test_preload_skips_modules_not_installed():
+    timings = preload(["json", "module_not_installed"])
+
+    assert list(timings) == ["json"]
+
+
+def test_freeze():
+    try:
+        assert freeze() == gc.get_freeze_count() > 0
+    finally:
+        gc.unfreeze()
+
+
+def test_startup_report_is_logged_whatever_the_app_log_level(test_app, capsys, monkeypatch):
+    monkeypatch.setattr(startup, "process_age", lambda: None)
+    assert not test_app.logger.isEnabledFor(logging.INFO)
+
+    log_report(StartupReport())
+    log_report(StartupReport())
+
+    logged = capsys.readouterr().err.splitlines()
+    assert len(logged) == 2
+    assert all(" INFO in startup: App loaded in " in line for line in logged)
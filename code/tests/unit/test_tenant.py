@@ -0,0 +1,29 @@
+import pytest
+
+from api.tenant import TenantContext
+
+PAYLOAD = {"host": "api.us2.sumologic.com", "access_id": "access_id", "access_key": "access_key"}
+
+
+def test_tenant_context_from_payload():
+    tenant = TenantContext.from_payload(PAYLOAD, 100, "https://{host}/api/v1")
+
+    assert tenant.api_url == "https://api.us2.sumologic.com/api/v1"
+    assert tenant.console_url == "https://service.us2.sumologic.com/"
+    assert tenant.entities_limit == 100
+    assert tenant.key == ("api.us2.sumologic.com", "access_id")
+
+
+def test_tenant_context_is_immutable():
+    tenant = TenantContext.from_payload(PAYLOAD, 100, "https://{host}/api/v1")
+
+    with pytest.raises(AttributeError):
+        tenant.access_key = "other"
+    with pytest.raises(AttributeError):
+        tenant.other = "value"
+
+
+def test_tenant_context_repr_hides_the_access_key():
+    tenant = TenantContext.from_payload(PAYLOAD, 100, "https://{host}/api/v1")
+
+    assert repr(tenant) == "TenantContext(host='api.us2.sumologic.com', access_id='access_id', entities_limit=100)"
@@ -0,0 +1,234 @@
+import time
+import asyncio
+import threading
+
+import pytest
+from flask import g
+
+from api import utils
+from api.errors import TRFormattedError, SearchJobDidNotFinishWarning
+from api.instrumentation import add_timing
+from api.utils import (
+    Deadline,
+    get_deadline,
+    get_entities_limit,
+    get_public_key,
+    get_jwks_cache,
+    iterate_concurrently,
+    gather_concurrently,
+    tenant_semaphore,
+    wants_stream,
+    add_error,
+)
+from tests.unit.conftest import JWKS_HOST
+
+
+def slow_square(item):
+    # later items finish first
+    time.sleep((5 - item) * 0.01)
+    add_error(SearchJobDidNotFinishWarning(item, "Sumo Logic"))
+    add_timing("search", 1)
+    return item * item
+
+
+def test_iterate_concurrently_yields_in_the_order_of_items(test_app):
+    with test_app.test_request_context():
+        results = list(iterate_concurrently(slow_square, [1, 2, 3, 4], threading.Semaphore(4)))
+
+        assert results == [1, 4, 9, 16]
+        assert [error["message"] for error in g.errors] == [
+            f"The Sumo Logic search job did not finish in the time required for {item}" for item in [1, 2, 3, 4]
+        ]
+        assert g.timings == {"search": 4}
+
+
+def test_iterate_concurrently_raises_the_error_of_an_item(test_app):
+    def fail_on_two(item):
+        if item == 2:
+            raise TRFormattedError("failed", f"failed on {item}")
+        return item
+
+    with test_app.test_request_context():
+        results = iterate_concurrently(fail_on_two, [1, 2, 3], threading.Semaphore(3))
+
+        assert next(results) == 1
+        with pytest.raises(TRFormattedError) as error:
+            next(results)
+        assert error.value.message == "failed on 2"
+
+
+def test_iterate_concurrently_holds_the_semaphore_for_every_item(test_app):
+    running, peak = [], []
+    lock = threading.Lock()
+
+    def track(item):
+        with lock:
+            running.append(item)
+            peak.append(len(running))
+        time.sleep(0.01)
+        with lock:
+            running.remove(item)
+        return item
+
+    with test_app.test_request_context():
+        assert list(iterate_concurrently(track, [1, 2, 3, 4], threading.Semaphore(2))) == [1, 2, 3, 4]
+
+    assert max(peak) == 2
+
+
+def test_iterate_concurrently_runs_inline_with_a_single_worker(test_app, monkeypatch):
+    monkeypatch.setitem(test_app.config, "OBSERVE_WORKERS_PER_REQUEST", 1)
+
+    with test_app.test_request_context():
+        threads = list(iterate_concurrently(lambda item: threading.current_thread(), [1, 2], threading.Semaphore(1)))
+
+    assert threads == [threading.current_thread()] * 2
+
+
+def test_iterate_concurrently_holds_the_semaphore_with_a_single_worker(test_app, monkeypatch):
+    monkeypatch.setitem(test_app.config, "OBSERVE_WORKERS_PER_REQUEST", 1)
+    semaphore = threading.BoundedSemaphore(1)
+
+    def held(item):
+        return not semaphore.acquire(blocking=False)
+
+    with test_app.test_request_context():
+        results = iterate_concurrently(held, [1, 2], semaphore)
+
+        assert next(results)
+        assert semaphore.acquire(blocking=False)
+        semaphore.release()
+        assert list(results) == [True]
+
+
+def test_gather_concurrently_returns_in_the_order_of_items(test_app):
+    async def square(item):
+        await asyncio.sleep((5 - item) * 0.01)
+        add_error(SearchJobDidNotFinishWarning(item, "Sumo Logic"))
+        return item * item
+
+    with test_app.test_request_context():
+        assert asyncio.run(gather_concurrently(square, [1, 2, 3])) == [1, 4, 9]
+        assert [error["message"][-1] for error in g.errors] == ["1", "2", "3"]
+
+
+def test_gather_concurrently_raises_the_first_error(test_app):
+    async def fail_on_two(item):
+        if item == 2:
+            raise TRFormattedError("failed", "failed on 2")
+        await asyncio.sleep(1)
+
+    with test_app.test_request_context():
+        with pytest.raises(TRFormattedError):
+            asyncio.run(gather_concurrently(fail_on_two, [1, 2, 3]))
+
+
+def test_deadline_counts_down_to_zero():
+    deadline = Deadline(0.05)
+
+    assert 0 < deadline.remaining() <= 0.05
+    time.sleep(0.06)
+    assert deadline.remaining() == 0
+
+
+@pytest.mark.parametrize("header, expected", [(None, 55), ("10", 10), ("100", 55), ("soon", 55)])
+def test_get_deadline_can_be_shortened_by_the_request(test_app, header, expected):
+    headers = {utils.REQUEST_TIMEOUT_HEADER: header} if header else {}
+
+    with test_app.test_request_context(headers=headers):
+        assert get_deadline().remaining() == pytest.approx(expected, abs=0.1)
+
+
+@pytest.mark.parametrize(
+    "query, accept, expected",
+    [
+        ("", "application/json", False),
+        ("?stream=true", "application/json", True),
+        ("?stream=1", None, True),
+        ("?stream=no", None, False),
+        ("", "application/x-ndjson", True),
+        ("", "application/json, application/x-ndjson;q=0.5", False),
+    ],
+)
+def test_wants_stream(test_app, query, accept, expected):
+    headers = {"Accept": accept} if accept else {}
+
+    with test_app.test_request_context(f"/observe/observables{query}", headers=headers):
+        assert wants_stream() is expected
+
+
+@pytest.mark.parametrize(
+    "payload, expected",
+    [
+        ({}, 100),
+        ({"CTR_ENTITIES_LIMIT": "10"}, 10),
+        ({"CTR_ENTITIES_LIMIT": 0}, 100),
+        ({"CTR_ENTITIES_LIMIT": "x"}, 100),
+    ],
+)
+def test_get_entities_limit(test_app, payload, expected):
+    with test_app.app_context():
+        assert get_entities_limit(payload) == expected
+
+
+def test_tenant_semaphore_is_shared_per_tenant(test_app, tenant):
+    with test_app.app_context():
+        semaphore = tenant_semaphore(tenant)
+
+        assert tenant_semaphore(tenant._replace(entities_limit=1)) is semaphore
+        assert tenant_semaphore(tenant._replace(access_id="other")) is not semaphore
+
+
+def test_public_keys_are_cached_per_jwks_host(test_app, valid_jwt, jwks_endpoint):
+    with test_app.app_context():
+        assert get_public_key(JWKS_HOST, valid_jwt()) is not None
+        assert get_public_key(JWKS_HOST, valid_jwt()) is not None
+
+    jwks_endpoint.assert_called_once_with(f"https://{JWKS_HOST}/.well-known/jwks", timeout=5)
+
+
+def test_key_sets_without_keys_are_not_cached(test_app, valid_jwt, jwks_endpoint):
+    jwks_endpoint.return_value.json.return_value = {"keys": []}
+
+    with test_app.app_context():
+        assert get_public_key("attacker.example.com", valid_jwt()) is None
+        assert get_jwks_cache().get("attacker.example.com") is None
+
+
+def test_jwks_cache_is_bounded(test_app, valid_jwt, monkeypatch):
+    monkeypatch.setitem(test_app.config, "JWKS_CACHE_SIZE", 2)
+
+    with test_app.app_context():
+        for host in ["first.example.com", "second.example.com", "third.example.com"]:
+            get_public_key(host, valid_jwt())
+
+        assert len(get_jwks_cache()) == 2
+        assert get_jwks_cache().get("first.example.com") is None
+
+
+def test_unknown_kid_refreshes_the_key_set_at_most_once_per_interval(test_app, valid_jwt, jwks_endpoint):
+    with test_app.app_context():
+        get_public_key(JWKS_HOST, valid_jwt())
+        assert get_public_key(JWKS_HOST, valid_jwt(kid="rotated")) is None
+        assert jwks_endpoint.call_count == 1
+
+        fetched_at, public_keys = get_jwks_cache().get(JWKS_HOST)
+        get_jwks_cache().set(JWKS_HOST, (fetched_at - 60, public_keys))
+        get_public_key(JWKS_HOST, valid_jwt(kid="rotated"))
+        assert jwks_endpoint.call_count == 2
+
+
+def test_expired_key_set_is_served_while_refreshed_in_the_background(test_app, valid_jwt, jwks_endpoint):
+    with test_app.app_context():
+        get_public_key(JWKS_HOST, valid_jwt())
+        fetched_at, public_keys = get_jwks_cache().get(JWKS_HOST)
+        get_jwks_cache().set(JWKS_HOST, (fetched_at - test_app.config["JWKS_CACHE_TTL"] - 1, public_keys))
+
+        assert get_public_key(JWKS_HOST, valid_jwt()) is not None
+
+        for _ in range(100):
+            if not utils._jwks_refreshing:
+                break
+            time.sleep(0.01)
+        assert jwks_endpoint.call_count == 2
+        assert get_jwks_cache().get(JWKS_HOST)[0] >= fetched_at
@@ -0,0 +1,23 @@
+from api import version
+
+
+def test_watchdog(client):
+    response = client.get("/watchdog", headers={"Health-Check": "test"})
+
+    assert response.get_json() == {"data": "test"}
+
+
+def test_watchdog_without_the_health_check(client):
+    response = client.get("/watchdog")
+
+    assert response.get_json() == {
+        "errors": [{"code": "health check failed", "message": "Invalid Health Check", "type": "fatal"}]
+    }
+
+
+def test_version(client, monkeypatch):
+    monkeypatch.setattr(version, "_version", None)
+
+    response = client.post("/version")
+
+    assert response.get_json() == {"version": "1.0.6"}